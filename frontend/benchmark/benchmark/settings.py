@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,11 +47,13 @@ INSTALLED_APPS = [
 #    'users.apps.UsersConfig',
 
 MIDDLEWARE = [
+    'workbench.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'workbench.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -138,6 +141,97 @@ STATICFILES_DIRS= ('/static/', )
 
 LOGIN_REDIRECT_URL = '/'
 
+# Directory for reusable artifacts (trained models, ...), shared between all runs
+CACHE_DIR = '/data/cache/'
+
+# Training parameters of the HMM baseline, the trained model is cached per combination
+HMM_SEED = 0
+HMM_CORRUPTION_RATE = 0.2
+
+# Evaluation endpoint of the evaluator service, point it to the stand-in of workbench.stub_servers
+# to run the upload path without it
+EVALUATOR_URL = os.environ.get('EVALUATOR_URL', 'http://evaluator:1338/api/v1/evaluate')
+
+# Base URL of a LanguageTool HTTP server (e.g. 'http://languagetool:8010/v2/'), if not set the
+# public API is used. Sentences are packed into requests of at most LANGUAGETOOL_BATCH_CHARS characters
+LANGUAGETOOL_URL = os.environ.get('LANGUAGETOOL_URL', None)
+LANGUAGETOOL_BATCH_CHARS = 20000
+
+# Endpoints of the remaining remote engines, overridable to point them at local stub servers
+MASHAPE_URL = os.environ.get('MASHAPE_URL', 'https://montanaflynn-spellcheck.p.rapidapi.com/check/')
+XSPELL_URL = os.environ.get('XSPELL_URL', 'http://xspell.ga/')
+GRAMMARBOT_URL = os.environ.get('GRAMMARBOT_URL', 'http://api.grammarbot.io/v2/')
+
+# Requests of the remote engines: maximal number in flight, requests per second per host (hosts
+# not listed use REMOTE_DEFAULT_RATE, None means unlimited) and retries of temporary failures
+REMOTE_CONCURRENCY = 8
+REMOTE_RATE_LIMITS = {
+  'languagetool.org': 0.5,
+  'montanaflynn-spellcheck.p.rapidapi.com': 5,
+  'xspell.ga': 2,
+  'api.grammarbot.io': 2
+}
+REMOTE_DEFAULT_RATE = None
+REMOTE_RETRIES = 3
+REMOTE_TIMEOUT = 60
+
+# Resident engine server (see workbench.engine_server). predict_builtin uses it for the engines with
+# local resources whenever its socket exists, ENGINE_SERVER_PRELOAD is loaded by every worker on start
+ENGINE_SERVER_SOCKET = os.environ.get('ENGINE_SERVER_SOCKET', '/tmp/engine_server.sock')
+ENGINE_SERVER_WORKERS = 2
+ENGINE_SERVER_PRELOAD = ['aspell', 'hunspell', 'pyenchant', 'norvig', 'ngram', 'hmm']
+ENGINE_SERVER_LANGUAGES = ['en_US']
+ENGINE_SERVER_BATCH_SENTENCES = 256
+
+# Token texts cached per process by workbench.vocabulary, the cache starts over when it is full
+VOCABULARY_CACHE_SIZE = 500000
+
+# Partition the predictions by benchmark and program (PostgreSQL only). The outdated rows are
+# deleted PREDICTION_DELETE_BATCH at a time, each batch in a transaction of its own
+PREDICTION_PARTITIONING = True
+PREDICTION_DELETE_BATCH = 5000
+
+# Baseline runs write their predictions and a checkpoint every CHECKPOINT_ARTICLES articles to
+# CHECKPOINT_DIR, an interrupted run continues from its last checkpoint (see workbench.checkpoint)
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, 'checkpoints')
+CHECKPOINT_ARTICLES = 50
+
+# Baseline runs stream their predictions through workbench.pipeline in batches of
+# PIPELINE_BATCH_SENTENCES sentences, at most PIPELINE_QUEUE_SIZE batches wait between two stages
+PIPELINE_BATCH_SENTENCES = 256
+PIPELINE_QUEUE_SIZE = 4
+
+# Uploaded predictions are decompressed and validated on the fly (see workbench.uploads), larger
+# decompressed documents are rejected
+UPLOAD_MAX_BYTES = 2 * 1024 ** 3
+
+# Seconds a superseded result version stays readable before it is garbage-collected by
+# manage.py collect_result_versions (run.sh runs it every RESULT_VERSION_INTERVAL seconds)
+RESULT_VERSION_GRACE = 300
+RESULT_VERSION_INTERVAL = 60
+
+# Record the SQL queries of every request (count, time, slowest statements) in response headers
+# and the log and check the query budgets of the views, see workbench.querybudget
+QUERY_PROFILING = DEBUG or (len(sys.argv) > 1 and sys.argv[1] == 'test')
+QUERY_PROFILING_SLOWEST = 5
+
+# Opt-in profiling with cProfile and tracemalloc (see workbench.profiling) of the views and jobs
+# named in PROFILING_TARGETS ('*' for all) and of the requests of staff users sending the
+# PROFILING_HEADER. The newest PROFILING_KEEP captures are kept in PROFILING_DIR
+PROFILING_TARGETS = [name for name in os.environ.get('PROFILING_TARGETS', '').split(',') if name]
+PROFILING_HEADER = 'X-Profile'
+PROFILING_DIR = os.path.join(CACHE_DIR, 'profiles')
+PROFILING_KEEP = 200
+PROFILING_TOP_FUNCTIONS = 40
+PROFILING_TOP_ALLOCATIONS = 30
+
+# Microbenchmarks (manage.py perf): corpus sizes in sentences, the stored baseline and the
+# fraction of throughput or peak memory a case may lose before it counts as a regression
+PERF_SIZES = [100, 1000, 10000]
+PERF_OUTPUT = os.path.join(CACHE_DIR, 'perf.json')
+PERF_BASELINE = os.path.join(BASE_DIR, 'perf_baseline.json')
+PERF_TOLERANCE = 0.25
+
 BOOTSTRAP4 = {
     "error_css_class": "bootstrap4-error",
     "required_css_class": "bootstrap4-required",
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
-from .models import Program, Benchmark, Result, ErrorCategory
+from .models import Program, Benchmark, Result, ErrorCategory, JobTiming, EngineSpeed
 
 admin.site.register(Program)
 admin.site.register(Benchmark)
 admin.site.register(Result)
 admin.site.register(ErrorCategory)
+admin.site.register(JobTiming)
+admin.site.register(EngineSpeed)
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate, post_migrate, post_delete
 
 
 class WorkbenchConfig(AppConfig):
     name = 'workbench'
+
+    def ready(self):
+        from .models import Benchmark, Program
+        from .legacy import save_legacy_tokens, convert_legacy_tokens
+        from .partitions import setup_prediction_partitioning, drop_benchmark_partitions, drop_program_partitions
+
+        pre_migrate.connect(save_legacy_tokens, sender=self)
+        # Packs the rows before they are moved into their partitions
+        post_migrate.connect(convert_legacy_tokens, sender=self)
+        post_migrate.connect(setup_prediction_partitioning, sender=self)
+        post_delete.connect(drop_benchmark_partitions, sender=Benchmark)
+        post_delete.connect(drop_program_partitions, sender=Program)
@@ -1,58 +1,38 @@
 
 
+import os
+import bisect
 import random
 import string
 import time
 from celery import task
-from .utils import call_regex
+from .utils import call_regex, TokenOffsetIndex
+from .corpus import build_article_information, sentence_records
+from .speed import measured, observe
 import ujson as json
 import regex as re
 
-def handle_uploaded_file(f):
-  filename = ''.join(random.choice(string.ascii_lowercase) for i in range(32))
-  filepath = '/tmp/' + filename + '.tar.gz'
-  with open(filepath, 'wb+') as ftemp:
-    for chunk in f.chunks():
-      ftemp.write(chunk)
+# Separates the sentences packed into one LanguageTool request, every sentence becomes a paragraph
+LT_SENTENCE_SEPARATOR = "\n\n"
 
-  return filepath
+# Sentences whose words the HMM engine decodes in one batch
+HMM_BATCH_SENTENCES = 1024
 
-
-import copy
-
-class SourceInternalArticle(object):
-
-  def __init__(self):
-    self.sentences = None
-
-def build_article_information(input):
-  json_ = json.loads(input)
-  num_articles = 0
-  for t in json_["tokens"]:
-    nums_ = re.findall('\d+', t['id'], re.UNICODE)
-    #articles.add(int(nums_[0]))
-    if num_articles < int(nums_[0]):
-      num_articles = int(nums_[0])
-  num_articles = num_articles + 1
-  #print(f"detected {num_articles} in source file, collect number of sentences")
-  num_sentences = [set() for _ in range(num_articles)]
-  for t in json_["tokens"]:
-    nums_ = re.findall('\d+', t['id'], re.UNICODE)
-    num_sentences[int(nums_[0])].add(int(nums_[1]))
-
-  results = [SourceInternalArticle() for _ in range(num_articles)]
-  for aidx in range(num_articles):
-    #print(f"detected {len(num_sentences[aidx])} sentences for article {aidx}")
-    #for sidx in range(len(num_sentences[aidx])):
-    results[aidx].sentences = ["" for _ in range(len(num_sentences[aidx]))]
-
-  for t in json_["tokens"]:
-    nums_ = re.findall('\d+', t['id'], re.UNICODE)
-    results[int(nums_[0])].sentences[int(nums_[1])] += t['token']
-    if ((t['space'] == True) or (t['space'] == 'true')):
-      results[int(nums_[0])].sentences[int(nums_[1])] += ' '
-
-  return copy.deepcopy(results)
+def remote_client():
+  """
+  Returns the RemoteClient used by the remote engines, configured by the REMOTE_* settings.
+  """
+  from django.conf import settings
+  from .remote import RemoteClient
+
+  return RemoteClient(
+    cache_dir=os.path.join(settings.CACHE_DIR, 'responses'),
+    rate_limits=settings.REMOTE_RATE_LIMITS,
+    default_rate=settings.REMOTE_DEFAULT_RATE,
+    concurrency=settings.REMOTE_CONCURRENCY,
+    retries=settings.REMOTE_RETRIES,
+    timeout=settings.REMOTE_TIMEOUT
+  )
 
 def generate_token_information(aidx, sidx, tidx, token, suggestions, space, add_comma, proposed_type=None):
   if token == "\\":
@@ -90,70 +70,75 @@ def generate_token_information(aidx, sidx, tidx, token, suggestions, space, add_
 
 
 
-def evaluate_aspell_builtin(input, lang_code):
-  """
-  """
-  import enchant
+def load_aspell(lang_code):
   import aspell
 
-  input = build_article_information(input)
+  return aspell.Speller('lang', lang_code.split("_")[0])
+
+def evaluate_aspell_builtin(input, lang_code, chkr=None):
+  """
+  ``chkr`` is the speller returned by load_aspell, it is loaded if not given.
+  """
+  if chkr is None:
+    chkr = load_aspell(lang_code)
+  check = measured('check', chkr.check)
+  suggest = measured('suggest', chkr.suggest)
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-      chkr = aspell.Speller('lang', lang_code.split("_")[0])
-      tokens, spaces = call_regex(sentence)
+  for record in sentence_records(input):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
+    tokens, spaces = record.tokens, record.spaces
 
-      shift = 0
+    shift = 0
 
-      for tidx, t in enumerate(tokens):
-        if t == "\"":
-          t = t.replace("\"", "\\\"")
-        if t == "\\":
-          t = t.replace("\\", "\\\\")
+    for tidx, t in enumerate(tokens):
+      if t == "\"":
+        t = t.replace("\"", "\\\"")
+      if t == "\\":
+        t = t.replace("\\", "\\\\")
+      token = t
+      suggestions = []
+      try:
+        if check(t) == False:
+          sugg = suggest(t)
+          if len(sugg) > 0:
+            tempSuggestion = sugg[0].strip()
+            if (" " in tempSuggestion):
+              multi_tokens = tempSuggestion.split(" ")
+              token = None
+            else:
+              token = tempSuggestion
+              suggestions = sugg[1:]
+      except:
         token = t
-        suggestions = []
-        try:
-          if chkr.check(t) == False:
-            sugg = chkr.suggest(t)
-            if len(sugg) > 0:
-              tempSuggestion = sugg[0].strip()
-              if (" " in tempSuggestion):
-                multi_tokens = tempSuggestion.split(" ")
-                token = None
-              else:
-                token = tempSuggestion
-                suggestions = sugg[1:]
-        except:
-          token = t
 
-        if token == None: # is none, so tokens is filled with multiple elements -> splitted word
-          num_tokens = len(multi_tokens)
-          for idx, tt in enumerate(multi_tokens):
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+idx,
-              tt,
-              suggestions,
-              spaces[tidx],
-              tidx < (len(tokens)+shift - 1)
-            )
-          shift += num_tokens - 1
-        else:
+      if token == None: # is none, so tokens is filled with multiple elements -> splitted word
+        num_tokens = len(multi_tokens)
+        for idx, tt in enumerate(multi_tokens):
           result_content += generate_token_information(
             aidx,
             sidx,
-            tidx+shift,
-            token,
+            tidx+idx,
+            tt,
             suggestions,
             spaces[tidx],
             tidx < (len(tokens)+shift - 1)
           )
-      if ((aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1)):
-        if result_content[-1] != "," and result_content[-2] != ",":
-          result_content += ",\n"
+        shift += num_tokens - 1
+      else:
+        result_content += generate_token_information(
+          aidx,
+          sidx,
+          tidx+shift,
+          token,
+          suggestions,
+          spaces[tidx],
+          tidx < (len(tokens)+shift - 1)
+        )
+    if not record.last:
+      if result_content[-1] != "," and result_content[-2] != ",":
+        result_content += ",\n"
 
   result_content += "  ]\n}"
 
@@ -162,343 +147,362 @@ def evaluate_aspell_builtin(input, lang_code):
 
   return result_content
 
-def evaluate_hunspell_builtin(input, lang_code):
+def load_hunspell(lang_code):
   from hunspell import HunSpell
 
   #hobj = HunSpell(lang_code)
-  hobj = HunSpell("/usr/share/hunspell/"+lang_code+".dic", "/usr/share/hunspell/"+lang_code+".aff")
+  return HunSpell("/usr/share/hunspell/"+lang_code+".dic", "/usr/share/hunspell/"+lang_code+".aff")
 
-  input = build_article_information(input)
+def evaluate_hunspell_builtin(input, lang_code, hobj=None):
+  if hobj is None:
+    hobj = load_hunspell(lang_code)
+  spell = measured('check', hobj.spell)
+  suggest = measured('suggest', hobj.suggest)
 
   result_content = "{ \"predictions\": [\n"
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
+  for record in sentence_records(input):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
 
-      tokens, spaces = call_regex(sentence)
+    tokens, spaces = record.tokens, record.spaces
 
-      realNumTokens = len(tokens)
-      shift = 0
+    realNumTokens = len(tokens)
+    shift = 0
 
-      for tidx, t in enumerate(tokens):
+    for tidx, t in enumerate(tokens):
 
-        token = t
-        splitTokens = None
-        suggestions = []
-        try:
-          if (hobj.spell(t) == False):
-            if len(hobj.suggest(t)) > 0:
-              token = hobj.suggest(t)[0] # Get the first element form the suggestions
-              token = token.strip()
-              if " " in token:
-                print("Split token: ", token)
-                splitTokens = token.split(" ")
-                realNumTokens += len(splitTokens) - 1
-                token = None
-            if (len(hobj.suggest(t)) > 1):
-              suggestions = hobj.suggest(t)[1:]
-          else:
-            token = t
-        except:
-          token = t
-        if splitTokens is not None:
-          for tt in splitTokens:
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+shift,
-              tt,
-              suggestions,
-              spaces[tidx],
-              tidx+shift < (realNumTokens - 1)
-            )
-            shift += 1
-          shift -= 1
+      token = t
+      splitTokens = None
+      suggestions = []
+      try:
+        if (spell(t) == False):
+          # Suggesting is the expensive part, ask once per token
+          sugg = suggest(t)
+          if len(sugg) > 0:
+            token = sugg[0] # Get the first element form the suggestions
+            token = token.strip()
+            if " " in token:
+              print("Split token: ", token)
+              splitTokens = token.split(" ")
+              realNumTokens += len(splitTokens) - 1
+              token = None
+          if (len(sugg) > 1):
+            suggestions = sugg[1:]
         else:
+          token = t
+      except:
+        token = t
+      if splitTokens is not None:
+        for tt in splitTokens:
           result_content += generate_token_information(
             aidx,
             sidx,
             tidx+shift,
-            token,
+            tt,
             suggestions,
             spaces[tidx],
             tidx+shift < (realNumTokens - 1)
           )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+          shift += 1
+        shift -= 1
+      else:
+        result_content += generate_token_information(
+          aidx,
+          sidx,
+          tidx+shift,
+          token,
+          suggestions,
+          spaces[tidx],
+          tidx+shift < (realNumTokens - 1)
+        )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
 def evaluate_mashape_builtin(input, lang_code):
-  import http.client, urllib.request, urllib.parse, json
-  import requests
-  MS_KEY = "13daa1be07msh5f08fe12c3c9b41p156adcjsn4f9c058f2b15"
+  from django.conf import settings
+  from .remote import RemoteRequest, fetch_each
 
-  MS_HOST = 'montanaflynn-spellcheck.p.rapidapi.com'
-  MS_PATH = '/check/?'
-  MS_PARAMS = 'text'
+  MS_KEY = "13daa1be07msh5f08fe12c3c9b41p156adcjsn4f9c058f2b15"
 
   MS_HEADERS = {
     'X-RapidAPI-Key': MS_KEY
   }
 
-  input = build_article_information(input)
+  def make_request(record):
+    return RemoteRequest('GET', settings.MASHAPE_URL, params={'text': '"{}"'.format(record.sentence)}, headers=MS_HEADERS)
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-      #print("INPUT: %s" % (sentence))
-      response = requests.get(
-        'https://montanaflynn-spellcheck.p.rapidapi.com/check/?text="{}"'.format(sentence),
-        headers={'X-RapidAPI-Key': MS_KEY}
-      )
-
-      jsonified = response.json()
-      requested = jsonified["suggestion"]
-
-      #print("SUGGESTION: %s" % (requested))
-
-      suggestions = {}
-
-      for key, value in jsonified["corrections"].items():
-        if len(value) > 1:
-          suggestions[value[0]] = value[1:]
-      tokens, spaces = call_regex(requested)
-      shift = 0
-      realNumTokens = len(tokens)
-      for tidx, token in enumerate(tokens):
-        token = token.strip()
-        if " " in token  and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
-          realNumTokens += len(token.split(" ")) - 1
-          for tt in token.split(" "):
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+shift,
-              tt,
-              suggestions[tidx] if tidx in suggestions else [],
-              spaces[tidx],
-              tidx+shift < (realNumTokens - 1)
-            )
-            shift += 1
-          shift -= 1
-        else:
+  for record, response in fetch_each(remote_client(), sentence_records(input), make_request):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
+    #print("INPUT: %s" % (sentence))
+    jsonified = json.loads(response)
+    requested = jsonified["suggestion"]
+
+    #print("SUGGESTION: %s" % (requested))
+
+    suggestions = {}
+
+    for key, value in jsonified["corrections"].items():
+      if len(value) > 1:
+        suggestions[value[0]] = value[1:]
+    tokens, spaces = call_regex(requested)
+    shift = 0
+    realNumTokens = len(tokens)
+    for tidx, token in enumerate(tokens):
+      token = token.strip()
+      if " " in token  and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
+        realNumTokens += len(token.split(" ")) - 1
+        for tt in token.split(" "):
           result_content += generate_token_information(
             aidx,
             sidx,
             tidx+shift,
-            token,
+            tt,
             suggestions[tidx] if tidx in suggestions else [],
             spaces[tidx],
             tidx+shift < (realNumTokens - 1)
           )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+          shift += 1
+        shift -= 1
+      else:
+        result_content += generate_token_information(
+          aidx,
+          sidx,
+          tidx+shift,
+          token,
+          suggestions[tidx] if tidx in suggestions else [],
+          spaces[tidx],
+          tidx+shift < (realNumTokens - 1)
+        )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
 def evaluate_xspell_builtin(input, lang_code):
-  import html
-  import requests
+  from django.conf import settings
+  from .remote import RemoteRequest, fetch_each
 
-  input = build_article_information(input)
+  XSPELL_TOKEN = "b8338740118776a5db31f7c2d5c10734"
 
+  def make_request(record):
+    return RemoteRequest('GET', settings.XSPELL_URL, params={'api': 'spell', 'token': XSPELL_TOKEN, 'check': record.sentence})
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-      #php_program = '<?php $xt = "b8338740118776a5db31f7c2d5c10734";$xs = "%s";$xu = "http://xspell.ga";$xp = "api=spell&token=$xt&check=$xs";$x = curl_init();curl_setopt($x,CURLOPT_POST,1);curl_setopt($x,CURLOPT_POSTFIELDS,$xp);curl_setopt($x,CURLOPT_URL,$xu);curl_setopt($x,CURLOPT_RETURNTRANSFER,1);$output = curl_exec($x);print($output);?>' % (sentence.replace('"', '\"'));
-
-      #with open('/tmp/main.php', 'w') as fout:
-      #  fout.write(php_program)
-      #proc = subprocess.Popen("php -f /tmp/main.php", shell=True, stdout=subprocess.PIPE)
+  for record, response in fetch_each(remote_client(), sentence_records(input), make_request):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
+
+    tokens, spaces = call_regex(response)
+    for tidx, token in enumerate(tokens):
+      token = token.strip()
+      result_content += generate_token_information(
+        aidx,
+        sidx,
+        tidx,
+        token,
+        [],
+        spaces[tidx],
+        tidx < (len(tokens) - 1)
+      )
+    if not record.last:
+      result_content += ",\n"
 
-      #response = proc.stdout.read()
-      #response = html.unescape(response.decode('utf-8'))
-      XSPELL_TOKEN = "b8338740118776a5db31f7c2d5c10734"
+  result_content += "  ]\n}"
 
-      response = requests.get("http://xspell.ga/?api=spell&token=%s&check=%s" % (XSPELL_TOKEN, sentence)).text
+  return result_content
 
-      tokens, spaces = call_regex(response)
-      for tidx, token in enumerate(tokens):
-        token = token.strip()
+def languagetool_sentence_content(record, matches):
+  """
+  Applies the LanguageTool ``matches`` of one sentence, the offsets of the matches have to be
+  relative to the sentence. Returns the prediction entries of the sentence.
+  """
+  aidx, sidx = record.aidx, record.sidx
+  # We will need this to restructure the sentence
+  index = TokenOffsetIndex(record.spans)
+  tokens = list(record.tokens)
+  spaces = list(record.spaces)
+
+  suggestions = {}
+
+  shift = 0
+
+  result_content = ""
+
+  for idx, match in enumerate(matches):
+    offset = match["offset"]
+    length = match["length"]
+    repls = match["replacements"]
+    #tidx = index.token_at(offset)
+    '''
+    tidxs = index.token_range(offset, length)
+
+    if (len(repls) > 0):
+      temp_ = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
+      if (" " in temp_ and (len(tidxs) > 1) and (tidxs[0] != tidxs[1])):
+        tokens[tidxs[0]] = temp_.split(" ")[0]
+        tokens[tidxs[1]] = temp_.split(" ")[1]
+      else:
+        tokens[tidxs[0]] = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
+        if ((len(tidxs) > 1) and (tidxs[0] != tidxs[1])):
+          del tokens[tidxs[1]: tidxs[-1]]
+      if (len(repls) > 1):
+        suggestions[tidxs[0]] = []
+        for v in repls[1:]:
+          suggestions[tidxs[0]].append(v["value"].replace("\\", "\\\\").replace("\"", "\\\\\""))
+    else:
+      pass
+    '''
+    tidxs = index.token_range(offset, length)
+
+    if (len(repls) > 0) and (len(tidxs) > 0):
+      repl_tokens = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"").split(" ")
+      # Just one token or multiple ones?
+      if len(repl_tokens) == 1:
+        tokens[tidxs[0]+shift] = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
+        #rules[tidxs[0]] = rule
+      else:
+        # Otherwise replace multiple tokens
+        if len(tidxs) == len(repl_tokens):
+          for iidx, tidx in enumerate(tidxs):
+            tokens[tidx+shift] = repl_tokens[iidx]
+        else:
+          # Not that trivial, delete everything and fill in reverse ordering
+          if len(tidxs) == 1:
+            #
+            #print("-> delete token at {} [Shift={}]".format(tidxs[0]+shift, shift))
+            del tokens[tidxs[0]+shift]
+            del spaces[tidxs[0]+shift]
+          else:
+            del tokens[tidxs[0]+shift: tidxs[-1]+shift+1]
+            del spaces[tidxs[0]+shift: tidxs[-1]+shift+1]
+          repl_tokens.reverse()
+          for e in repl_tokens:
+            #print("-> adding token {} at position {} [Shift={}]".format(e, tidxs[0]+shift, shift))
+            tokens.insert(tidxs[0]+shift, e)
+            spaces.insert(tidxs[0]+shift, True)
+          shift += len(repl_tokens) - len(tidxs)
+      if (len(repls) > 1):
+        suggestions[tidxs[0]] = []
+        for v in repls[1:]:
+          suggestions[tidxs[0]].append(v["value"].replace("\\", "\\\\").replace("\"", "\\\\\""))#.replace("\\", "\\\\").replace("\"", "\\\\\""))
+    else:
+      pass
+
+  #tokens, spaces = call_regex(response)
+  realNumTokens = len(tokens)
+  shift = 0
+  for tidx, token in enumerate(tokens):
+    token = token.strip()
+    if " " in token  and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
+      realNumTokens += len(token.split(" ")) - 1
+      for tt in token.split(" "):
         result_content += generate_token_information(
           aidx,
           sidx,
-          tidx,
-          token,
-          [],
+          tidx+shift,
+          tt,
+          suggestions[tidx] if tidx in suggestions else [],
           spaces[tidx],
-          tidx < (len(tokens) - 1)
+          tidx+shift < (realNumTokens - 1)
         )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
-
-  result_content += "  ]\n}"
+        shift += 1
+      shift -= 1
+    else:
+      result_content += generate_token_information(
+        aidx,
+        sidx,
+        tidx+shift,
+        token,
+        suggestions[tidx] if tidx in suggestions else [],
+        spaces[tidx],
+        tidx+shift < (realNumTokens - 1)
+      )
 
   return result_content
 
-def evaluate_languagetool_builtin(input, lang_code):
-  import time
-  import pylanguagetool
-  import requests
-
-  LT_API_URL = "https://languagetool.org/api/v2/"
-
-  def wordpos2token(word_pos, tkns, spcs):
-    char_counter = 0
-    for tidx, t in enumerate(tkns):
-      if word_pos == char_counter:
-        return tidx
-      char_counter += len(t)
-      if spcs[tidx] == True:
-        char_counter += 1
-      if tidx == len(tkns):
-        return tidx
-    return (len(tkns)-1)
-
-  def wordpos2tokens(word_pos, length, tkns, spcs):
-    """
-    Returns a tuple of start token and end token
-    """
-    results = []
-    char_counter = 0
-    for tidx, t in enumerate(tkns):
-      if (word_pos+length) <= char_counter:
-        #results.append(tidx-1)
-        return results
-      if char_counter >= word_pos:
-        results.append(tidx)
-      char_counter += len(t)
-      if spcs[tidx] == True:
-        char_counter += 1
-      if tidx == len(tkns):
-        return [tidx]
-    return [len(tkns)-1]
-
-  input = build_article_information(input)
-
-  result_content = "{ \"predictions\": [\n"
-
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-      # We will need this to restructure the sentence
-      dummy_tokens, dummy_spaces = call_regex(sentence)
-      tokens, spaces = call_regex(sentence)
+def languagetool_batches(records, max_chars):
+  """
+  Groups the sentence records into batches of at most ``max_chars`` characters, a sentence
+  longer than that forms a batch on its own.
+  """
+  batch = []
+  num_chars = 0
+  for record in records:
+    if len(batch) > 0 and num_chars + len(record.sentence) > max_chars:
+      yield batch
+      batch = []
+      num_chars = 0
+    batch.append(record)
+    num_chars += len(record.sentence) + len(LT_SENTENCE_SEPARATOR)
+  if len(batch) > 0:
+    yield batch
+
+def languagetool_request(url, batch, lang_code):
+  """
+  Returns the request checking all sentences of ``batch`` at once, together with the offset
+  table: the position of every sentence within the request text.
+  """
+  from .remote import RemoteRequest
 
-      # It seems that we get blocked by the languagetool servers ...
-      time.sleep(2)
+  starts = []
+  text = ""
+  for record in batch:
+    if len(starts) > 0:
+      text += LT_SENTENCE_SEPARATOR
+    starts.append(len(text))
+    text += record.sentence
 
-      suggestions = {}
+  return RemoteRequest('POST', url + "check", data={"text": text, "language": lang_code.split('_')[0]}), starts
 
-      shift = 0
+def languagetool_split_matches(batch, starts, response):
+  """
+  Distributes the matches of a batch ``response`` over its sentences. Returns the matches of
+  every sentence, with offsets relative to the sentence.
+  """
+  matches = [[] for _ in batch]
+  for match in json.loads(response)['matches']:
+    bidx = bisect.bisect_right(starts, match["offset"]) - 1
+    offset = match["offset"] - starts[bidx]
+    # Ignore matches crossing the border between two sentences
+    if offset + match["length"] > len(batch[bidx].sentence):
+      continue
+    local_match = dict(match)
+    local_match["offset"] = offset
+    matches[bidx].append(local_match)
+  return matches
 
-      params = {
-        "text": sentence,
-        "language": lang_code.split('_')[0]
-      }
+def evaluate_languagetool_builtin(input, lang_code):
+  """
+  Uses the public LanguageTool API, one sentence per request, or, if LANGUAGETOOL_URL is
+  configured, the LanguageTool server running there with many sentences per request.
+  """
+  from django.conf import settings
+  from .remote import fetch_each
 
-      response = requests.post(
-        LT_API_URL + "check",
-        data=params
-      )
-      response = response.json()
+  LT_API_URL = "https://languagetool.org/api/v2/"
 
-      for idx, match in enumerate(response['matches']):
-        offset = match["offset"]
-        length = match["length"]
-        repls = match["replacements"]
-        #tidx = wordpos2token(offset, dummy_tokens, dummy_spaces)
-        '''
-        tidxs = wordpos2tokens(offset, length, dummy_tokens, dummy_spaces)
-
-        if (len(repls) > 0):
-          temp_ = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
-          if (" " in temp_ and (len(tidxs) > 1) and (tidxs[0] != tidxs[1])):
-            tokens[tidxs[0]] = temp_.split(" ")[0]
-            tokens[tidxs[1]] = temp_.split(" ")[1]
-          else:
-            tokens[tidxs[0]] = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
-            if ((len(tidxs) > 1) and (tidxs[0] != tidxs[1])):
-              del tokens[tidxs[1]: tidxs[-1]]
-          if (len(repls) > 1):
-            suggestions[tidxs[0]] = []
-            for v in repls[1:]:
-              suggestions[tidxs[0]].append(v["value"].replace("\\", "\\\\").replace("\"", "\\\\\""))
-        else:
-          pass
-        '''
-        tidxs = wordpos2tokens(offset, length, dummy_tokens, dummy_spaces)
+  if settings.LANGUAGETOOL_URL:
+    url = settings.LANGUAGETOOL_URL
+    max_chars = settings.LANGUAGETOOL_BATCH_CHARS
+  else:
+    # The public API blocks us quickly, the rate limit of its host keeps us below that
+    url = LT_API_URL
+    max_chars = 0
 
-        if (len(repls) > 0):
-          repl_tokens = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"").split(" ")
-          # Just one token or multiple ones?
-          if len(repl_tokens) == 1:
-            tokens[tidxs[0]+shift] = repls[0]["value"].replace("\\", "\\\\").replace("\"", "\\\\\"")
-            #rules[tidxs[0]] = rule
-          else:
-            # Otherwise replace multiple tokens
-            if len(tidxs) == len(repl_tokens):
-              for iidx, tidx in enumerate(tidxs):
-                tokens[tidx+shift] = repl_tokens[iidx]
-            else:
-              # Not that trivial, delete everything and fill in reverse ordering
-              if len(tidxs) == 1:
-                #
-                #print("-> delete token at {} [Shift={}]".format(tidxs[0]+shift, shift))
-                del tokens[tidxs[0]+shift]
-                del spaces[tidxs[0]+shift]
-              else:
-                del tokens[tidxs[0]+shift: tidxs[-1]+shift+1]
-                del spaces[tidxs[0]+shift: tidxs[-1]+shift+1]
-              repl_tokens.reverse()
-              for e in repl_tokens:
-                #print("-> adding token {} at position {} [Shift={}]".format(e, tidxs[0]+shift, shift))
-                tokens.insert(tidxs[0]+shift, e)
-                spaces.insert(tidxs[0]+shift, True)
-              shift += len(repl_tokens) - len(tidxs)
-          if (len(repls) > 1):
-            suggestions[tidxs[0]] = []
-            for v in repls[1:]:
-              suggestions[tidxs[0]].append(v["value"].replace("\\", "\\\\").replace("\"", "\\\\\""))#.replace("\\", "\\\\").replace("\"", "\\\\\""))
-        else:
-          pass
+  result_content = "{ \"predictions\": [\n"
 
-      #tokens, spaces = call_regex(response)
-      realNumTokens = len(tokens)
-      shift = 0
-      for tidx, token in enumerate(tokens):
-        token = token.strip()
-        if " " in token  and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
-          realNumTokens += len(token.split(" ")) - 1
-          for tt in token.split(" "):
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+shift,
-              tt,
-              suggestions[tidx] if tidx in suggestions else [],
-              spaces[tidx],
-              tidx+shift < (realNumTokens - 1)
-            )
-            shift += 1
-          shift -= 1
-        else:
-          result_content += generate_token_information(
-            aidx,
-            sidx,
-            tidx+shift,
-            token,
-            suggestions[tidx] if tidx in suggestions else [],
-            spaces[tidx],
-            tidx+shift < (realNumTokens - 1)
-          )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
+  batches = ((batch,) + languagetool_request(url, batch, lang_code) for batch in languagetool_batches(sentence_records(input), max_chars))
+  for (batch, request, starts), response in fetch_each(remote_client(), batches, lambda item: item[1], window=32):
+    for record, sentence_matches in zip(batch, languagetool_split_matches(batch, starts, response)):
+      result_content += languagetool_sentence_content(record, sentence_matches)
+      if not record.last:
         result_content += ",\n"
 
   result_content += "  ]\n}"
@@ -507,134 +511,103 @@ def evaluate_languagetool_builtin(input, lang_code):
 
   return result_content
 
-def evaluate_pyenchant_builtin(input, lang_code):
-  import enchant
+def load_pyenchant(lang_code):
   from enchant.checker import SpellChecker
 
-  input = build_article_information(input)
+  return SpellChecker(lang_code)
+
+def evaluate_pyenchant_builtin(input, lang_code, chkr=None):
+  if chkr is None:
+    chkr = load_pyenchant(lang_code)
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-      chkr = SpellChecker(lang_code)
-
-      chkr.set_text(sentence)
-      suggestions = {}
-
-      # We will need this to restructure the sentence
-      dummy_tokens, dummy_spaces = call_regex(sentence)
-      tokens, spaces = call_regex(sentence)
-
-      def wordpos2token(word_pos, tkns, spcs):
-        char_counter = 0
-        for tidx, t in enumerate(tkns):
-          if word_pos == char_counter:
-            return tidx
-          char_counter += len(t)
-          if spcs[tidx] == True:
-            char_counter += 1
-          if tidx == len(tkns):
-            return tidx
-        return (len(tkns)-1)
-
-      for err in chkr:
+  for record in sentence_records(input):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
+
+    check_start = time.perf_counter()
+    suggest_seconds = 0.0
+    chkr.set_text(sentence)
+    suggestions = {}
+
+    # We will need this to restructure the sentence
+    index = TokenOffsetIndex(record.spans)
+    tokens = list(record.tokens)
+    spaces = list(record.spaces)
+
+    for err in chkr:
+      word_pos = err.wordpos
+      tidx = index.token_at(word_pos)
+      start = time.perf_counter()
+      suggests = err.suggest()
+      elapsed = time.perf_counter() - start
+      observe('suggest', elapsed)
+      suggest_seconds += elapsed
+      if len(suggests) == 1:
+        tokens[tidx] = suggests[0].replace("\\", "\\\\").replace("\"", "\\\\\"")
+      elif len(suggests) > 1:
+        tokens[tidx] = suggests[0].replace("\\", "\\\\").replace("\"", "\\\\\"")
+        suggestions[tidx] = [sugg.replace("\\", "\\\\").replace("\"", "\\\\\"") for sugg in suggests[1:]]
+      elif len(suggests) == 0:
+        tokens[tidx] = err.word.replace("\\", "\\\\").replace("\"", "\\\\\"")
         word_pos = err.wordpos
-        tidx = wordpos2token(word_pos, dummy_tokens, dummy_spaces)
-        suggests = err.suggest()
-        if len(suggests) == 1:
-          tokens[tidx] = suggests[0].replace("\\", "\\\\").replace("\"", "\\\\\"")
-        elif len(suggests) > 1:
-          tokens[tidx] = suggests[0].replace("\\", "\\\\").replace("\"", "\\\\\"")
-          suggestions[tidx] = [sugg.replace("\\", "\\\\").replace("\"", "\\\\\"") for sugg in suggests[1:]]
-        elif len(suggests) == 0:
-          tokens[tidx] = err.word.replace("\\", "\\\\").replace("\"", "\\\\\"")
-          word_pos = err.wordpos
-        if tokens[tidx] == "\\":
-          tokens[tidx] = "\\\\"
-
-
-      #tokens, spaces = call_regex(response)
-      realNumTokens = len(tokens)
-      shift = 0
-      for tidx, token in enumerate(tokens):
-        token = token.strip()
-
-        if " " in token and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
-          realNumTokens += len(token.split(" ")) - 1
-          for tt in token.split(" "):
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+shift,
-              tt,
-              suggestions[tidx] if tidx in suggestions else [],
-              dummy_spaces[tidx],
-              tidx+shift < (realNumTokens - 1)
-            )
-            shift += 1
-          shift -= 1
-        else:
+      if tokens[tidx] == "\\":
+        tokens[tidx] = "\\\\"
+    # The checker goes through the whole sentence at once, every token gets the mean latency
+    observe('check', (time.perf_counter() - check_start - suggest_seconds) / max(1, len(tokens)), len(tokens))
+
+
+    #tokens, spaces = call_regex(response)
+    realNumTokens = len(tokens)
+    shift = 0
+    for tidx, token in enumerate(tokens):
+      token = token.strip()
+
+      if " " in token and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
+        realNumTokens += len(token.split(" ")) - 1
+        for tt in token.split(" "):
           result_content += generate_token_information(
             aidx,
             sidx,
             tidx+shift,
-            token,
+            tt,
             suggestions[tidx] if tidx in suggestions else [],
-            dummy_spaces[tidx],
+            spaces[tidx],
             tidx+shift < (realNumTokens - 1)
           )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+          shift += 1
+        shift -= 1
+      else:
+        result_content += generate_token_information(
+          aidx,
+          sidx,
+          tidx+shift,
+          token,
+          suggestions[tidx] if tidx in suggestions else [],
+          spaces[tidx],
+          tidx+shift < (realNumTokens - 1)
+        )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
 def evaluate_grammarbot_builtin(input, lang_code):
-  #import requests
-  from grammarbot import GrammarBotClient
-
-  client = GrammarBotClient()
+  from django.conf import settings
+  from .remote import RemoteRequest, fetch_each
 
   # or, signup for an API Key to get higher usage limits here: https://www.grammarbot.io/
-  client = GrammarBotClient(api_key='AF5B9M2X') # GrammarBotClient(api_key=my_api_key_here)
-
-
-  def wordpos2token(word_pos, length, tkns, spcs):
-    char_counter = 0
-    for tidx, t in enumerate(tkns):
-      if word_pos == char_counter:
-        return tidx
-      char_counter += len(t)
-      if spcs[tidx] == True:
-        char_counter += 1
-      if tidx == len(tkns):
-        return tidx
-    return (len(tkns)-1)
-
-  def wordpos2tokens(word_pos, length, tkns, spcs):
-    """
-    Returns a tuple of start token and end token
-    """
-    results = []
-    char_counter = 0
-    for tidx, t in enumerate(tkns):
-      if (word_pos+length) <= char_counter:
-        #results.append(tidx-1)
-        return results
-      if char_counter >= word_pos:
-        results.append(tidx)
-      char_counter += len(t)
-      if spcs[tidx] == True:
-        char_counter += 1
-      if tidx == len(tkns):
-        return [tidx]
-    return [len(tkns)-1]
-
   GB_KEY = "AF5B9M2X"
 
-  input = build_article_information(input)
+  def make_request(record):
+    params = {
+      "language": lang_code.replace('_', '-'),
+      "api_key": GB_KEY,
+      "text": record.sentence
+    }
+    return RemoteRequest('GET', settings.GRAMMARBOT_URL + "check", params=params)
 
   def translate_grammarbot_rules(rule):
     if rule == "CONFUSION_RULE":
@@ -644,132 +617,121 @@ def evaluate_grammarbot_builtin(input, lang_code):
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
+  # A failed request leaves its sentence unchanged
+  for record, response in fetch_each(remote_client(), sentence_records(input), make_request, raise_errors=False):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
 
-    for sidx, sentence in enumerate(article.sentences):
+    index = TokenOffsetIndex(record.spans)
+    tokens = list(record.tokens)
+    spaces = list(record.spaces)
+    suggestions = {}
+    rules = {}
 
-      dummy_tokens, dummy_spaces = call_regex(sentence)
-      tokens, spaces = call_regex(sentence)
-      suggestions = {}
-      rules = {}
+    shift = 0
 
-      shift = 0
-
-      #params = {
-      #  "language": "en-US",
-      #  "api_key": GB_KEY,
-      #  "text": sentence
-      #}
-      #header = {
-      #  "Content-Type": "application/json"
-      #}
-
-      #response = requests.get(
-      #  'http://api.grammarbot.io/v2/check',
-      #  params=params,
-      #  headers=header
-      #)
-      #response = response.json()
-      try:
-        result = client.check(sentence, lang_code.replace('_', '-'))
+    try:
+      matches = json.loads(response)["matches"] if response is not None else []
 
-        shift = 0
+      shift = 0
 
-        for idx, match in enumerate(result.matches):
-          offset = match.replacement_offset
-          length = match.replacement_length
-          repls = match.replacements
-          rule = match.rule
-          #tidx = wordpos2token(offset, dummy_tokens, dummy_spaces)
-          tidxs = wordpos2tokens(offset, length, dummy_tokens, dummy_spaces)
+      for idx, match in enumerate(matches):
+        offset = match["offset"]
+        length = match["length"]
+        repls = [r["value"] for r in match["replacements"]]
+        rule = match["rule"]["id"]
+        #tidx = index.token_at(offset)
+        tidxs = index.token_range(offset, length)
 
+        if (len(repls) > 0) and (len(tidxs) > 0):
           repl_tokens = repls[0].split(" ")
-
-          if (len(repls) > 0):
-            # Just one token or multiple ones?
-            if len(repl_tokens) == 1:
-              tokens[tidxs[0]+shift] = repls[0]#.replace("\\", "\\\\").replace("\"", "\\\\\"")
-              rules[tidxs[0]] = rule
+          # Just one token or multiple ones?
+          if len(repl_tokens) == 1:
+            tokens[tidxs[0]+shift] = repls[0]#.replace("\\", "\\\\").replace("\"", "\\\\\"")
+            rules[tidxs[0]] = rule
+          else:
+            # Otherwise replace multiple tokens
+            if len(tidxs) == len(repl_tokens):
+              for iidx, tidx in enumerate(tidxs):
+                tokens[tidx+shift] = repl_tokens[iidx]
             else:
-              # Otherwise replace multiple tokens
-              if len(tidxs) == len(repl_tokens):
-                for iidx, tidx in enumerate(tidxs):
-                  tokens[tidx+shift] = repl_tokens[iidx]
+              # Not that trivial, delete everything and fill in reverse ordering
+              print("repls[0]: {}".format(repls[0]))
+              print("tidxs: {}".format(tidxs))
+              if len(tidxs) == 1:
+                #
+                #print("-> delete token at {} [Shift={}]".format(tidxs[0]+shift, shift))
+                del tokens[tidxs[0]+shift]
+                del spaces[tidxs[0]+shift]
               else:
-                # Not that trivial, delete everything and fill in reverse ordering
-                print("repls[0]: {}".format(repls[0]))
-                print("tidxs: {}".format(tidxs))
-                if len(tidxs) == 1:
-                  #
-                  #print("-> delete token at {} [Shift={}]".format(tidxs[0]+shift, shift))
-                  del tokens[tidxs[0]+shift]
-                  del spaces[tidxs[0]+shift]
-                else:
-                  del tokens[tidxs[0]+shift: tidxs[-1]+shift+1]
-                  del spaces[tidxs[0]+shift: tidxs[-1]+shift+1]
-                repl_tokens.reverse()
-                for e in repl_tokens:
-                  #print("-> adding token {} at position {} [Shift={}]".format(e, tidxs[0]+shift, shift))
-                  tokens.insert(tidxs[0]+shift, e)
-                  spaces.insert(tidxs[0]+shift, True)
-                shift += len(repl_tokens) - len(tidxs)
-            if (len(repls) > 1):
-              suggestions[tidxs[0]] = []
-              for v in repls[1:]:
-                suggestions[tidxs[0]].append(v.replace("\\", "\\\\").replace("\"", "\\\\\""))
-          else:
-            pass
-      except:
-        pass#rules[tidx] = "None"
-
-      realNumTokens = len(tokens)
-      shift = 0
-      for tidx, token in enumerate(tokens):
-        token = token.strip()
-        if " " in token and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
-          realNumTokens += len(token.split(" ")) - 1
-          for tt in token.split(" "):
-            result_content += generate_token_information(
-              aidx,
-              sidx,
-              tidx+shift,
-              tt,
-              suggestions[tidx] if tidx in suggestions else [],
-              spaces[tidx],
-              tidx+shift < (realNumTokens - 1),
-              translate_grammarbot_rules(rules[tidx]) if tidx in rules else None
-            )
-            shift += 1
-          shift -= 1
+                del tokens[tidxs[0]+shift: tidxs[-1]+shift+1]
+                del spaces[tidxs[0]+shift: tidxs[-1]+shift+1]
+              repl_tokens.reverse()
+              for e in repl_tokens:
+                #print("-> adding token {} at position {} [Shift={}]".format(e, tidxs[0]+shift, shift))
+                tokens.insert(tidxs[0]+shift, e)
+                spaces.insert(tidxs[0]+shift, True)
+              shift += len(repl_tokens) - len(tidxs)
+          if (len(repls) > 1):
+            suggestions[tidxs[0]] = []
+            for v in repls[1:]:
+              suggestions[tidxs[0]].append(v.replace("\\", "\\\\").replace("\"", "\\\\\""))
         else:
+          pass
+    except:
+      pass#rules[tidx] = "None"
+
+    realNumTokens = len(tokens)
+    shift = 0
+    for tidx, token in enumerate(tokens):
+      token = token.strip()
+      if " " in token and ((len(token.split(" ")[0]) != 0) and (len(token.split(" ")[0]) != 0)):
+        realNumTokens += len(token.split(" ")) - 1
+        for tt in token.split(" "):
           result_content += generate_token_information(
             aidx,
             sidx,
             tidx+shift,
-            token,
+            tt,
             suggestions[tidx] if tidx in suggestions else [],
             spaces[tidx],
             tidx+shift < (realNumTokens - 1),
             translate_grammarbot_rules(rules[tidx]) if tidx in rules else None
           )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+          shift += 1
+        shift -= 1
+      else:
+        result_content += generate_token_information(
+          aidx,
+          sidx,
+          tidx+shift,
+          token,
+          suggestions[tidx] if tidx in suggestions else [],
+          spaces[tidx],
+          tidx+shift < (realNumTokens - 1),
+          translate_grammarbot_rules(rules[tidx]) if tidx in rules else None
+        )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
 
-def evaluate_norvig_builtin(input, lang_code):
+def load_norvig(lang_code):
   import re
   from collections import Counter
 
   def words(text): return re.findall(r'\w+', text.lower())
 
   if lang_code == "en_US":
-    WORDS = Counter(words(open('/code/benchmark/workbench/dict/american-english-insane').read()))
+    return Counter(words(open('/code/benchmark/workbench/dict/american-english-insane').read()))
   else:
-    WORDS = Counter()
+    return Counter()
+
+def evaluate_norvig_builtin(input, lang_code, WORDS=None):
+  if WORDS is None:
+    WORDS = load_norvig(lang_code)
 
   def P(word, N=sum(WORDS.values())):
     "Probability of `word`."
@@ -802,103 +764,133 @@ def evaluate_norvig_builtin(input, lang_code):
     return (e2 for e1 in edits1(word) for e2 in edits1(e1))
 
 
-  input = build_article_information(input)
+  candidates = measured('suggest', candidates)
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
-
-      tokens, spaces = call_regex(sentence)
-      suggestions = {}
-
-      for tidx, token in enumerate(tokens):
-        edits = list(candidates(token))
-        #print("edits: %s" % (edits))
-        proposed_token = edits[0] if len(edits) > 0 else token
-        suggestions = []
-        for s in edits[1:]:
-          suggestions.append(s)
-        result_content += generate_token_information(
-          aidx,
-          sidx,
-          tidx,
-          edits[0],
-          suggestions,
-          spaces[tidx],
-          tidx < (len(tokens) - 1)
-        )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+  for record in sentence_records(input):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
+
+    tokens, spaces = record.tokens, record.spaces
+    suggestions = {}
+
+    for tidx, token in enumerate(tokens):
+      edits = list(candidates(token))
+      #print("edits: %s" % (edits))
+      proposed_token = edits[0] if len(edits) > 0 else token
+      suggestions = []
+      for s in edits[1:]:
+        suggestions.append(s)
+      result_content += generate_token_information(
+        aidx,
+        sidx,
+        tidx,
+        edits[0],
+        suggestions,
+        spaces[tidx],
+        tidx < (len(tokens) - 1)
+      )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
-def evaluate_ngram_builtin(input, lang_code):
+def load_ngram(lang_code):
+  from .ngram import Autocorrect
+
+  return Autocorrect(3, 1)
 
-  from .ngram import Autocorrect, evaluate
+def evaluate_ngram_builtin(input, lang_code, autocorrect=None):
 
-  autocorrect = Autocorrect(3, 1)
+  from .ngram import evaluate
 
-  input = build_article_information(input)
+  if autocorrect is None:
+    autocorrect = load_ngram(lang_code)
+  evaluate = measured('suggest', evaluate)
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
+  for record in sentence_records(input):
+    aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
 
-      tokens, spaces = call_regex(sentence)
+    tokens, spaces = record.tokens, record.spaces
 
-      for tidx, token in enumerate(tokens):
-        result = evaluate(autocorrect, token)
+    for tidx, token in enumerate(tokens):
+      result = evaluate(autocorrect, token)
 
-        if isinstance(result, list):
-          token = result[0]
-          if (len(result) > 1):
-            sugg = result[1:]
-          else:
-            sugg = []
+      if isinstance(result, list):
+        token = result[0]
+        if (len(result) > 1):
+          sugg = result[1:]
         else:
-          token = result
           sugg = []
-        result_content += generate_token_information(
-          aidx,
-          sidx,
-          tidx,
-          token,
-          sugg,
-          spaces[tidx],
-          tidx < (len(tokens) - 1)
-        )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
-        result_content += ",\n"
+      else:
+        token = result
+        sugg = []
+      result_content += generate_token_information(
+        aidx,
+        sidx,
+        tidx,
+        token,
+        sugg,
+        spaces[tidx],
+        tidx < (len(tokens) - 1)
+      )
+    if not record.last:
+      result_content += ",\n"
 
   result_content += "  ]\n}"
 
   return result_content
 
 
-def evaluate_hmm_builtin(input, lang_code):
-
-  from .hmm import SpellingCorrection, Viterbi
-
-  print("Start training of HMM model ...")
-  objSC = SpellingCorrection()
-  objSC.trainHMModel()
-  objViterbi = Viterbi(objSC.getEmissionProbabilities(), objSC.getTransitionProbabilities(), objSC.corruptedTestSet)
-  print("\t finished training.")
-
-  input = build_article_information(input)
+def load_hmm(lang_code):
+  from django.conf import settings
+  from .hmm import loadHMModel, Viterbi
+
+  print("Load HMM model ...")
+  objSC = loadHMModel(
+    os.path.join(settings.CACHE_DIR, 'hmm'),
+    seed=settings.HMM_SEED,
+    corruptionRate=settings.HMM_CORRUPTION_RATE
+  )
+  objViterbi = Viterbi(
+    objSC.getEmissionProbabilities(),
+    objSC.getTransitionProbabilities(),
+    objSC.corruptedTestSet,
+    objSC.getLogEmissionProbabilities(),
+    objSC.getLogTransitionProbabilities()
+  )
+  print("\t finished loading.")
+  return objViterbi
+
+def evaluate_hmm_builtin(input, lang_code, objViterbi=None):
+  if objViterbi is None:
+    objViterbi = load_hmm(lang_code)
+
+  from .pipeline import batched
 
   result_content = "{ \"predictions\": [\n"
 
-  for aidx, article in enumerate(input):
-    for sidx, sentence in enumerate(article.sentences):
+  # The words of HMM_BATCH_SENTENCES sentences are decoded at once, the benchmark is never
+  # held in memory as a whole
+  for records in batched(sentence_records(input), HMM_BATCH_SENTENCES):
+    words = [t.lower() for record in records for t in record.tokens]
+    start = time.perf_counter()
+    corrected = objViterbi.processBatch(words)
+    # Decoded in one batch, every word gets the mean latency
+    observe('suggest', (time.perf_counter() - start) / max(1, len(words)), len(words))
+
+    offset = 0
+    for record in records:
+      aidx, sidx, sentence = record.aidx, record.sidx, record.sentence
 
-      tokens, spaces = call_regex(sentence.lower())
+      spaces = record.spaces
 
-      tokens = objViterbi.process(tokens)
+      tokens = corrected[offset:offset + len(record.tokens)]
+      offset += len(tokens)
 
       for tidx, token in enumerate(tokens):
         result_content += generate_token_information(
@@ -910,7 +902,7 @@ def evaluate_hmm_builtin(input, lang_code):
           spaces[tidx],
           tidx < (len(tokens) - 1)
         )
-      if (aidx < (len(input) - 1)) or (sidx < len(article.sentences) - 1):
+      if not record.last:
         result_content += ",\n"
 
   result_content += "  ]\n}"
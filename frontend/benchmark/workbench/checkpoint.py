@@ -0,0 +1,175 @@
+'''
+Checkpointed engine runs. A long baseline run (LanguageTool, HMM, ...) predicts the benchmark in
+chunks of CHECKPOINT_ARTICLES articles. After every chunk its prediction entries are appended to
+``predictions.part`` and ``checkpoint.json`` records the articles done so far, both synced to
+disk. A run started again on the same benchmark, engine and language continues after the last
+completed article and drops the output of a chunk that was interrupted.
+
+Every prediction entry of the builtin engines ends with a separator except the one of the very
+last sentence, so the chunks joined are the same content an uninterrupted run returns (the engine
+server joins its batches the same way).
+'''
+
+import os
+import time
+import shutil
+import hashlib
+import ujson as json
+
+from .corpus import sentence_records
+from .engine_server import PREDICTIONS_HEADER, PREDICTIONS_FOOTER, prediction_entries
+from .pipeline import prefetched
+
+CHECKPOINT_VERSION = 1
+
+
+def source_key(input):
+  """
+  Returns a key of the benchmark ``input``, the content of a source file or a TokenizedBenchmark
+  (its cache file name already changes with the source).
+  """
+  if isinstance(input, str):
+    return hashlib.sha1(input.encode('utf-8')).hexdigest()
+  return os.path.basename(getattr(input, 'filepath', repr(input)))
+
+
+class Checkpoint(object):
+  """
+  The checkpoint of the run of ``engine`` on the benchmark ``input`` in ``directory``.
+  """
+
+  def __init__(self, directory, engine, lang_code, input):
+    self.directory = directory
+    self.engine = engine
+    self.lang_code = lang_code
+    self.key = "%d|%s|%s|%s" % (CHECKPOINT_VERSION, engine, lang_code, source_key(input))
+    self.part_filepath = os.path.join(directory, 'predictions.part')
+    self.state_filepath = os.path.join(directory, 'checkpoint.json')
+
+  def load(self):
+    """
+    Returns the state of the last checkpoint, None if there is none for this run. The output
+    written after it is dropped.
+    """
+    try:
+      with open(self.state_filepath, 'r', encoding='utf-8') as fin:
+        state = json.loads(fin.read())
+    except (OSError, ValueError):
+      return None
+    if state.get("key") != self.key:
+      print("WARNING: checkpoint in %s belongs to another run, starting over" % (self.directory))
+      return None
+    try:
+      size = os.path.getsize(self.part_filepath)
+    except OSError:
+      return None
+    if size < state["bytes"]:
+      print("WARNING: output of checkpoint in %s is incomplete, starting over" % (self.directory))
+      return None
+    if size > state["bytes"]:
+      with open(self.part_filepath, 'r+b') as fout:
+        fout.truncate(state["bytes"])
+    return state
+
+  def reset(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+    os.makedirs(self.directory, exist_ok=True)
+    with open(self.part_filepath, 'wb'):
+      pass
+
+  def commit(self, entries, articles, run=None):
+    """
+    Appends the prediction ``entries`` of a chunk and records that the first ``articles``
+    articles are done.
+    """
+    with open(self.part_filepath, 'ab') as fout:
+      fout.write(entries.encode('utf-8'))
+      fout.flush()
+      os.fsync(fout.fileno())
+      size = fout.tell()
+
+    state = {"key": self.key, "articles": articles, "bytes": size}
+    if run is not None:
+      state.update({
+        "seconds": run.seconds + time.perf_counter() - run.start,
+        "tokens": run.tokens,
+        "sentences": run.sentences,
+        "latencies": run.latency_dict()
+      })
+    tmp_filepath = self.state_filepath + '.tmp'
+    with open(tmp_filepath, 'w', encoding='utf-8') as fout:
+      fout.write(json.dumps(state))
+      fout.flush()
+      os.fsync(fout.fileno())
+    os.replace(tmp_filepath, self.state_filepath)
+
+  def content(self):
+    with open(self.part_filepath, 'r', encoding='utf-8') as fin:
+      return PREDICTIONS_HEADER + fin.read() + PREDICTIONS_FOOTER
+
+  def write_to(self, filepath):
+    """
+    Writes the prediction content to ``filepath`` without reading it into memory.
+    """
+    with open(filepath, 'wb') as fout:
+      fout.write(PREDICTIONS_HEADER.encode('utf-8'))
+      with open(self.part_filepath, 'rb') as fin:
+        shutil.copyfileobj(fin, fout)
+      fout.write(PREDICTIONS_FOOTER.encode('utf-8'))
+
+  def remove(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def predict_checkpointed(predict, input, checkpoint, every, resume=True, run=None):
+  """
+  Predicts ``input`` with ``predict(records)`` in chunks of ``every`` articles with a
+  checkpoint after each, read the content with ``checkpoint.content`` or ``write_to``. With
+  ``resume`` the run continues from the last checkpoint, if there is one. The speed of the
+  engine is recorded into the EngineRun ``run``, including the part done before the resume.
+  """
+  state = checkpoint.load() if resume else None
+  if state is None:
+    checkpoint.reset()
+    done = 0
+  else:
+    done = state["articles"]
+    print("Resuming %s after article %d" % (checkpoint.engine, done - 1))
+    if run is not None and "seconds" in state:
+      run.seconds += state["seconds"]
+      run.tokens += state["tokens"]
+      run.sentences += state["sentences"]
+      run.merge_latencies(state["latencies"])
+
+  def predict_all():
+    # The next chunk is read while the engine predicts the current one
+    for chunk, articles in prefetched(article_chunks(sentence_records(input), every, done), 1):
+      if run is not None:
+        run.count(chunk)
+      checkpoint.commit(prediction_entries(predict(chunk)), articles, run)
+      print("Checkpoint of %s after %d articles" % (checkpoint.engine, articles))
+
+  if run is None:
+    predict_all()
+  else:
+    with run:
+      predict_all()
+
+def article_chunks(records, every, start=0):
+  """
+  Yields the records of the articles from ``start`` on in chunks of ``every`` articles, each
+  with the number of articles done after it.
+  """
+  chunk = []
+  chunk_articles = set()
+  for record in records:
+    if record.aidx < start:
+      continue
+    if record.aidx not in chunk_articles and len(chunk_articles) == every:
+      yield chunk, max(chunk_articles) + 1
+      chunk = []
+      chunk_articles = set()
+    chunk.append(record)
+    chunk_articles.add(record.aidx)
+  if len(chunk) > 0:
+    yield chunk, max(chunk_articles) + 1
@@ -0,0 +1,224 @@
+import os
+import copy
+import shutil
+import hashlib
+import tempfile
+import ujson as json
+import regex as re
+
+from .utils import tokenize, TOKEN_PATTERN
+
+# Version of the cached corpus files, has to be increased whenever their layout changes
+CORPUS_CACHE_VERSION = 2
+
+
+class SourceInternalArticle(object):
+
+  def __init__(self):
+    self.sentences = None
+
+def build_article_information(input):
+  json_ = json.loads(input)
+  num_articles = 0
+  for t in json_["tokens"]:
+    nums_ = re.findall('\d+', t['id'], re.UNICODE)
+    #articles.add(int(nums_[0]))
+    if num_articles < int(nums_[0]):
+      num_articles = int(nums_[0])
+  num_articles = num_articles + 1
+  #print(f"detected {num_articles} in source file, collect number of sentences")
+  num_sentences = [set() for _ in range(num_articles)]
+  for t in json_["tokens"]:
+    nums_ = re.findall('\d+', t['id'], re.UNICODE)
+    num_sentences[int(nums_[0])].add(int(nums_[1]))
+
+  results = [SourceInternalArticle() for _ in range(num_articles)]
+  for aidx in range(num_articles):
+    #print(f"detected {len(num_sentences[aidx])} sentences for article {aidx}")
+    #for sidx in range(len(num_sentences[aidx])):
+    results[aidx].sentences = ["" for _ in range(len(num_sentences[aidx]))]
+
+  for t in json_["tokens"]:
+    nums_ = re.findall('\d+', t['id'], re.UNICODE)
+    results[int(nums_[0])].sentences[int(nums_[1])] += t['token']
+    if ((t['space'] == True) or (t['space'] == 'true')):
+      results[int(nums_[0])].sentences[int(nums_[1])] += ' '
+
+  return copy.deepcopy(results)
+
+
+class SentenceRecord(object):
+  """
+  One rebuilt and tokenized sentence of a benchmark.
+  """
+
+  def __init__(self, aidx, sidx, sentence, spans, last=False):
+    self.aidx = aidx
+    self.sidx = sidx
+    self.sentence = sentence
+    # (token, start, end, space) of every token, see utils.tokenize
+    self.spans = spans
+    # Whether this is the very last sentence of the benchmark
+    self.last = last
+    self.tokens = [span[0] for span in spans]
+    self.spaces = [span[3] for span in spans]
+
+  def to_list(self):
+    return [self.aidx, self.sidx, self.sentence, self.spans, self.last]
+
+  @classmethod
+  def from_list(cls, values):
+    aidx, sidx, sentence, spans, last = values
+    return cls(aidx, sidx, sentence, [tuple(span) for span in spans], last)
+
+class SourceOrderError(ValueError):
+  """
+  Raised if the tokens of a source file are not ordered by article and sentence.
+  """
+  pass
+
+def stream_sentence_records(fin):
+  """
+  Rebuilds and tokenizes the sentences of the benchmark source file read from ``fin`` one by one,
+  yields the same SentenceRecords as generate_sentence_records without reading the file as a
+  whole. The tokens have to be ordered by article and sentence, as the generator writes them.
+
+  :raises SourceOrderError: If they are not.
+  """
+  from .pipeline import json_array_items
+
+  current = None
+  text = []
+  pending = None
+  for t in json_array_items(fin, "tokens"):
+    nums_ = re.findall('\d+', t['id'], re.UNICODE)
+    key = (int(nums_[0]), int(nums_[1]))
+    if key != current:
+      if current is not None:
+        if key < current:
+          raise SourceOrderError("token %s follows a%d.s%d" % (t['id'], current[0], current[1]))
+        if pending is not None:
+          yield pending
+        sentence = "".join(text)
+        pending = SentenceRecord(current[0], current[1], sentence, tokenize(sentence))
+      current = key
+      text = []
+    text.append(t['token'])
+    if ((t['space'] == True) or (t['space'] == 'true')):
+      text.append(' ')
+  if pending is not None:
+    yield pending
+  if current is not None:
+    sentence = "".join(text)
+    yield SentenceRecord(current[0], current[1], sentence, tokenize(sentence), True)
+
+def generate_sentence_records(articles):
+  """
+  Tokenizes all sentences of the ``articles`` returned by build_article_information.
+  """
+  num_articles = len(articles)
+  for aidx, article in enumerate(articles):
+    for sidx, sentence in enumerate(article.sentences):
+      last = (aidx == num_articles - 1) and (sidx == len(article.sentences) - 1)
+      yield SentenceRecord(aidx, sidx, sentence, tokenize(sentence), last)
+
+
+class TokenizedBenchmark(object):
+  """
+  The cached sentence reconstruction and tokenization of a benchmark source file. Iterating
+  over it streams the SentenceRecords from the cache file.
+  """
+
+  def __init__(self, filepath):
+    self.filepath = filepath
+
+  def token_counts(self):
+    """
+    Returns the number of tokens of every sentence, as one list per article.
+    """
+    with open(self.filepath, 'r', encoding='utf-8') as fin:
+      return json.loads(fin.readline())["numTokens"]
+
+  def __iter__(self):
+    with open(self.filepath, 'r', encoding='utf-8') as fin:
+      # Skip the header
+      fin.readline()
+      for line in fin:
+        yield SentenceRecord.from_list(json.loads(line))
+
+def corpus_cache_path(cache_dir, source_filepath):
+  """
+  Returns the cache file of ``source_filepath``. The key changes whenever the source file, the
+  tokenizer pattern or the cache layout changes.
+  """
+  stat = os.stat(source_filepath)
+  key = hashlib.sha1("{}|{}|{}|{}|{}".format(
+    os.path.realpath(source_filepath),
+    stat.st_size,
+    stat.st_mtime_ns,
+    TOKEN_PATTERN.pattern,
+    CORPUS_CACHE_VERSION
+  ).encode('utf-8')).hexdigest()
+  return os.path.join(cache_dir, 'v{}-{}.jsonl'.format(CORPUS_CACHE_VERSION, key))
+
+def load_tokenized_benchmark(source_filepath, cache_dir):
+  """
+  Returns the TokenizedBenchmark of the benchmark source file ``source_filepath``, the
+  sentences are only rebuilt and tokenized if there is no cache file for it yet.
+  """
+  filepath = corpus_cache_path(cache_dir, source_filepath)
+  if not os.path.exists(filepath):
+    os.makedirs(cache_dir, exist_ok=True)
+    # The records are streamed into a body file, the header with the sentence counts is
+    # written in front of it afterwards
+    fd, body_filepath = tempfile.mkstemp(dir=cache_dir)
+    try:
+      with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+        try:
+          with open(source_filepath, 'r', encoding='utf-8') as fin:
+            num_tokens = write_records(fout, stream_sentence_records(fin))
+        except SourceOrderError as e:
+          print("WARNING: %s in %s, rebuilding it in memory" % (e, source_filepath))
+          fout.seek(0)
+          fout.truncate()
+          with open(source_filepath, 'r', encoding='utf-8') as fin:
+            num_tokens = write_records(fout, generate_sentence_records(build_article_information(fin.read())))
+
+      # Write into a temporary file first, so concurrent runs never see partial caches
+      fd, tmp_filepath = tempfile.mkstemp(dir=cache_dir)
+      with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+        fout.write(json.dumps({
+          "version": CORPUS_CACHE_VERSION,
+          "source": source_filepath,
+          "numSentences": [len(counts) for counts in num_tokens],
+          "numTokens": num_tokens
+        }) + "\n")
+        with open(body_filepath, 'r', encoding='utf-8') as fin:
+          shutil.copyfileobj(fin, fout)
+      os.replace(tmp_filepath, filepath)
+    finally:
+      os.remove(body_filepath)
+
+  return TokenizedBenchmark(filepath)
+
+def write_records(fout, records):
+  """
+  Writes ``records`` as lines of the cache file, returns the number of tokens of every sentence
+  as one list per article.
+  """
+  num_tokens = []
+  for record in records:
+    while len(num_tokens) <= record.aidx:
+      num_tokens.append([])
+    num_tokens[record.aidx].append(len(record.spans))
+    fout.write(json.dumps(record.to_list(), ensure_ascii=False) + "\n")
+  return num_tokens
+
+def sentence_records(input):
+  """
+  Returns the SentenceRecords of ``input``, which is either the content of a benchmark source
+  file or a TokenizedBenchmark.
+  """
+  if isinstance(input, str):
+    return generate_sentence_records(build_article_information(input))
+  return input
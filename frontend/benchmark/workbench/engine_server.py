@@ -0,0 +1,235 @@
+'''
+Resident engine server: a pool of worker processes with preloaded engine resources, serving
+predictions for batches of tokenized sentences over a local UNIX socket.
+
+Every message is a 4 byte big-endian length followed by a JSON document. A request looks like
+``{"engine": "hmm", "langCode": "en_US", "sentences": [SentenceRecord.to_list(), ...]}`` and is
+answered by ``{"predictions": "<prediction entries>", "latencies": {...}}`` (the latency
+histograms of the engine, see workbench.speed) or ``{"error": "<message>"}``. Requests
+sent on one connection are processed in parallel by the workers and answered in order, at most
+MAX_PENDING_BATCHES per worker at a time, a client sending more waits (backpressure). The client
+ends its requests by shutting down its side of the connection, the server closes it after the
+last answer.
+
+Start it with ``python3 manage.py engine_server``.
+'''
+
+import os
+import queue
+import socket
+import struct
+import threading
+import multiprocessing
+import ujson as json
+
+from .corpus import SentenceRecord, sentence_records
+from .speed import current_run
+
+# Enclose the prediction entries of every builtin engine
+PREDICTIONS_HEADER = "{ \"predictions\": [\n"
+PREDICTIONS_FOOTER = "  ]\n}"
+
+MESSAGE_HEADER = struct.Struct('>I')
+
+# Requests of a connection being processed or waiting to be answered, per worker
+MAX_PENDING_BATCHES = 2
+
+
+class EngineServerError(Exception):
+  """
+  Raised by the client if the server could not process a request.
+  """
+  pass
+
+
+def send_message(sock, content):
+  body = json.dumps(content, ensure_ascii=False).encode('utf-8')
+  sock.sendall(MESSAGE_HEADER.pack(len(body)) + body)
+
+def recv_exactly(sock, size):
+  data = bytearray()
+  while len(data) < size:
+    chunk = sock.recv(min(size - len(data), 1 << 20))
+    if not chunk:
+      return None
+    data += chunk
+  return bytes(data)
+
+def recv_message(sock):
+  """
+  Returns the next message of ``sock``, None if the connection was closed.
+  """
+  header = recv_exactly(sock, MESSAGE_HEADER.size)
+  if header is None:
+    return None
+  body = recv_exactly(sock, MESSAGE_HEADER.unpack(header)[0])
+  if body is None:
+    return None
+  return json.loads(body.decode('utf-8'))
+
+def prediction_entries(content):
+  """
+  Strips the header and footer from the prediction content of an engine.
+  """
+  return content[len(PREDICTIONS_HEADER):len(content) - len(PREDICTIONS_FOOTER)]
+
+
+def init_worker(preload, lang_codes):
+  from .engines import warmup
+
+  for name in preload:
+    for lang_code in lang_codes:
+      # A missing dictionary must not keep the worker from starting, the engine fails on use
+      try:
+        warmup(name, lang_code)
+      except Exception as e:
+        print("WARNING: could not preload %s for %s: %s" % (name, lang_code, e))
+
+def predict_batch(engine_name, lang_code, sentences):
+  from .engines import get_engine
+
+  engine = get_engine(engine_name)
+  if engine is None:
+    return {"error": "unknown engine %s" % (engine_name)}
+  from .speed import EngineRun
+
+  try:
+    records = [SentenceRecord.from_list(sentence) for sentence in sentences]
+    with EngineRun(engine_name, lang_code) as run:
+      content = engine.predict(records, lang_code)
+    return {"predictions": prediction_entries(content), "latencies": run.latency_dict()}
+  except Exception as e:
+    return {"error": "%s: %s" % (type(e).__name__, e)}
+
+
+class EngineServer(object):
+  """
+  Accepts connections on ``socket_path`` and hands the requests to ``workers`` processes, which
+  load the engines in ``preload`` for all ``lang_codes`` on start.
+  """
+
+  def __init__(self, socket_path, workers=2, preload=(), lang_codes=('en_US',)):
+    self.socket_path = socket_path
+    self.workers = workers
+    self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(list(preload), list(lang_codes)))
+    self.sock = None
+    self.running = False
+
+  def serve_forever(self):
+    if os.path.exists(self.socket_path):
+      os.unlink(self.socket_path)
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.bind(self.socket_path)
+    self.sock.listen(16)
+    self.running = True
+    try:
+      while self.running:
+        try:
+          conn, _ = self.sock.accept()
+        except OSError:
+          break
+        threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+    finally:
+      self.shutdown()
+
+  def shutdown(self):
+    self.running = False
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+      if os.path.exists(self.socket_path):
+        os.unlink(self.socket_path)
+    self.pool.terminate()
+
+  def handle_connection(self, conn):
+    # Results in request order, a writer thread answers them as soon as they are ready
+    pending = queue.Queue(MAX_PENDING_BATCHES * self.workers)
+    writer = threading.Thread(target=self.write_responses, args=(conn, pending), daemon=True)
+    writer.start()
+    try:
+      while True:
+        request = recv_message(conn)
+        if request is None:
+          break
+        pending.put(self.pool.apply_async(predict_batch, (request["engine"], request["langCode"], request["sentences"])))
+    finally:
+      pending.put(None)
+      writer.join()
+      conn.close()
+
+  def write_responses(self, conn, pending):
+    while True:
+      result = pending.get()
+      if result is None:
+        return
+      try:
+        send_message(conn, result.get())
+      except OSError:
+        return
+
+
+class EngineClient(object):
+  """
+  Client of an EngineServer.
+  """
+
+  def __init__(self, socket_path, timeout=None):
+    self.socket_path = socket_path
+    self.timeout = timeout
+
+  def available(self):
+    return os.path.exists(self.socket_path)
+
+  def predict(self, engine_name, input, lang_code, batch_size=256):
+    """
+    Returns the prediction content of ``input`` (see corpus.sentence_records), which is read
+    and sent in batches of ``batch_size`` sentences while the answers arrive.
+    """
+    from .pipeline import batched
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(self.timeout)
+    sock.connect(self.socket_path)
+    try:
+      # Batches are sent as they are read so the workers can process them in parallel, the
+      # server stops reading while too many of them are pending
+      sent = {"batches": 0, "error": None}
+      batches = batched((record.to_list() for record in sentence_records(input)), batch_size)
+      sender = threading.Thread(target=self.send_batches, args=(sock, engine_name, lang_code, batches, sent), daemon=True)
+      sender.start()
+      entries = []
+      while True:
+        response = recv_message(sock)
+        if response is None:
+          break
+        if "error" in response:
+          raise EngineServerError(response["error"])
+        entries.append(response["predictions"])
+        # The latencies measured by the worker belong to the run of this thread
+        run = current_run()
+        if run is not None and "latencies" in response:
+          run.merge_latencies(response["latencies"])
+      sender.join()
+      if sent["error"] is not None:
+        raise sent["error"]
+      if len(entries) != sent["batches"]:
+        raise EngineServerError("connection closed by the engine server")
+    finally:
+      sock.close()
+
+    return PREDICTIONS_HEADER + "".join(entries) + PREDICTIONS_FOOTER
+
+  def send_batches(self, sock, engine_name, lang_code, batches, sent):
+    try:
+      for batch in batches:
+        send_message(sock, {"engine": engine_name, "langCode": lang_code, "sentences": batch})
+        sent["batches"] += 1
+    except OSError:
+      pass
+    except Exception as e:
+      # Reading the input failed, raised by predict
+      sent["error"] = e
+    try:
+      sock.shutdown(socket.SHUT_WR)
+    except OSError:
+      pass
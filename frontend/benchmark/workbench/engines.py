@@ -0,0 +1,119 @@
+'''
+Registry of the builtin engines. Every engine declares how to load its resources, which
+languages it supports and whether it processes the whole benchmark in batches. Resources are
+loaded on first use and kept warm in the process for all later calls.
+
+New engines are added with ``register_engine``, see the builtin registrations at the bottom.
+'''
+
+import time
+import threading
+
+from . import builtin_sec
+from .profiling import Capture, profiling_target
+
+
+class Engine(object):
+  """
+  A registered engine.
+
+  :param evaluate: Function ``(input, lang_code[, resource])`` returning the prediction content.
+  :param load: Function ``(lang_code)`` returning the resource passed to ``evaluate``, None if
+    the engine needs no resources.
+  :param languages: Supported language codes, None if the engine supports every language.
+  :param batched: Whether the engine processes many sentences per call of its backend.
+  :param remote: Whether the engine calls a remote service.
+  """
+
+  def __init__(self, name, evaluate, load=None, languages=None, batched=False, remote=False):
+    self.name = name
+    self.evaluate = evaluate
+    self.load = load
+    self.languages = languages
+    self.batched = batched
+    self.remote = remote
+    # Loaded resources and the seconds it took to load them, per language code
+    self.resources = {}
+    self.warmup_seconds = {}
+    self.lock = threading.Lock()
+
+  def supports(self, lang_code):
+    return (self.languages is None) or (lang_code in self.languages)
+
+  def resource(self, lang_code):
+    """
+    Returns the resource for ``lang_code``, loads it on first use.
+    """
+    if lang_code not in self.resources:
+      with self.lock:
+        if lang_code not in self.resources:
+          start = time.perf_counter()
+          resource = self.load(lang_code)
+          self.warmup_seconds[lang_code] = time.perf_counter() - start
+          print("Warmed up engine %s for %s in %.2fs" % (self.name, lang_code, self.warmup_seconds[lang_code]))
+          self.resources[lang_code] = resource
+    return self.resources[lang_code]
+
+  def predict(self, input, lang_code):
+    if not self.supports(lang_code):
+      print("WARNING: engine %s does not support %s" % (self.name, lang_code))
+    job = getattr(self.evaluate, '__name__', self.name)
+    if profiling_target(job):
+      with Capture(job, lang_code=lang_code):
+        return self.call(input, lang_code)
+    return self.call(input, lang_code)
+
+  def call(self, input, lang_code):
+    if self.load is None:
+      return self.evaluate(input, lang_code)
+    return self.evaluate(input, lang_code, self.resource(lang_code))
+
+  def unload(self):
+    with self.lock:
+      self.resources = {}
+
+
+ENGINES = {}
+
+def register_engine(name, evaluate, **kwargs):
+  """
+  Registers an engine under ``name`` (case insensitive), see Engine for the arguments.
+  """
+  ENGINES[name.lower()] = Engine(name.lower(), evaluate, **kwargs)
+  return ENGINES[name.lower()]
+
+def get_engine(name):
+  """
+  Returns the engine registered under ``name``, None if there is none.
+  """
+  return ENGINES.get(name.lower())
+
+def warmup(name, lang_code):
+  """
+  Loads the resources of an engine ahead of its first prediction.
+  """
+  engine = get_engine(name)
+  if engine is not None and engine.load is not None:
+    engine.resource(lang_code)
+
+def warmup_report():
+  """
+  Returns ``(engine name, language code, seconds)`` of every resource loaded so far.
+  """
+  report = []
+  for name in sorted(ENGINES.keys()):
+    for lang_code, seconds in sorted(ENGINES[name].warmup_seconds.items()):
+      report.append((name, lang_code, seconds))
+  return report
+
+
+register_engine('aspell', builtin_sec.evaluate_aspell_builtin, load=builtin_sec.load_aspell)
+register_engine('hunspell', builtin_sec.evaluate_hunspell_builtin, load=builtin_sec.load_hunspell)
+register_engine('pyenchant', builtin_sec.evaluate_pyenchant_builtin, load=builtin_sec.load_pyenchant)
+register_engine('xspell', builtin_sec.evaluate_xspell_builtin, remote=True)
+register_engine('mashape', builtin_sec.evaluate_mashape_builtin, languages=('en_US',), remote=True)
+register_engine('grammarbot', builtin_sec.evaluate_grammarbot_builtin, remote=True)
+register_engine('languagetool', builtin_sec.evaluate_languagetool_builtin, batched=True, remote=True)
+register_engine('norvig', builtin_sec.evaluate_norvig_builtin, load=builtin_sec.load_norvig, languages=('en_US',))
+register_engine('ngram', builtin_sec.evaluate_ngram_builtin, load=builtin_sec.load_ngram, languages=('en_US',))
+register_engine('hmm', builtin_sec.evaluate_hmm_builtin, load=builtin_sec.load_hmm, languages=('en_US',), batched=True)
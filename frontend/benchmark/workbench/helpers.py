@@ -5,7 +5,12 @@ from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
 from .forms import AddProgramForm, UploadResultsForm
 
+from django.db import transaction
+from django.conf import settings
+
 from .models import Program, Benchmark, Result, ErrorCategory, PredictedSentenceInformation, InternalSentenceInformation
+from .vocabulary import VOCABULARY, preload_vocabulary
+from .versions import visible_predictions, visible_predictions_of_programs
 
 from .tasks import *
 
@@ -15,21 +20,26 @@ import random
 import string
 import requests
 import tarfile
+import hashlib
 import ujson as json
 
-def write_results_to_db(data, program, benchmark):
+def write_results_to_db(data, program, benchmark, version):
   """
-  Helper method for writing the results to the database.
+  Helper method for writing the results to the database, use versions.publish_results. Returns
+  the number of rows written.
 
   :param data: The data to write (as json)
   :param program: the db entry of the program.
   :param benchmark: the db entry of the benchmark.
+  :param version: the ResultVersion the results belong to.
   """
-  Result.objects.filter(program=program, benchmark=benchmark).delete()
-  ErrorCategory.objects.filter(program=program, benchmark=benchmark).delete()
+  # Results of the time before versioning, the results of older versions are garbage-collected
+  Result.objects.filter(program=program, benchmark=benchmark, version__isnull=True).delete()
+  ErrorCategory.objects.filter(program=program, benchmark=benchmark, version__isnull=True).delete()
   results = Result.objects.create(
     program=program,
     benchmark=benchmark,
+    version=version,
     equalScore=data["evaluation"]["equalScore"],
     penalizedScore=data["evaluation"]["penalizedScore"],
     wordAccuracy=data["evaluation"]["wordAccuracy"],
@@ -53,11 +63,13 @@ def write_results_to_db(data, program, benchmark):
     correctedErrors=data["evaluation"]["correctedErrors"],
     suggestionAdequacy=data["evaluation"]["suggestionAdequacy"])
   #results.save()
-  for error_type in ["NONE", "NON_WORD", "REAL_WORD", "SPLIT", "HYPHENATION", "COMPOUND_HYPHEN", "CONCATENATION", "CAPITALISATION", "ARCHAIC", "REPEAT", "PUNCTUATION", "MENTION_MISMATCH", "TENSE"]:
+  error_types = ["NONE", "NON_WORD", "REAL_WORD", "SPLIT", "HYPHENATION", "COMPOUND_HYPHEN", "CONCATENATION", "CAPITALISATION", "ARCHAIC", "REPEAT", "PUNCTUATION", "MENTION_MISMATCH", "TENSE"]
+  for error_type in error_types:
     ErrorCategory.objects.create(
       result=results,
       benchmark=benchmark,
       program=program,
+      version=version,
       name=error_type,
       detectionPrecision=data["evaluation"][error_type]["detectionPrecision"],
       detectionRecall=data["evaluation"][error_type]["detectionRecall"],
@@ -77,6 +89,7 @@ def write_results_to_db(data, program, benchmark):
       correction_tn=data["evaluation"][error_type]["correction"]["tn"],
       correction_fn=data["evaluation"][error_type]["correction"]["fn"]
     )
+  return 1 + len(error_types)
 
 def delete_directory(dir_to_remove):
   """
@@ -84,6 +97,28 @@ def delete_directory(dir_to_remove):
   """
   shutil.rmtree(dir_to_remove)
 
+def stage_files(extraction_path, files):
+  """
+  Copies the files (filepath -> name) into ``extraction_path``, returns the number of bytes copied.
+  """
+  num_bytes = 0
+  for filepath, name in files:
+    shutil.copyfile(filepath, extraction_path + name)
+    num_bytes += os.path.getsize(extraction_path + name)
+  return num_bytes
+
+def baseline_checkpoint_dir(benchmark, program):
+  """
+  Returns the checkpoint directory of the baseline run of ``program`` on ``benchmark``.
+  """
+  return os.path.join(settings.CHECKPOINT_DIR, "%d-%d" % (benchmark.id, program.id))
+
+def request_evaluation(lang_code, extraction_path):
+  """
+  Lets the evaluator evaluate the files staged in ``extraction_path``, returns its response.
+  """
+  return requests.post(settings.EVALUATOR_URL, json={"langCode": lang_code, "path": extraction_path})
+
 import copy
 
 
@@ -218,9 +253,21 @@ def build_alignment_sentence_representation(input):
 
 
 
-def read_and_save_alignment_file(program, benchmark, dir_with_alignment_file):
+def prediction_content_hash(tokens, corrected, src_connections, tgt_connections):
+  """
+  Returns the content hash of one PredictedSentenceInformation.
+  """
+  content = json.dumps([tokens, corrected, src_connections, tgt_connections], ensure_ascii=False)
+  return hashlib.sha1(content.encode('utf-8')).hexdigest()
 
-  PredictedSentenceInformation.objects.filter(program=program, benchmark=benchmark).delete()
+def read_and_save_alignment_file(program, benchmark, dir_with_alignment_file, version):
+  """
+  Saves the aligned predictions of ``program`` for ``benchmark`` as part of ``version``, use
+  versions.publish_results. Only the sentences whose content changed since the last upload are
+  written: their old rows, and those of sentences missing from the alignment file, stay valid
+  for the older versions only, and new rows are added for the changed and new sentences.
+  Returns the number of rows inserted or ended.
+  """
 
   filename = dir_with_alignment_file + 'alignments.json'
 
@@ -234,47 +281,102 @@ def read_and_save_alignment_file(program, benchmark, dir_with_alignment_file):
 
   num_articles = len(results)
 
+  predictions = {}
   for aidx in range(num_articles):
     num_sentences = len(results[aidx].tokens)
     for sidx in range(num_sentences):
 
-      src_elems_ = []
-      grt_elems_ = []
-      for idx, elem in enumerate(results[aidx].src_connections[sidx]):
-        src_elems_.append("{}->{}".format(elem[0], ",".join(str(e) for e in elem[1:])))
-      for idx, elem in enumerate(results[aidx].grt_connections[sidx]):
-        grt_elems_.append("{}->{}".format(elem[0], ",".join(str(e) for e in elem[1:])))
-
-      PredictedSentenceInformation.objects.create(
-        program=program,
-        benchmark=benchmark,
-        aid=aidx,
-        sid=sidx,
-        tokens=results[aidx].tokens[sidx],
-        corrected=results[aidx].corrected[sidx],
-        src_connections="|".join(e for e in src_elems_),
-        tgt_connections="|".join(e for e in grt_elems_)
-      )
+      content = {
+        'tokens': results[aidx].tokens[sidx],
+        'corrected': [c == "true" for c in results[aidx].corrected[sidx]],
+        'src_connections': [(elem[0], elem[1]) for elem in results[aidx].src_connections[sidx]],
+        'tgt_connections': [(elem[0], elem[1]) for elem in results[aidx].grt_connections[sidx]]
+      }
+      predictions[(aidx, sidx)] = (content, prediction_content_hash(**content))
+
+  # The rows of the latest version
+  existing = PredictedSentenceInformation.objects.filter(program=program, benchmark=benchmark, valid_to__isnull=True)
+
+  to_end = []
+  to_create = []
+  seen = set()
+  num_existing = 0
+  num_changed = 0
+  for pk, aid, sid, content_hash in existing.values_list('pk', 'aid', 'sid', 'content_hash').iterator():
+    num_existing += 1
+    prediction = predictions.get((aid, sid))
+    # Duplicates of a sentence are removed as well
+    if prediction is None or (aid, sid) in seen:
+      to_end.append(pk)
+      continue
+    seen.add((aid, sid))
+    if prediction[1] != content_hash:
+      to_end.append(pk)
+      to_create.append((aid, sid))
+      num_changed += 1
+
+  for key in predictions:
+    if key not in seen:
+      to_create.append(key)
+
+  # Add the new tokens of all changed sentences to the vocabulary at once
+  VOCABULARY.intern([t for key in to_create for t in predictions[key][0]['tokens']])
+
+  rows = []
+  for (aidx, sidx) in to_create:
+    content, content_hash = predictions[(aidx, sidx)]
+    fields = PredictedSentenceInformation.encode(**content)
+    rows.append(PredictedSentenceInformation(
+      program=program,
+      benchmark=benchmark,
+      aid=aidx,
+      sid=sidx,
+      content_hash=content_hash,
+      valid_from=version.pk,
+      **fields
+    ))
+
+  with transaction.atomic():
+    if len(to_end) == num_existing:
+      existing.update(valid_to=version.pk)
+    else:
+      for start in range(0, len(to_end), 1000):
+        PredictedSentenceInformation.objects.filter(pk__in=to_end[start:start + 1000]).update(valid_to=version.pk)
+    PredictedSentenceInformation.objects.bulk_create(rows, batch_size=1000)
+
+  print("Saved predictions: %d inserted, %d changed, %d removed, %d unchanged" % (
+    len(rows) - num_changed, num_changed, len(to_end) - num_changed, len(seen) - num_changed))
+  return len(rows) + len(to_end)
 
 def receive_sentences_for_benchmark_new(benchmark, sidx_value, aidx_value):
   sentences = InternalSentenceInformation.objects.filter(benchmark=benchmark, aidx=aidx_value, sidx=sidx_value).order_by('aidx', 'sidx')
 
-  return sentences
+  return preload_vocabulary(sentences)
 
 def receive_predictions_for_benchmark_new(benchmark, program, sidx_value, aidx_value):
-  predictions = PredictedSentenceInformation.objects.filter(program=program, benchmark=benchmark, aid=aidx_value, sid=sidx_value).order_by('aid', 'sid')
+  predictions = visible_predictions(program, benchmark).filter(aid=aidx_value, sid=sidx_value).order_by('aid', 'sid')
+
+  return preload_vocabulary(predictions)
+
+def receive_predictions_of_programs_new(benchmark, programs, sidx_value, aidx_value):
+  predictions = visible_predictions_of_programs(programs, benchmark).filter(aid=aidx_value, sid=sidx_value).order_by('aid', 'sid')
 
-  return predictions
+  return preload_vocabulary(predictions)
 
 def receive_all_sentences_for_benchmark(benchmark):
   sentences = InternalSentenceInformation.objects.filter(benchmark=benchmark).order_by('aidx', 'sidx')
 
-  return sentences
+  return preload_vocabulary(sentences)
 
 def receive_all_predictions_for_benchmark(benchmark, program):
-  predictions = PredictedSentenceInformation.objects.filter(program=program, benchmark=benchmark).order_by('aid', 'sid')
+  predictions = visible_predictions(program, benchmark).order_by('aid', 'sid')
+
+  return preload_vocabulary(predictions)
+
+def receive_all_predictions_of_programs(benchmark, programs):
+  predictions = visible_predictions_of_programs(programs, benchmark).order_by('aid', 'sid')
 
-  return predictions
+  return preload_vocabulary(predictions)
 
 
 ##
@@ -283,9 +385,9 @@ def receive_all_predictions_for_benchmark(benchmark, program):
 def receive_sentences_for_benchmark(benchmark):
   sentences = InternalSentenceInformation.objects.filter(benchmark=benchmark).order_by('aidx', 'sidx')
 
-  return sentences
+  return preload_vocabulary(sentences)
 
 def receive_predictions_for_benchmark(benchmark, program):
-  predictions = PredictedSentenceInformation.objects.filter(program=program, benchmark=benchmark).order_by('aid', 'sid')
+  predictions = visible_predictions(program, benchmark).order_by('aid', 'sid')
 
-  return predictions
\ No newline at end of file
+  return preload_vocabulary(predictions)
\ No newline at end of file
@@ -6,59 +6,166 @@
 # Python v2.7.10
 
 import regex as re
+import os
 import sys
-import random
 import math
 import string
+import shutil
+import hashlib
+import tempfile
 import numpy as np
 
+TRAININGFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'unabom.txt')
+
+# Version of the stored model artifacts, has to be increased whenever the training changes
+HMM_ARTIFACT_VERSION = 3
+
+# Content hashes of the training files, per (path, size, modification time)
+TRAINING_FILE_HASHES = {}
+
+SURROUNDING_CHARS = {
+  'a': ['q', 'w', 's', 'x', 'z'],
+  'b': ['f', 'g', 'h', 'n', 'v'],
+  'c': ['x', 's', 'd', 'f', 'v'],
+  'd': ['w', 'e', 'r', 's', 'f', 'x', 'c', 'v'],
+  'e': ['w', 'r', 's', 'd', 'f'],
+  'f': ['e', 'r', 't', 'd', 'g', 'c', 'v', 'b'],
+  'g': ['r', 't', 'y', 'f', 'h', 'v', 'b', 'n'],
+  'h': ['t', 'y', 'u', 'g', 'j', 'b', 'n', 'm'],
+  'i': ['u', 'o', 'j', 'k', 'l'],
+  'j': ['y', 'u', 'i', 'h', 'k', 'n', 'm'],
+  'k': ['u', 'i', 'o', 'j', 'l', 'm'],
+  'l': ['i', 'o', 'p', 'k'],
+  'm': ['n', 'h', 'j', 'k'],
+  'n': ['b', 'g', 'h', 'j', 'm'],
+  'o': ['i', 'k', 'l', 'p'],
+  'p': ['o', 'l'],
+  'q': ['a', 's', 'w'],
+  'r': ['e', 'd', 'f', 'g', 't'],
+  's': ['q', 'w', 'e', 'a', 'd', 'z', 'x', 'c'],
+  't': ['r', 'y', 'f', 'g', 'h'],
+  'u': ['y', 'i', 'h', 'j', 'k'],
+  'v': ['d', 'f', 'g', 'c', 'b'],
+  'w': ['q', 'e', 'a', 's', 'd'],
+  'x': ['a', 's', 'd', 'z', 'c'],
+  'y': ['t', 'u', 'g', 'h', 'j'],
+  'z': ['a', 's', 'x'],
+  'A': ['Q', 'W', 'S', 'X', 'Z'],
+  'B': ['F', 'G', 'H', 'N', 'V'],
+  'C': ['X', 'S', 'D', 'F', 'V'],
+  'D': ['W', 'E', 'R', 'S', 'F', 'X', 'C', 'V'],
+  'E': ['W', 'R', 'S', 'D', 'F'],
+  'F': ['E', 'R', 'T', 'D', 'G', 'C', 'V', 'B'],
+  'G': ['R', 'T', 'Y', 'F', 'H', 'V', 'B', 'N'],
+  'H': ['T', 'Y', 'U', 'G', 'J', 'B', 'N', 'M'],
+  'I': ['U', 'O', 'J', 'K', 'L'],
+  'J': ['Y', 'U', 'I', 'H', 'K', 'N', 'M'],
+  'K': ['U', 'I', 'O', 'J', 'L', 'M'],
+  'L': ['I', 'O', 'P', 'K'],
+  'M': ['N', 'H', 'J', 'K'],
+  'N': ['B', 'G', 'H', 'J', 'M'],
+  'O': ['I', 'K', 'L', 'P'],
+  'P': ['O', 'L'],
+  'Q': ['A', 'S', 'W'],
+  'R': ['E', 'D', 'F', 'G', 'T'],
+  'S': ['Q', 'W', 'E', 'A', 'D', 'Z', 'X', 'C'],
+  'T': ['R', 'Y', 'F', 'G', 'H'],
+  'U': ['Y', 'I', 'H', 'J', 'K'],
+  'V': ['D', 'F', 'G', 'C', 'B'],
+  'W': ['Q', 'E', 'A', 'S', 'D'],
+  'X': ['A', 'S', 'D', 'Z', 'C'],
+  'Y': ['T', 'U', 'G', 'H', 'J'],
+  'Z': ['A', 'S', 'X'],
+  '0': ['9'],
+  '9': ['8', '0'],
+  '8': ['7', '9'],
+  '7': ['6', '8'],
+  '6': ['5', '7'],
+  '5': ['4', '6'],
+  '4': ['3', '5'],
+  '3': ['2', '4'],
+  '2': ['1', '3'],
+  '1': ['2'],
+  '"': [':', '?', '{', '}'],
+  '<': ['m', '>', 'L', 'K'],
+  '>': ['<', 'L', ':'],
+  ',': ['m', 'k', 'l', '.'],
+  '.': [',', 'l', ';', '/'],
+  ';': ['l', 'p', '[', ']', '`'],
+  '[': ['p', ';', '`'],
+  ']': ['[', '`'],
+  '?': ['>', '"', ':'],
+  '!': ['@', '~'],
+  '~': ['!'],
+  '\\': [']'],
+  '@': ['!', '#'],
+  '#': ['@', '$'],
+  '$': ['#', '%'],
+  '^': ['$', '&'],
+  '&': ['^', '*'],
+  '*': ['&', '('],
+  '(': ['*', ')'],
+  ')': ['(', '_'],
+  '_': [')', '+'],
+  '+': ['_'],
+  '-': ['0', '='],
+  '=': ['-']
+}
+
 
 class Viterbi:
-  def __init__(self, probEmission, probTransition, testSet):
-    self.delta = []
+  def __init__(self, probEmission, probTransition, testSet, logEmission=None, logTransition=None):
+    self.delta = None
     self.states = list(string.ascii_lowercase + string.ascii_uppercase)
     self.symbols = list(string.ascii_lowercase + string.ascii_uppercase)
+    self.symbolIndices = {symbol: idx for idx, symbol in enumerate(self.symbols)}
     self.corruptedTestSet = testSet
     self.emissionProbabilities = probEmission
     self.transitionProbabilities = probTransition
     self.initialProbabilities = float(1)/len(self.states)      # Same initial probabilities for every states
 
+    # All log probabilities are computed once, each time step is a single broadcast then
+    self.logEmission = np.asarray(logEmission if logEmission is not None else logMatrix(probEmission))
+    self.logTransition = np.asarray(logTransition if logTransition is not None else logMatrix(probTransition))
+    self.logInitial = math.log(self.initialProbabilities)
+
     self.FN = 0
     self.TP = 0
     self.totalWords = 0
     self.FP = 0
 
-  def calculateInitialDelta(self, symbolChar):
-    self.delta = []
-    for i in range(0, len(self.states)):
-      init = self.initialProbabilities
-      emission = self.emissionProbabilities[i][self.symbols.index(symbolChar)]
-      self.delta.append(math.log(emission) + math.log(init))
-
-  def calculateDelta(self, symChar):
-    backTrack = [None] * len(self.states)
-    deltaTemp = [None] * len(self.states)
-    for j in range(0, len(self.states)):
-      maxValue = None
-      for i in range(0, len(self.states)):
-        transition = self.transitionProbabilities[i][j]
-        mul = self.delta[i] + math.log(transition)
-        if (maxValue is None or mul > maxValue):
-          maxValue = mul
-          backTrack[j] = self.symbols[i]
-      deltaCalc = maxValue + math.log((self.emissionProbabilities[j][self.symbols.index(symChar)]))
-      deltaTemp[j] = deltaCalc
-    self.delta = deltaTemp
+  def encode(self, word):
+    """
+    Returns the symbol indices of all characters of ``word``.
+    """
+    indices = []
+    for symChar in word:
+      if symChar not in self.symbolIndices:
+        raise ValueError("'{}' is not a known symbol".format(symChar))
+      indices.append(self.symbolIndices[symChar])
+    return indices
+
+  def calculateInitialDelta(self, symbolIdx):
+    self.delta = self.logEmission[:, symbolIdx] + self.logInitial
+
+  def calculateDelta(self, symbolIdx):
+    # mul[i][j]: delta of state i followed by the transition i -> j
+    mul = self.delta[:, np.newaxis] + self.logTransition
+    backTrack = np.argmax(mul, axis=0)
+    self.delta = mul[backTrack, np.arange(len(self.states))] + self.logEmission[:, symbolIdx]
     return backTrack
 
   def correctedWord(self, backTrack):
-    temp = self.delta.index(max(self.delta))
+    """
+    Returns the most probable word, ``backTrack`` holds the back pointers of every time step
+    after the first one.
+    """
+    temp = int(np.argmax(self.delta))
     word = [self.symbols[temp]]
-    if (backTrack):
-      for l in backTrack:
-        word.append(l[temp])
-        temp = self.states.index(l[temp])
-      word.reverse()
+    for l in reversed(backTrack):
+      temp = int(l[temp])
+      word.append(self.symbols[temp])
+    word.reverse()
     return ''.join(word)
 
   def process(self, testSet):
@@ -70,23 +177,69 @@ class Viterbi:
 
     #testSet = [x for x in testSet if x.isalpha()]
     result = []
-    counter = 0
     for word in testSet:
-      # print "==============================="
-      # print "Actual:", testSet[counter]
-      # print "Corrupted:", word
-      backtrack = []
-      for i in range(0, len(word)):
-        symChar = word[i]
-        if (i is 0):
-          self.calculateInitialDelta(symChar)
-        else:
-          backtrack.insert(0, self.calculateDelta(symChar))
+      if len(word) == 0:
+        result.append(word)
+        continue
+      symbolIndices = self.encode(word)
+      self.calculateInitialDelta(symbolIndices[0])
+      backtrack = [self.calculateDelta(symbolIdx) for symbolIdx in symbolIndices[1:]]
 
       result.append(self.correctedWord(backtrack))
 
     return result
 
+  def processBatch(self, testSet, batchSize=1024):
+    """
+    Corrects all words of ``testSet`` at once. Every distinct word is decoded only once and
+    words of equal length are decoded together over a (batch, states) lattice. Words containing
+    unknown symbols are returned unchanged.
+    """
+    uniqueWords = {}
+    for word in testSet:
+      if word not in uniqueWords:
+        uniqueWords[word] = word
+
+    # Group all decodable words by their length
+    byLength = {}
+    for word in uniqueWords:
+      if len(word) > 0 and all(symChar in self.symbolIndices for symChar in word):
+        byLength.setdefault(len(word), []).append(word)
+
+    for length, words in byLength.items():
+      for offset in range(0, len(words), batchSize):
+        batch = words[offset:offset + batchSize]
+        observations = np.array([[self.symbolIndices[symChar] for symChar in word] for word in batch])
+        for word, corrected in zip(batch, self.decodeBatch(observations)):
+          uniqueWords[word] = corrected
+
+    return [uniqueWords[word] for word in testSet]
+
+  def decodeBatch(self, observations):
+    """
+    Decodes a (batch, length) array of symbol indices, returns the corrected words.
+    """
+    numWords, length = observations.shape
+    numStates = len(self.states)
+    batchIdx = np.arange(numWords)[:, np.newaxis]
+    stateIdx = np.arange(numStates)[np.newaxis, :]
+
+    delta = self.logEmission[:, observations[:, 0]].T + self.logInitial
+    backTrack = np.empty((length - 1, numWords, numStates), dtype=np.intp)
+    for t in range(1, length):
+      # mul[b][i][j]: delta of state i followed by the transition i -> j for word b
+      mul = delta[:, :, np.newaxis] + self.logTransition
+      backTrack[t - 1] = np.argmax(mul, axis=1)
+      delta = mul[batchIdx, backTrack[t - 1], stateIdx] + self.logEmission[:, observations[:, t]].T
+
+    path = np.empty((numWords, length), dtype=np.intp)
+    path[:, -1] = np.argmax(delta, axis=1)
+    for t in range(length - 2, -1, -1):
+      path[:, t] = backTrack[t][np.arange(numWords), path[:, t + 1]]
+
+    symbols = np.array(self.symbols)
+    return [''.join(row) for row in symbols[path]]
+
 
 class SpellingCorrection:
 
@@ -96,18 +249,36 @@ class SpellingCorrection:
   corruptedTrainingSet = []
   corruptedTestSet = []
 
-  def __init__(self):
+  def __init__(self, seed=None, corruptionRate=0.2):
+    self.random = np.random.default_rng(seed)
+    self.seed = seed
+    self.corruptionRate = corruptionRate
     self.wordsList = []
     self.alphabets = string.ascii_lowercase + string.ascii_uppercase
     self.Aij = None#np.zeros((len(self.length), len(self.length)), dtype=int)
     self.Eis = None#np.zeros((len(self.length), len(self.length)), dtype=int)
     self.probAij = None#np.zeros((len(self.length), len(self.length)), dtype=float)
     self.probEis = None#np.zeros((len(self.length), len(self.length)), dtype=float)
+    self.logAij = None
+    self.logEis = None
     self.length = 0
-    self.surroundingChars = {}
-
-
-  def readFromFile(self, fileName ='./data/unabom.txt'):
+    self.surroundingChars = SURROUNDING_CHARS
+
+    # Integer encoding of the symbols, unknown bytes are mapped to -1
+    self.alphabetBytes = np.frombuffer(self.alphabets.encode('ascii'), dtype=np.uint8)
+    self.symbolLookup = np.full(256, -1, dtype=np.intp)
+    self.symbolLookup[self.alphabetBytes] = np.arange(len(self.alphabets))
+    # Lookup table of the surrounding characters of every symbol
+    maxNeighbours = max(len(self.surroundingChars[symbol]) for symbol in self.alphabets)
+    self.neighbours = np.zeros((len(self.alphabets), maxNeighbours), dtype=np.intp)
+    self.numNeighbours = np.zeros(len(self.alphabets), dtype=np.intp)
+    for idx, symbol in enumerate(self.alphabets):
+      surrounding = [self.alphabets.index(c) for c in self.surroundingChars[symbol]]
+      self.neighbours[idx, :len(surrounding)] = surrounding
+      self.numNeighbours[idx] = len(surrounding)
+
+
+  def readFromFile(self, fileName=TRAININGFILE):
     """
     Read dataset from the filename.
     """
@@ -120,13 +291,13 @@ class SpellingCorrection:
     """
     self.wordsList = re.findall(r'\w+', self.doc)
 
-  def splitDocument(self):
+  def splitDocument(self, fileName=TRAININGFILE):
     """
     Splits the document into training set (80%) and test set (20%)
     """
     # self.readFromFile('basicTest.txt')
     # self.readFromFile('testdata.txt')
-    self.readFromFile()
+    self.readFromFile(fileName)
     self.splitToWords()
     indexSplit = int(0.8 * len(self.wordsList))
     # splits into training set and test set
@@ -139,150 +310,55 @@ class SpellingCorrection:
     """
     Corrupts the text and updates the emission count and transition count if it is training set
     """
-    corruptedlist = []
-    self.surroundingChars = {
-      'a': ['q', 'w', 's', 'x', 'z'],
-      'b': ['f', 'g', 'h', 'n', 'v'],
-      'c': ['x', 's', 'd', 'f', 'v'],
-      'd': ['w', 'e', 'r', 's', 'f', 'x', 'c', 'v'],
-      'e': ['w', 'r', 's', 'd', 'f'],
-      'f': ['e', 'r', 't', 'd', 'g', 'c', 'v', 'b'],
-      'g': ['r', 't', 'y', 'f', 'h', 'v', 'b', 'n'],
-      'h': ['t', 'y', 'u', 'g', 'j', 'b', 'n', 'm'],
-      'i': ['u', 'o', 'j', 'k', 'l'],
-      'j': ['y', 'u', 'i', 'h', 'k', 'n', 'm'],
-      'k': ['u', 'i', 'o', 'j', 'l', 'm'],
-      'l': ['i', 'o', 'p', 'k'],
-      'm': ['n', 'h', 'j', 'k'],
-      'n': ['b', 'g', 'h', 'j', 'm'],
-      'o': ['i', 'k', 'l', 'p'],
-      'p': ['o', 'l'],
-      'q': ['a', 's', 'w'],
-      'r': ['e', 'd', 'f', 'g', 't'],
-      's': ['q', 'w', 'e', 'a', 'd', 'z', 'x', 'c'],
-      't': ['r', 'y', 'f', 'g', 'h'],
-      'u': ['y', 'i', 'h', 'j', 'k'],
-      'v': ['d', 'f', 'g', 'c', 'b'],
-      'w': ['q', 'e', 'a', 's', 'd'],
-      'x': ['a', 's', 'd', 'z', 'c'],
-      'y': ['t', 'u', 'g', 'h', 'j'],
-      'z': ['a', 's', 'x'],
-      'A': ['Q', 'W', 'S', 'X', 'Z'],
-      'B': ['F', 'G', 'H', 'N', 'V'],
-      'C': ['X', 'S', 'D', 'F', 'V'],
-      'D': ['W', 'E', 'R', 'S', 'F', 'X', 'C', 'V'],
-      'E': ['W', 'R', 'S', 'D', 'F'],
-      'F': ['E', 'R', 'T', 'D', 'G', 'C', 'V', 'B'],
-      'G': ['R', 'T', 'Y', 'F', 'H', 'V', 'B', 'N'],
-      'H': ['T', 'Y', 'U', 'G', 'J', 'B', 'N', 'M'],
-      'I': ['U', 'O', 'J', 'K', 'L'],
-      'J': ['Y', 'U', 'I', 'H', 'K', 'N', 'M'],
-      'K': ['U', 'I', 'O', 'J', 'L', 'M'],
-      'L': ['I', 'O', 'P', 'K'],
-      'M': ['N', 'H', 'J', 'K'],
-      'N': ['B', 'G', 'H', 'J', 'M'],
-      'O': ['I', 'K', 'L', 'P'],
-      'P': ['O', 'L'],
-      'Q': ['A', 'S', 'W'],
-      'R': ['E', 'D', 'F', 'G', 'T'],
-      'S': ['Q', 'W', 'E', 'A', 'D', 'Z', 'X', 'C'],
-      'T': ['R', 'Y', 'F', 'G', 'H'],
-      'U': ['Y', 'I', 'H', 'J', 'K'],
-      'V': ['D', 'F', 'G', 'C', 'B'],
-      'W': ['Q', 'E', 'A', 'S', 'D'],
-      'X': ['A', 'S', 'D', 'Z', 'C'],
-      'Y': ['T', 'U', 'G', 'H', 'J'],
-      'Z': ['A', 'S', 'X'],
-      '0': ['9'],
-      '9': ['8', '0'],
-      '8': ['7', '9'],
-      '7': ['6', '8'],
-      '6': ['5', '7'],
-      '5': ['4', '6'],
-      '4': ['3', '5'],
-      '3': ['2', '4'],
-      '2': ['1', '3'],
-      '1': ['2'],
-      '"': [':', '?', '{', '}'],
-      '<': ['m', '>', 'L', 'K'],
-      '>': ['<', 'L', ':'],
-      ',': ['m', 'k', 'l', '.'],
-      '.': [',', 'l', ';', '/'],
-      ';': ['l', 'p', '[', ']', '`'],
-      '[': ['p', ';', '`'],
-      ']': ['[', '`'],
-      '?': ['>', '"', ':'],
-      '!': ['@', '~'],
-      '~': ['!'],
-      '\\': [']'],
-      '@': ['!', '#'],
-      '#': ['@', '$'],
-      '$': ['#', '%'],
-      '^': ['$', '&'],
-      '&': ['^', '*'],
-      '*': ['&', '('],
-      '(': ['*', ')'],
-      ')': ['(', '_'],
-      '_': [')', '+'],
-      '+': ['_'],
-      '-': ['0', '='],
-      '=': ['-']
-    }
-    self.length = len(self.alphabets)
-    self.Aij = np.zeros((self.length, self.length), dtype=int)
-    self.Eis = np.zeros((self.length, self.length), dtype=int)
-    self.probAij = np.zeros((self.length, self.length), dtype=float)
-    self.probEis = np.zeros((self.length, self.length), dtype=float)
-    for word in wordList:
-      tempWord = ""
-      if (word.isalpha()):
-        for i in range(0, len(word)):
-          r = random.uniform(0, 1)
-          # To corrupt the letter if the random value generated is less than threshold
-          if (r < 0.2):
-            tempWord += random.choice(self.surroundingChars[word[i]] if word[i] in self.surroundingChars else [''])
-            # tempWord += random.choice(string.ascii_lowercase)
-          else:
-            tempWord += word[i]
-          # updates the count for emission probability and transition probability
-          if (isTrainingSet):
-            self.incrEmissionCount(word[i], tempWord[i])
-            # Keep track of the transitions from state i to state j
-            if (i is not len(word)-1):
-              # count the transition from state i to state j
-              self.incrTransitionCount(word[i], word[i+1])
-
-          corruptedlist.append(tempWord.strip())
-
-    return corruptedlist
-
-  def incrTransitionCount(self, stateI, stateJ):
-    if (stateJ in self.surroundingChars and stateI in self.surroundingChars):
-      self.Aij[list(self.surroundingChars).index(stateI)][list(self.surroundingChars).index(stateJ)] += 1
-
-  def incrEmissionCount(self, currentSymbol, symbolS):
-    if (symbolS in self.surroundingChars and currentSymbol in self.surroundingChars):
-      self.Eis[list(self.surroundingChars).index(currentSymbol)][list(self.surroundingChars).index(symbolS)] += 1
+    codes, chars, lengths = self.encodeWords(wordList)
+    wordIds = np.repeat(np.arange(len(lengths)), lengths)
+    # Characters that are no symbols (e.g. accented letters) are neither corrupted nor counted
+    known = chars >= 0
+    symbols = np.where(known, chars, 0)
+
+    # To corrupt the letter if the random value generated is less than threshold, the
+    # replacement is one of the surrounding characters on the keyboard
+    corrupt = self.random.random(len(chars)) < self.corruptionRate
+    choice = (self.random.random(len(chars)) * self.numNeighbours[symbols]).astype(np.intp)
+    corrupted = np.where(corrupt, self.neighbours[symbols, choice], symbols)
+
+    # updates the count for emission probability and transition probability
+    if (isTrainingSet):
+      self.length = len(self.alphabets)
+      self.Aij = np.zeros((self.length, self.length), dtype=int)
+      self.Eis = np.zeros((self.length, self.length), dtype=int)
+      np.add.at(self.Eis, (chars[known], corrupted[known]), 1)
+      # count the transition from state i to state j, between adjacent symbols of a word only
+      sameWord = (wordIds[:-1] == wordIds[1:]) & known[:-1] & known[1:]
+      np.add.at(self.Aij, (chars[:-1][sameWord], chars[1:][sameWord]), 1)
+
+    corruptedCodes = np.where(known, self.alphabetBytes[corrupted], codes).astype('<u4')
+    corruptedText = corruptedCodes.tobytes().decode('utf-32-le')
+    ends = np.cumsum(lengths).tolist()
+    return [corruptedText[end - length:end] for end, length in zip(ends, lengths.tolist())]
+
+  def encodeWords(self, wordList):
+    """
+    Returns the code points of all characters of the words made up of letters, their symbol
+    indices (-1 for characters that are no symbols) and the lengths of these words.
+    """
+    words = [word for word in wordList if word.isalpha()]
+    lengths = np.array([len(word) for word in words], dtype=np.intp)
+    codes = np.frombuffer(''.join(words).encode('utf-32-le'), dtype='<u4')
+    chars = np.full(len(codes), -1, dtype=np.intp)
+    isByte = codes < len(self.symbolLookup)
+    chars[isByte] = self.symbolLookup[codes[isByte]]
+    return codes, chars, lengths
 
   def probabilityAij(self):
-    for i in range(0, self.length):
-      # Smoothing (helps to add the transition from the state where there is no count in training set
-      if (0 in self.Aij[i]):
-        self.Aij[i] = [x+1 for x in self.Aij[i]]
-      sum = self.Aij[i].sum()
-      # print self.Aij[i], self.alphabets[i], sum
-      for j in range(0, self.length):
-        self.probAij[i][j] = float(self.Aij[i][j]) / sum
+    # Smoothing (helps to add the transition from the state where there is no count in training set
+    self.Aij[(self.Aij == 0).any(axis=1)] += 1
+    self.probAij = self.Aij / self.Aij.sum(axis=1, keepdims=True)
 
   def probabilityEmission(self):
-    for i in range(0, self.length):
-      # Smoothing (helps to add the transition from the state where there is no count in training set
-      if (0 in self.Eis[i]):
-        self.Eis[i] = [x+1 for x in self.Eis[i]]
-      sum = self.Eis[i].sum()
-      # print self.alphabets[i], sum
-      for j in range(0, self.length):
-        self.probEis[i][j] = float(self.Eis[i][j]) / sum
+    # Smoothing (helps to add the transition from the state where there is no count in training set
+    self.Eis[(self.Eis == 0).any(axis=1)] += 1
+    self.probEis = self.Eis / self.Eis.sum(axis=1, keepdims=True)
 
   def getEmissionProbabilities(self):
     return self.probEis
@@ -290,8 +366,42 @@ class SpellingCorrection:
   def getTransitionProbabilities(self):
     return self.probAij
 
-  def trainHMModel(self):
-    self.splitDocument()
+  def getLogEmissionProbabilities(self):
+    return self.logEis
+
+  def getLogTransitionProbabilities(self):
+    return self.logAij
+
+  def probabilityLogs(self):
+    self.logAij = logMatrix(self.probAij)
+    self.logEis = logMatrix(self.probEis)
+
+  def saveModel(self, path):
+    """
+    Stores the trained matrices as .npy files within the directory ``path``.
+    """
+    parent = os.path.dirname(os.path.normpath(path))
+    os.makedirs(parent, exist_ok=True)
+    # Write into a temporary directory first, so concurrent runs never see partial artifacts
+    tmpPath = tempfile.mkdtemp(dir=parent)
+    for name in ['probAij', 'probEis', 'logAij', 'logEis']:
+      np.save(os.path.join(tmpPath, name + '.npy'), getattr(self, name))
+    try:
+      os.rename(tmpPath, path)
+    except OSError:
+      # Someone else was faster, keep their artifacts
+      shutil.rmtree(tmpPath)
+
+  def loadModel(self, path):
+    """
+    Loads the matrices stored by saveModel from the directory ``path``.
+    """
+    for name in ['probAij', 'probEis', 'logAij', 'logEis']:
+      setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+    self.length = self.probAij.shape[0]
+
+  def trainHMModel(self, fileName=TRAININGFILE):
+    self.splitDocument(fileName)
     # Corrupt the text splited for training set and test set
     self.corruptedTrainingSet = self.corruptText(self.trainingSet, True)
     # Calculate the probability for transition from state i to state j
@@ -299,3 +409,47 @@ class SpellingCorrection:
 
     self.probabilityAij()
     self.probabilityEmission()
+    self.probabilityLogs()
+
+
+def logMatrix(matrix):
+  """
+  Element-wise natural logarithm, computed with math.log to match the values the Viterbi
+  decoder would compute for every single cell.
+  """
+  return np.array([[math.log(x) for x in row] for row in matrix], dtype=float)
+
+def hashFile(fileName):
+  """
+  Returns the SHA-1 of the content of the training file, the file is only read again once its
+  path, size or modification time changed.
+  """
+  stat = os.stat(fileName)
+  key = (os.path.realpath(fileName), stat.st_size, stat.st_mtime_ns)
+  if key not in TRAINING_FILE_HASHES:
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as fin:
+      for chunk in iter(lambda: fin.read(1 << 20), b''):
+        sha.update(chunk)
+    TRAINING_FILE_HASHES[key] = sha.hexdigest()
+  return TRAINING_FILE_HASHES[key]
+
+def modelArtifactPath(cacheDir, fileName, seed, corruptionRate):
+  """
+  Returns the directory of the model artifacts for the given training file, seed and corruption rate.
+  """
+  return os.path.join(cacheDir, 'v{}-{}-s{}-r{}'.format(HMM_ARTIFACT_VERSION, hashFile(fileName), seed, corruptionRate))
+
+def loadHMModel(cacheDir, fileName=TRAININGFILE, seed=0, corruptionRate=0.2):
+  """
+  Returns a trained SpellingCorrection. The model is only trained if there are no stored
+  artifacts for the training file, seed and corruption rate yet, otherwise these are loaded.
+  """
+  objSC = SpellingCorrection(seed, corruptionRate)
+  path = modelArtifactPath(cacheDir, fileName, seed, corruptionRate)
+  if os.path.isdir(path):
+    objSC.loadModel(path)
+  else:
+    objSC.trainHMModel(fileName)
+    objSC.saveModel(path)
+  return objSC
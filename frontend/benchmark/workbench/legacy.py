@@ -0,0 +1,124 @@
+'''
+Conversion of the sentence tables written before the tokens were packed (see
+workbench.vocabulary). Their tokens were ArrayField columns on PostgreSQL, the migration that
+replaces them with the packed columns drops them. A pre_migrate hook copies the old columns into
+side tables first, a post_migrate hook packs the copies into the new columns and drops the side
+tables, so the sentences and predictions survive the migration.
+
+A migration that does not replace the old columns (e.g. migrations generated again from scratch
+on a database that already has the tables) cannot be converted, the post_migrate hook stops the
+migration then instead of leaving the tables unreadable. Recreate the workbench tables, run
+initialize_internal_tables and upload the predictions again in that case.
+'''
+
+from django.db import connection, transaction
+
+from .partitions import table_exists
+
+# Rows packed per query
+LEGACY_BATCH = 1000
+
+
+class LegacyTokensError(RuntimeError):
+  pass
+
+
+def parse_connections(text):
+  """
+  Returns the connections ``[(idx, [targets]), ...]`` of their old textual forms ``"0->3|1->4,5"``
+  and ``"0->[0]|1->[1, 2]"``.
+  """
+  connections = []
+  for connection_text in (text or "").split("|"):
+    if connection_text == "":
+      continue
+    idx, targets = connection_text.split("->")
+    connections.append((int(idx), [int(t) for t in targets.strip("[]").split(",") if t.strip() != ""]))
+  return connections
+
+def pack_sentence(src_tokens, grt_tokens, types, connections):
+  from .models import InternalSentenceInformation
+
+  return InternalSentenceInformation.encode(src_tokens or [], grt_tokens or [], types or [], parse_connections(connections))
+
+def pack_prediction(tokens, corrected, src_connections, tgt_connections):
+  from .models import PredictedSentenceInformation
+  from .helpers import prediction_content_hash
+
+  content = {
+    'tokens': tokens or [],
+    'corrected': [c == "true" for c in corrected or []],
+    'src_connections': parse_connections(src_connections),
+    'tgt_connections': parse_connections(tgt_connections)
+  }
+  fields = PredictedSentenceInformation.encode(**content)
+  fields['content_hash'] = prediction_content_hash(**content)
+  return fields
+
+def legacy_tables():
+  """
+  Returns the sentence models with their old token columns and the function packing them.
+  """
+  from .models import InternalSentenceInformation, PredictedSentenceInformation
+
+  return [
+    (InternalSentenceInformation, ('src_tokens', 'grt_tokens', 'types', 'connections'), pack_sentence),
+    (PredictedSentenceInformation, ('tokens', 'corrected', 'src_connections', 'tgt_connections'), pack_prediction)
+  ]
+
+def saved_table(model):
+  return model._meta.db_table + "_legacy_tokens"
+
+def has_columns(cursor, table, columns):
+  return set(columns).issubset(c.name for c in connection.introspection.get_table_description(cursor, table))
+
+
+def save_legacy_tokens(sender=None, **kwargs):
+  """
+  pre_migrate hook, copies the old token columns of the sentence tables into side tables.
+  """
+  if connection.vendor != 'postgresql':
+    return
+  with transaction.atomic(), connection.cursor() as cursor:
+    for model, columns, pack in legacy_tables():
+      table = model._meta.db_table
+      if not table_exists(cursor, table) or not has_columns(cursor, table, columns) or table_exists(cursor, saved_table(model)):
+        continue
+      print("Save the token columns of %s ..." % (table))
+      cursor.execute('CREATE TABLE "{}" AS SELECT id, {} FROM "{}"'.format(saved_table(model), ", ".join(columns), table))
+
+def convert_legacy_tokens(sender=None, **kwargs):
+  """
+  post_migrate hook, packs the tokens saved by save_legacy_tokens into the new columns of their
+  rows and drops the side tables.
+
+  :raises LegacyTokensError: If the migration kept the old columns.
+  """
+  if connection.vendor != 'postgresql':
+    return
+  for model, columns, pack in legacy_tables():
+    table = model._meta.db_table
+    with transaction.atomic():
+      with connection.cursor() as cursor:
+        if not table_exists(cursor, saved_table(model)):
+          continue
+        if has_columns(cursor, table, columns):
+          raise LegacyTokensError(
+            "%s still has its token columns after migrating, they cannot be packed. Recreate the workbench tables, "
+            "run initialize_internal_tables and upload the predictions again (see workbench.legacy)" % (table))
+      print("Pack the token columns of %s ..." % (table))
+
+      num_rows = 0
+      with connection.chunked_cursor() as rows:
+        rows.execute('SELECT id, {} FROM "{}" ORDER BY id'.format(", ".join(columns), saved_table(model)))
+        while True:
+          batch = rows.fetchmany(LEGACY_BATCH)
+          if len(batch) == 0:
+            break
+          fields = [pack(*row[1:]) for row in batch]
+          packed = [model(pk=row[0], **row_fields) for row, row_fields in zip(batch, fields)]
+          model.objects.bulk_update(packed, list(fields[0].keys()), batch_size=LEGACY_BATCH)
+          num_rows += len(packed)
+      with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE "{}"'.format(saved_table(model)))
+      print("Packed the tokens of %d rows of %s" % (num_rows, table))
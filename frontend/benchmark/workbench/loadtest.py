@@ -0,0 +1,233 @@
+'''
+Load-test driver of a running frontend. Every worker thread logs in with its own session and
+repeatedly picks one of the scenarios (weighted by the mix):
+
+  upload     POST a prediction file to upload_results (runs the evaluator and the ingest)
+  sentence   the AJAX viewer of a single sentence (get_sentences_and_prediction_for_idx)
+  program    the AJAX viewer of all sentences of a program (get_sentences_and_prediction_for_program)
+  benchmark  the benchmark page
+
+The report contains the throughput and the p50/p95/p99 latency of every scenario. Use it together
+with the evaluator stand-in of stub_servers and a benchmark of the synthetic generator, e.g.:
+
+  python3 manage.py generate_benchmark /tmp/bench --articles 100
+  python3 -m workbench.stub_servers evaluator --port 1338 --latency 0.5
+  python3 manage.py loadtest --benchmark 1 --program 1 --prediction /tmp/bench/prediction.json
+'''
+
+import re
+import time
+import random
+import itertools
+import threading
+import ujson as json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+LOADTEST_SCENARIOS = ('upload', 'sentence', 'program', 'benchmark')
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def parse_mix(text):
+  """
+  Returns the scenario weights of a mix like 'upload=1,sentence=10'.
+  """
+  mix = {}
+  for entry in text.split(','):
+    if not entry.strip():
+      continue
+    name, _, weight = entry.partition('=')
+    name = name.strip()
+    if name not in LOADTEST_SCENARIOS:
+      raise ValueError("Unknown scenario '%s', use one of %s" % (name, ', '.join(LOADTEST_SCENARIOS)))
+    mix[name] = float(weight) if weight else 1.0
+  if not any(weight > 0 for weight in mix.values()):
+    raise ValueError("The mix does not contain any scenario")
+  return mix
+
+def prediction_sentences(filepath):
+  """
+  Returns the (aidx, sidx) of all sentences of a prediction file, the coordinates the sentence
+  viewer is asked for.
+  """
+  with open(filepath, 'r', encoding='utf-8') as fin:
+    content = json.loads(fin.read())
+  sentences = set()
+  for token in content["predictions"]:
+    nums = token["id"].split(".")
+    sentences.add((int(nums[0][1:]), int(nums[1][1:])))
+  return sorted(sentences)
+
+def percentile(samples, p):
+  """
+  Nearest-rank percentile of the sorted ``samples``.
+  """
+  if not samples:
+    return None
+  rank = max(1, int(-(-p * len(samples) // 100)))
+  return samples[min(rank, len(samples)) - 1]
+
+
+class LoadTest(object):
+  """
+  A load test against the frontend at ``base_url``. It runs until ``duration`` seconds passed or
+  ``num_requests`` requests were sent, whatever comes first.
+  """
+
+  def __init__(self, base_url, benchmark_id, program_id, prediction_file, username, password,
+               mix=None, concurrency=8, duration=30.0, num_requests=None, timeout=300, seed=0):
+    self.base_url = base_url.rstrip('/') + '/'
+    self.benchmark_id = benchmark_id
+    self.program_id = program_id
+    self.prediction_file = prediction_file
+    self.username = username
+    self.password = password
+    self.mix = mix or {'upload': 1, 'sentence': 10, 'program': 2, 'benchmark': 4}
+    self.concurrency = concurrency
+    self.duration = duration
+    self.num_requests = num_requests
+    self.timeout = timeout
+    self.seed = seed
+
+    self.sentences = prediction_sentences(prediction_file)
+    with open(prediction_file, 'rb') as fin:
+      self.prediction = fin.read()
+
+    self.lock = threading.Lock()
+    self.samples = {}
+    self.errors = {}
+    self.counter = None
+    self.deadline = None
+
+  def url(self, path):
+    return self.base_url + path
+
+  def login(self):
+    """
+    Returns a session logged in as the load-test user.
+    """
+    session = requests.Session()
+    response = session.get(self.url('accounts/login/'), timeout=self.timeout)
+    if response.status_code >= 400:
+      raise RuntimeError("Login page failed (status %d)" % (response.status_code))
+    response = session.post(self.url('accounts/login/'), data={
+      'username': self.username,
+      'password': self.password,
+      'csrfmiddlewaretoken': session.cookies.get('csrftoken', '')
+    }, headers={'Referer': self.url('accounts/login/')}, timeout=self.timeout)
+    if 'sessionid' not in session.cookies:
+      raise RuntimeError("Login as '%s' failed (status %d)" % (self.username, response.status_code))
+    return session
+
+  def upload(self, session, rnd):
+    path = 'bench/add_result/%d' % (self.benchmark_id)
+    form = session.get(self.url(path), timeout=self.timeout)
+    form.raise_for_status()
+    match = CSRF_INPUT.search(form.text)
+    token = match.group(1) if match else session.cookies.get('csrftoken', '')
+    return session.post(self.url(path), data={
+      'csrfmiddlewaretoken': token,
+      'benchmark': self.benchmark_id,
+      'program': self.program_id
+    }, files={'file': ('prediction.json', self.prediction)}, headers={'Referer': self.url(path)}, timeout=self.timeout)
+
+  def sentence(self, session, rnd):
+    aidx, sidx = rnd.choice(self.sentences)
+    return session.get(self.url('ajax/get_sentences_and_prediction_for_idx/'), params={
+      'benchmark': self.benchmark_id, 'value': sidx, 'aidx': aidx
+    }, timeout=self.timeout)
+
+  def program(self, session, rnd):
+    return session.get(self.url('ajax/get_sentences_and_prediction_for_program/'), params={
+      'benchmark': self.benchmark_id, 'program': self.program_id
+    }, timeout=self.timeout)
+
+  def benchmark(self, session, rnd):
+    return session.get(self.url('bench/%d/' % (self.benchmark_id)), timeout=self.timeout)
+
+  def record(self, scenario, seconds, error):
+    with self.lock:
+      self.samples.setdefault(scenario, []).append(seconds)
+      if error is not None:
+        self.errors.setdefault(scenario, []).append(error)
+
+  def worker(self, index):
+    rnd = random.Random("%d/%d" % (self.seed, index))
+    scenarios = [name for name in LOADTEST_SCENARIOS if self.mix.get(name, 0) > 0]
+    weights = [self.mix[name] for name in scenarios]
+    session = self.login()
+    while time.perf_counter() < self.deadline:
+      if self.num_requests is not None and next(self.counter) >= self.num_requests:
+        break
+      scenario = rnd.choices(scenarios, weights)[0]
+      error = None
+      start = time.perf_counter()
+      try:
+        response = getattr(self, scenario)(session, rnd)
+        if response.status_code >= 400:
+          error = "HTTP %d" % (response.status_code)
+      except requests.RequestException as e:
+        error = "%s: %s" % (type(e).__name__, e)
+      self.record(scenario, time.perf_counter() - start, error)
+
+  def run(self):
+    """
+    Runs the load test and returns its report.
+    """
+    self.samples = {}
+    self.errors = {}
+    self.counter = itertools.count()
+    start = time.perf_counter()
+    self.deadline = start + self.duration if self.duration else float('inf')
+    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+      # Raises the first failure of a worker, e.g. a failed login
+      for future in [executor.submit(self.worker, index) for index in range(self.concurrency)]:
+        future.result()
+    return self.report(time.perf_counter() - start)
+
+  def report(self, elapsed):
+    scenarios = {}
+    for scenario, samples in sorted(self.samples.items()):
+      samples = sorted(samples)
+      errors = self.errors.get(scenario, [])
+      scenarios[scenario] = {
+        "requests": len(samples),
+        "errors": len(errors),
+        "firstErrors": errors[:5],
+        "requestsPerSecond": len(samples) / elapsed,
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": samples[-1]
+      }
+    total = sorted(s for samples in self.samples.values() for s in samples)
+    return {
+      "baseUrl": self.base_url,
+      "concurrency": self.concurrency,
+      "mix": self.mix,
+      "seconds": elapsed,
+      "requests": len(total),
+      "errors": sum(len(errors) for errors in self.errors.values()),
+      "requestsPerSecond": len(total) / elapsed if elapsed > 0 else None,
+      "p50": percentile(total, 50),
+      "p95": percentile(total, 95),
+      "p99": percentile(total, 99),
+      "scenarios": scenarios
+    }
+
+def format_report(report):
+  lines = ["%-10s %8s %7s %9s %9s %9s %9s" % ("scenario", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms")]
+  rows = sorted(report["scenarios"].items()) + [("total", report)]
+  for name, result in rows:
+    if not result["requests"]:
+      continue
+    lines.append("%-10s %8d %7d %9.2f %9.1f %9.1f %9.1f" % (
+      name, result["requests"], result["errors"], result["requestsPerSecond"],
+      result["p50"] * 1000, result["p95"] * 1000, result["p99"] * 1000))
+  for name, result in sorted(report["scenarios"].items()):
+    for error in result["firstErrors"]:
+      lines.append("%s: %s" % (name, error))
+  return "\n".join(lines)
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from workbench.versions import collect_garbage
+
+
+class Command(BaseCommand):
+  help = 'Removes the result versions superseded for longer than RESULT_VERSION_GRACE seconds.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--loop', action='store_true', help='Collect every --interval seconds until stopped')
+    parser.add_argument('--interval', type=int, default=settings.RESULT_VERSION_INTERVAL)
+
+  def handle(self, *args, **options):
+    if not options['loop']:
+      collect_garbage()
+      return
+    try:
+      while True:
+        try:
+          collect_garbage()
+        except Exception as e:
+          print("WARNING: garbage collection of result versions failed: %s" % (e))
+          connection.close()
+        time.sleep(options['interval'])
+    except KeyboardInterrupt:
+      pass
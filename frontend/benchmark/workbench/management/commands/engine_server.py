@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from workbench.engine_server import EngineServer
+
+
+class Command(BaseCommand):
+  help = 'Runs the resident engine server, see workbench.engine_server.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--socket', default=settings.ENGINE_SERVER_SOCKET)
+    parser.add_argument('--workers', type=int, default=settings.ENGINE_SERVER_WORKERS)
+    parser.add_argument('--preload', default=','.join(settings.ENGINE_SERVER_PRELOAD), help='Comma separated engine names')
+    parser.add_argument('--languages', default=','.join(settings.ENGINE_SERVER_LANGUAGES), help='Comma separated language codes')
+
+  def handle(self, *args, **options):
+    preload = [name for name in options['preload'].split(',') if name]
+    lang_codes = [lang_code for lang_code in options['languages'].split(',') if lang_code]
+
+    server = EngineServer(options['socket'], options['workers'], preload, lang_codes)
+    print("Serving engines on %s with %d workers" % (options['socket'], options['workers']))
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      server.shutdown()
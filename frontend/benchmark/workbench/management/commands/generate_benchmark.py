@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workbench.synthetic import SyntheticBenchmark, SYNTHETIC_ERROR_TYPES
+
+
+class Command(BaseCommand):
+  help = 'Writes a synthetic benchmark (source, groundtruth, raw text, prediction, alignments and evaluation), see workbench.synthetic.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('directory')
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--sentences', default='5,15', help='Minimal and maximal number of sentences per article')
+    parser.add_argument('--tokens', default='8,24', help='Minimal and maximal number of words per sentence')
+    parser.add_argument('--errors', default='', help='Errors per type, e.g. NON_WORD=500,SPLIT=20 (types: %s)' % (', '.join(SYNTHETIC_ERROR_TYPES)))
+    parser.add_argument('--correction-rate', type=float, default=0.6)
+    parser.add_argument('--false-positive-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help='Processes writing the articles in parallel, the output does not depend on it')
+
+  def handle(self, *args, **options):
+    error_counts = None
+    if options['errors']:
+      error_counts = {}
+      for entry in options['errors'].split(','):
+        name, _, count = entry.partition('=')
+        error_counts[name.strip().upper()] = int(count)
+
+    try:
+      benchmark = SyntheticBenchmark(
+        options['articles'],
+        sentences_per_article=[int(n) for n in options['sentences'].split(',')],
+        tokens_per_sentence=[int(n) for n in options['tokens'].split(',')],
+        error_counts=error_counts,
+        correction_rate=options['correction_rate'],
+        false_positive_rate=options['false_positive_rate'],
+        seed=options['seed']
+      )
+    except ValueError as e:
+      raise CommandError(str(e))
+
+    start = time.perf_counter()
+    evaluation = benchmark.write(options['directory'], options['workers'])
+    print("Wrote %d articles, %d sentences and %d words to %s in %.1fs" % (
+      benchmark.num_articles, sum(benchmark.num_sentences), evaluation["evaluation"]["numWords"], options['directory'], time.perf_counter() - start))
@@ -0,0 +1,55 @@
+import os
+import ujson as json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workbench.loadtest import LoadTest, parse_mix, format_report, LOADTEST_SCENARIOS
+
+
+class Command(BaseCommand):
+  help = 'Sends concurrent uploads, viewer and benchmark page requests to a running frontend and reports throughput and latency percentiles, see workbench.loadtest.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--url', default='http://localhost:8000/', help='Base URL of the frontend')
+    parser.add_argument('--benchmark', type=int, required=True)
+    parser.add_argument('--program', type=int, required=True, help='Program (of the load-test user) the uploads are for')
+    parser.add_argument('--prediction', required=True, help='Prediction file to upload, its sentences are requested from the viewer')
+    parser.add_argument('--username', default=os.environ.get('LOADTEST_USERNAME', 'loadtest'))
+    parser.add_argument('--password', default=os.environ.get('LOADTEST_PASSWORD', ''))
+    parser.add_argument('--mix', default='upload=1,sentence=10,program=2,benchmark=4', help='Weights of the scenarios (%s)' % (', '.join(LOADTEST_SCENARIOS)))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run, 0 for no limit')
+    parser.add_argument('--requests', type=int, default=None, help='Total number of requests to send')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Also write the report as JSON')
+
+  def handle(self, *args, **options):
+    if not options['duration'] and options['requests'] is None:
+      raise CommandError("Limit the load test with --duration or --requests")
+    try:
+      mix = parse_mix(options['mix'])
+    except ValueError as e:
+      raise CommandError(str(e))
+
+    test = LoadTest(
+      options['url'],
+      options['benchmark'],
+      options['program'],
+      options['prediction'],
+      options['username'],
+      options['password'],
+      mix=mix,
+      concurrency=options['concurrency'],
+      duration=options['duration'],
+      num_requests=options['requests'],
+      seed=options['seed']
+    )
+    try:
+      report = test.run()
+    except RuntimeError as e:
+      raise CommandError(str(e))
+
+    print(format_report(report))
+    if options['output']:
+      with open(options['output'], 'w', encoding='utf-8') as fout:
+        fout.write(json.dumps(report, indent=2))
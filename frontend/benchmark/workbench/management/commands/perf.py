@@ -0,0 +1,45 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from workbench.perf import run_suite, compare, format_report, load_report, save_report
+
+
+class Command(BaseCommand):
+  help = 'Runs the microbenchmarks of the workbench hot paths and compares them against the baseline, see workbench.perf.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--sizes', default=','.join(str(s) for s in settings.PERF_SIZES), help='Comma separated corpus sizes in sentences')
+    parser.add_argument('--only', default='', help='Comma separated parts of the case names to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=settings.PERF_OUTPUT, help='JSON file the measurements are written to')
+    parser.add_argument('--baseline', default=settings.PERF_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=settings.PERF_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store the measurements as the new baseline')
+    parser.add_argument('--check', action='store_true', help='Fail without a baseline instead of only measuring (for CI)')
+
+  def handle(self, *args, **options):
+    sizes = [int(s) for s in options['sizes'].split(',') if s]
+    only = [o for o in options['only'].split(',') if o]
+    if options['check'] and not options['save_baseline'] and not os.path.exists(options['baseline']):
+      # Checked before measuring, the suite takes a while
+      raise CommandError("No baseline at %s to check against, store one with --save-baseline" % (options['baseline']))
+
+    report = run_suite(sizes, only=only, seed=options['seed'])
+    print(format_report(report))
+    save_report(report, options['output'])
+    print("Measurements written to %s" % (options['output']))
+
+    if options['save_baseline']:
+      save_report(report, options['baseline'])
+      print("Baseline written to %s" % (options['baseline']))
+      return
+    if not os.path.exists(options['baseline']):
+      print("No baseline at %s, store one with --save-baseline" % (options['baseline']))
+      return
+
+    regressions = compare(report, load_report(options['baseline']), options['tolerance'])
+    if len(regressions) > 0:
+      raise CommandError("%d performance regressions:\n%s" % (len(regressions), "\n".join(regressions)))
+    print("No regressions against %s" % (options['baseline']))
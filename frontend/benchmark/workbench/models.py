@@ -1,10 +1,10 @@
 
 import os
+import ujson as json
 from django.db import models
 from django.http import HttpResponse
 
-# Unfortunately we will need PostgreSQL specific fields here
-from django.contrib.postgres.fields import ArrayField
+from .vocabulary import VOCABULARY, PACKED_DTYPE, pack_ints, unpack_ints, pack_bools, unpack_bools, pack_connections, unpack_connections
 
 #from users.models import User
 from django.contrib.auth.models import User
@@ -39,9 +39,32 @@ class ErrorType(models.Model):
 
   amount_errors = models.IntegerField(default=0)
 
+class ResultVersion(models.Model):
+  """
+  One upload of the results and predictions of a program for a benchmark, see
+  workbench.versions.
+  """
+  program = models.ForeignKey(Program, on_delete=models.CASCADE)
+  benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
+  created = models.DateTimeField(auto_now_add=True)
+  # When a newer version was published, None as long as this one is the published one
+  superseded = models.DateTimeField(null=True, blank=True)
+
+class PublishedResult(models.Model):
+  """
+  Points to the published ResultVersion of a program for a benchmark, readers only see that one.
+  """
+  program = models.ForeignKey(Program, on_delete=models.CASCADE)
+  benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
+  version = models.ForeignKey(ResultVersion, on_delete=models.PROTECT, related_name='publications')
+
+  class Meta:
+    unique_together = (('program', 'benchmark'),)
+
 class Result(models.Model):
   program = models.ForeignKey(Program, on_delete=models.CASCADE)
   benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
+  version = models.ForeignKey(ResultVersion, on_delete=models.CASCADE, null=True, blank=True)
 
   equalScore = models.FloatField(default=0)
   penalizedScore = models.FloatField(default=0)
@@ -72,6 +95,7 @@ class ErrorCategory(models.Model):
   result = models.ForeignKey(Result, on_delete=models.CASCADE)
   program = models.ForeignKey(Program, on_delete=models.CASCADE)
   benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
+  version = models.ForeignKey(ResultVersion, on_delete=models.CASCADE, null=True, blank=True)
   name = models.CharField(max_length=200)
 
   detectionPrecision = models.FloatField(default=0)
@@ -94,8 +118,18 @@ class ErrorCategory(models.Model):
 
   # TODO(naetherm): Add important results here
 
+class Token(models.Model):
+  """
+  Vocabulary of all sentence and prediction tokens and of the error types.
+  """
+  text = models.CharField(max_length=256, unique=True)
+
+  def __str__(self):
+    return f'{self.text}'
+
 class InternalSentenceInformation(models.Model):
   """
+  The tokens are stored as packed arrays of Token IDs, see workbench.vocabulary.
   """
   # We need to know the benchmark we are assigned to
   benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
@@ -103,19 +137,154 @@ class InternalSentenceInformation(models.Model):
   display = models.TextField()
   aidx = models.IntegerField(default=-1)
   sidx = models.IntegerField(default=-1)
-  src_tokens = ArrayField(models.CharField(max_length=256), blank=True)
-  grt_tokens = ArrayField(models.CharField(max_length=256), blank=True)
-  types = ArrayField(models.CharField(max_length=256), blank=True)
+  src_token_ids = models.BinaryField(default=b'', blank=True)
+  grt_token_ids = models.BinaryField(default=b'', blank=True)
+  type_ids = models.BinaryField(default=b'', blank=True)
+  # Groundtruth token -> source tokens
+  connection_data = models.BinaryField(default=b'', blank=True)
+
+  @staticmethod
+  def encode(src_tokens, grt_tokens, types, connections):
+    """
+    Returns the packed fields of a sentence, ``connections`` are ``[(idx, [targets]), ...]``.
+    """
+    ids = VOCABULARY.intern(list(src_tokens) + list(grt_tokens) + list(types))
+    num_src, num_grt = len(src_tokens), len(grt_tokens)
+    return {
+      'src_token_ids': pack_ints(ids[:num_src]),
+      'grt_token_ids': pack_ints(ids[num_src:num_src + num_grt]),
+      'type_ids': pack_ints(ids[num_src + num_grt:]),
+      'connection_data': pack_connections(connections)
+    }
+
+  def vocabulary_ids(self):
+    return unpack_ints(self.src_token_ids) + unpack_ints(self.grt_token_ids) + unpack_ints(self.type_ids)
 
-  connections = models.TextField()
+  @property
+  def src_tokens(self):
+    return VOCABULARY.texts(unpack_ints(self.src_token_ids))
+
+  @property
+  def grt_tokens(self):
+    return VOCABULARY.texts(unpack_ints(self.grt_token_ids))
+
+  @property
+  def types(self):
+    return VOCABULARY.texts(unpack_ints(self.type_ids))
+
+  @property
+  def connections(self):
+    """
+    The connections in their textual form ``"0->3|1->4,5"``.
+    """
+    return "|".join("{}->{}".format(idx, ",".join(str(t) for t in targets)) for idx, targets in unpack_connections(self.connection_data))
 
 class PredictedSentenceInformation(models.Model):
+  """
+  The tokens are stored as packed arrays of Token IDs, see workbench.vocabulary. Rows are never
+  changed in place, a new upload ends the validity of the old row and adds a new one.
+  """
 
   program = models.ForeignKey(Program, on_delete=models.CASCADE)
   benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
   aid = models.IntegerField(default=-1)
   sid = models.IntegerField(default=-1)
-  tokens = ArrayField(models.CharField(max_length=256), blank=True) # the predicted tokens
-  corrected = ArrayField(models.CharField(max_length=256), blank=True)
-  src_connections = models.TextField() # to source
-  tgt_connections = models.TextField() # to groundtruth
+  token_ids = models.BinaryField(default=b'', blank=True) # the predicted tokens
+  corrected_bits = models.BinaryField(default=b'', blank=True) # one bit per predicted token
+  src_connection_data = models.BinaryField(default=b'', blank=True) # to source
+  tgt_connection_data = models.BinaryField(default=b'', blank=True) # to groundtruth
+  # Hash of the content above, a re-upload only rewrites the sentences whose hash changed
+  content_hash = models.CharField(max_length=40, default='', blank=True)
+  # IDs of the ResultVersions this row belongs to: from valid_from up to, excluding, valid_to
+  valid_from = models.IntegerField(default=0)
+  valid_to = models.IntegerField(null=True, blank=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['program', 'benchmark', 'aid', 'sid'])
+    ]
+
+  @staticmethod
+  def encode(tokens, corrected, src_connections, tgt_connections):
+    """
+    Returns the packed fields of a predicted sentence, ``corrected`` are booleans and the
+    connections are ``[(idx, [targets]), ...]``.
+    """
+    return {
+      'token_ids': pack_ints(VOCABULARY.intern(tokens)),
+      'corrected_bits': pack_bools(corrected),
+      'src_connection_data': pack_connections(src_connections),
+      'tgt_connection_data': pack_connections(tgt_connections)
+    }
+
+  def vocabulary_ids(self):
+    return unpack_ints(self.token_ids)
+
+  @property
+  def tokens(self):
+    return VOCABULARY.texts(self.vocabulary_ids())
+
+  @property
+  def corrected(self):
+    """
+    The corrected flags in their textual form ``"true"``/``"false"``.
+    """
+    return ["true" if c else "false" for c in unpack_bools(self.corrected_bits, len(self.token_ids) // PACKED_DTYPE.itemsize)]
+
+  @property
+  def src_connections(self):
+    """
+    The connections in their textual form ``"0->[0]|1->[1, 2]"``.
+    """
+    return "|".join("{}->{}".format(idx, targets) for idx, targets in unpack_connections(self.src_connection_data))
+
+  @property
+  def tgt_connections(self):
+    return "|".join("{}->{}".format(idx, targets) for idx, targets in unpack_connections(self.tgt_connection_data))
+
+class JobTiming(models.Model):
+  """
+  The per-stage timing of one evaluation job (an upload, a populated baseline), see
+  workbench.timing.
+  """
+  name = models.CharField(max_length=64)
+  benchmark = models.ForeignKey(Benchmark, on_delete=models.SET_NULL, null=True, blank=True)
+  program = models.ForeignKey(Program, on_delete=models.SET_NULL, null=True, blank=True)
+  started = models.DateTimeField()
+  seconds = models.FloatField(default=0)
+  status = models.CharField(max_length=16)
+  # JSON list of the spans: {"stage", "seconds", "bytes", "rows"}
+  stages = models.TextField(default='[]')
+
+  class Meta:
+    indexes = [models.Index(fields=['name', '-started'])]
+
+  def stage_list(self):
+    return json.loads(self.stages)
+
+class EngineSpeed(models.Model):
+  """
+  The speed of one run of a builtin engine on a benchmark, see workbench.speed.
+  """
+  program = models.ForeignKey(Program, on_delete=models.CASCADE)
+  benchmark = models.ForeignKey(Benchmark, on_delete=models.CASCADE)
+  # The results of the run, None once the version was garbage-collected
+  version = models.ForeignKey(ResultVersion, on_delete=models.SET_NULL, null=True, blank=True)
+  created = models.DateTimeField(auto_now_add=True)
+  lang_code = models.CharField(max_length=10)
+
+  seconds = models.FloatField(default=0)
+  tokens = models.IntegerField(default=0)
+  sentences = models.IntegerField(default=0)
+  tokens_per_second = models.FloatField(default=0)
+  sentences_per_second = models.FloatField(default=0)
+  # JSON of the latency histograms per kind: {"check": {"counts", "sum"}, ...}
+  latencies = models.TextField(default='{}')
+
+  class Meta:
+    indexes = [models.Index(fields=['benchmark', 'program', '-created'])]
+
+  def latency_histograms(self):
+    from .speed import LatencyHistogram
+
+    return dict((kind, LatencyHistogram.from_dict(content)) for kind, content in json.loads(self.latencies).items())
@@ -9,7 +9,8 @@ import os
 import os.path
 import argparse
 import collections
-from operator import itemgetter
+import heapq
+import numpy as np
 
 WORDFILE = '/code/benchmark/workbench/dict/american-english-insane'
 
@@ -22,12 +23,21 @@ class Autocorrect(object):
     self.len_variance = len_variance
 
     self.words = set([w.lower() for w in open(WORDFILE).read().splitlines()])
+    # word IDs follow the lexicographic order, which is also used to break ties
+    # between equally ranked suggestions
+    self.word_list = sorted(self.words)
 
-    # create dictionary of ngrams and the words that contain them
-    self.ngram_words = collections.defaultdict(set)
-    for word in self.words:
+    # create dictionary of ngrams and the IDs of the words that contain them,
+    # partitioned by the length of the words
+    postings = collections.defaultdict(lambda: collections.defaultdict(list))
+    for wid, word in enumerate(self.word_list):
       for ngram in self.ngrams(word):
-        self.ngram_words[ngram].add(word)
+        postings[ngram][len(word)].append(wid)
+    self.ngram_words = {}
+    for ngram, buckets in postings.items():
+      self.ngram_words[ngram] = {
+        length: np.array(ids, dtype=np.int32) for length, ids in buckets.items()
+      }
     #print("Generated %d ngrams from %d words" % (len(self.ngram_words), len(self.words)))
 
   def lookup(self, word):
@@ -43,19 +53,32 @@ class Autocorrect(object):
 
   def suggested_words(self, target_word, results=5):
     "Given a word, return a list of possible corrections."
-    word_ranking = collections.defaultdict(int)
-    possible_words = set()
+    if results <= 0:
+      return []
+    # only use words that are within +-LEN_VARIANCE characters in length of
+    # the target word, so only those buckets of the postings are visited
+    lengths = range(len(target_word) - self.len_variance, len(target_word) + self.len_variance + 1)
+    postings = []
     for ngram in self.ngrams(target_word):
-      words = self.ngram_words[ngram]
-      for word in words:
-        # only use words that are within +-LEN_VARIANCE characters in
-        # length of the target word
-        if len(word) >= len(target_word) - self.len_variance and \
-          len(word) <= len(target_word) + self.len_variance:
-          word_ranking[word] += 1
+      buckets = self.ngram_words.get(ngram)
+      if buckets is None:
+        continue
+      for length in lengths:
+        if length in buckets:
+          postings.append(buckets[length])
+    if len(postings) == 0:
+      return []
+    # count the shared ngrams per word
+    word_ids, counts = np.unique(np.concatenate(postings), return_counts=True)
+    if len(word_ids) > results:
+      # only words reaching the count of the k-th best word can be part of the result
+      threshold = np.partition(counts, -results)[-results]
+      keep = counts >= threshold
+      word_ids = word_ids[keep]
+      counts = counts[keep]
     # sort by descending frequency
-    ranked_word_pairs = sorted(word_ranking.items(), key=itemgetter(1), reverse=True)
-    return [word_pair[0] for word_pair in ranked_word_pairs[0:results]]
+    ranked_word_pairs = heapq.nlargest(results, zip(counts.tolist(), (-word_ids).tolist()))
+    return [self.word_list[-word_pair[1]] for word_pair in ranked_word_pairs]
 
 def evaluate(ac, word):
   '''
@@ -0,0 +1,149 @@
+'''
+List partitioning of the PredictedSentenceInformation table on PostgreSQL: one partition per
+benchmark, sub-partitioned per program. The outdated rows of a program for a benchmark are
+deleted in batches of PREDICTION_DELETE_BATCH rows, each in a transaction of its own. A batch
+only locks its rows, which no reader can see any more, so neither readers nor uploads wait for
+it, and the partitioning keeps the deletes and their indexes confined to the pair. Deleting a
+benchmark or program drops its tables. No partition is detached or swapped while it is in use,
+that takes an ACCESS EXCLUSIVE lock on the benchmark partition and blocks its readers.
+
+On other databases (sqlite) and with PREDICTION_PARTITIONING disabled the table stays a plain
+table, the rows are deleted the same way.
+'''
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+def prediction_table():
+  from .models import PredictedSentenceInformation
+
+  return PredictedSentenceInformation._meta.db_table
+
+def partitioning_enabled():
+  return settings.PREDICTION_PARTITIONING and connection.vendor == 'postgresql'
+
+def is_partitioned(cursor, table):
+  cursor.execute("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s", [table])
+  return cursor.fetchone() is not None
+
+def table_exists(cursor, table):
+  cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+  return cursor.fetchone()[0]
+
+def benchmark_partition(benchmark_id):
+  return "{}_b{}".format(prediction_table(), int(benchmark_id))
+
+def program_partition(benchmark_id, program_id):
+  return "{}_b{}_p{}".format(prediction_table(), int(benchmark_id), int(program_id))
+
+
+def setup_prediction_partitioning(sender=None, **kwargs):
+  """
+  post_migrate hook, converts the prediction table into a partitioned table once. Rows stored
+  before are moved into their partitions, indexes and foreign keys are recreated under their
+  original names so later migrations still find them.
+  """
+  if not partitioning_enabled():
+    return
+  table = prediction_table()
+  legacy = table + "_unpartitioned"
+  with transaction.atomic(), connection.cursor() as cursor:
+    if not table_exists(cursor, table) or is_partitioned(cursor, table):
+      return
+    print("Partition %s by benchmark and program ..." % (table))
+
+    cursor.execute("""
+      SELECT indexdef FROM pg_indexes i
+      WHERE i.tablename = %s AND i.indexname NOT IN (
+        SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+      )""", [table, table])
+    index_defs = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+      SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+      WHERE conrelid = %s::regclass AND contype = 'f'""", [table])
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(table, legacy))
+    cursor.execute('CREATE TABLE "{}" (LIKE "{}" INCLUDING DEFAULTS) PARTITION BY LIST (benchmark_id)'.format(table, legacy))
+    # The primary key of a partitioned table has to contain the partition keys
+    cursor.execute('ALTER TABLE "{}" ADD PRIMARY KEY (id, benchmark_id, program_id)'.format(table))
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [legacy])
+    sequence = cursor.fetchone()[0]
+    if sequence:
+      cursor.execute('ALTER SEQUENCE {} OWNED BY "{}".id'.format(sequence, table))
+
+    cursor.execute('SELECT DISTINCT benchmark_id, program_id FROM "{}"'.format(legacy))
+    for benchmark_id, program_id in cursor.fetchall():
+      create_partition(cursor, benchmark_id, program_id)
+    cursor.execute('INSERT INTO "{}" SELECT * FROM "{}"'.format(table, legacy))
+    cursor.execute('DROP TABLE "{}"'.format(legacy))
+
+    for index_def in index_defs:
+      cursor.execute(index_def.replace(' ON {} '.format(legacy), ' ON "{}" '.format(table)).replace(' ON public.{} '.format(legacy), ' ON "{}" '.format(table)))
+    for name, definition in foreign_keys:
+      cursor.execute('ALTER TABLE "{}" ADD CONSTRAINT "{}" {}'.format(table, name, definition))
+
+def create_partition(cursor, benchmark_id, program_id):
+  """
+  Creates the partitions of a benchmark and program if they do not exist yet.
+  """
+  table = prediction_table()
+  if not table_exists(cursor, benchmark_partition(benchmark_id)):
+    cursor.execute('CREATE TABLE "{}" PARTITION OF "{}" FOR VALUES IN ({}) PARTITION BY LIST (program_id)'.format(
+      benchmark_partition(benchmark_id), table, int(benchmark_id)))
+  if not table_exists(cursor, program_partition(benchmark_id, program_id)):
+    cursor.execute('CREATE TABLE "{}" PARTITION OF "{}" FOR VALUES IN ({})'.format(
+      program_partition(benchmark_id, program_id), benchmark_partition(benchmark_id), int(program_id)))
+
+def ensure_partition(benchmark_id, program_id):
+  """
+  Creates the partitions of a benchmark and program in a short transaction of its own, call it
+  before the ingest: creating a partition locks its parent exclusively until the commit.
+  """
+  if not partitioning_enabled():
+    return
+  with connection.cursor() as cursor:
+    if table_exists(cursor, program_partition(benchmark_id, program_id)):
+      return
+  with transaction.atomic(), connection.cursor() as cursor:
+    # Concurrent first uploads would create the same partitions
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [prediction_table()])
+    create_partition(cursor, benchmark_id, program_id)
+
+def compact_predictions(benchmark_id, program_id, keep_from):
+  """
+  Deletes the predictions of a program for a benchmark that are only valid for versions before
+  ``keep_from``, in batches of PREDICTION_DELETE_BATCH rows with a transaction each. Returns the
+  number of rows deleted.
+  """
+  from .models import PredictedSentenceInformation
+
+  # No version at or after keep_from can see them and their valid_to never changes again
+  dead = PredictedSentenceInformation.objects.filter(benchmark_id=benchmark_id, program_id=program_id, valid_to__isnull=False, valid_to__lte=keep_from)
+  num_deleted = 0
+  while True:
+    with transaction.atomic():
+      pks = list(dead.values_list('pk', flat=True)[:settings.PREDICTION_DELETE_BATCH])
+      if len(pks) == 0:
+        return num_deleted
+      num_deleted += PredictedSentenceInformation.objects.filter(benchmark_id=benchmark_id, program_id=program_id, pk__in=pks).delete()[0]
+
+def drop_benchmark_partitions(sender, instance, **kwargs):
+  """
+  post_delete hook of Benchmark, drops its (by then empty) partitions.
+  """
+  if partitioning_enabled():
+    with connection.cursor() as cursor:
+      cursor.execute('DROP TABLE IF EXISTS "{}"'.format(benchmark_partition(instance.pk)))
+
+def drop_program_partitions(sender, instance, **kwargs):
+  """
+  post_delete hook of Program, drops its (by then empty) partitions of all benchmarks.
+  """
+  if not partitioning_enabled():
+    return
+  with connection.cursor() as cursor:
+    cursor.execute("SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname LIKE %s", [prediction_table() + "\\_b%\\_p" + str(int(instance.pk))])
+    for (name,) in cursor.fetchall():
+      cursor.execute('DROP TABLE IF EXISTS "{}"'.format(name))
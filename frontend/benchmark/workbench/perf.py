@@ -0,0 +1,310 @@
+'''
+Microbenchmarks of the workbench hot paths over generated corpora of several sizes. Every case
+is timed (best of a few runs) and its peak Python memory is traced in a separate run. The
+measurements are written to JSON and compared against a stored baseline, a case whose
+throughput dropped or whose peak memory grew by more than the tolerance is a regression.
+
+Run it with ``python3 manage.py perf``. With ``--check`` (for CI) a missing baseline fails the
+run as well, without it the measurements are only reported. A case of the baseline that failed
+or was not measured at all counts as a regression. The database cases run inside a transaction
+which is rolled back, the remote engines with a stub (see stub_servers) are pointed at a local
+one.
+'''
+
+import os
+import time
+import random
+import shutil
+import tempfile
+import platform
+import tracemalloc
+import ujson as json
+
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+
+# Sentences of every article of the generated corpora
+PERF_SENTENCES_PER_ARTICLE = 10
+
+
+def perf_corpus(num_sentences, seed=0):
+  """
+  Returns the SyntheticCorpus of about ``num_sentences`` sentences.
+  """
+  from .synthetic import SyntheticBenchmark
+
+  num_articles = max(1, (num_sentences + PERF_SENTENCES_PER_ARTICLE - 1) // PERF_SENTENCES_PER_ARTICLE)
+  return SyntheticBenchmark(num_articles, (PERF_SENTENCES_PER_ARTICLE, PERF_SENTENCES_PER_ARTICLE), seed=seed).build()
+
+
+class PerfCase(object):
+  """
+  A benchmarked function. ``setup(corpus)`` returns ``(run, num_items)``: the function to time
+  and the number of items (tokens, sentences, rows) it processes, used for the throughput.
+  """
+
+  def __init__(self, name, setup, unit='tokens', repeat=3, max_sentences=None):
+    self.name = name
+    self.setup = setup
+    self.unit = unit
+    self.repeat = repeat
+    # Slow cases (the engines) are only run on the smaller corpora
+    self.max_sentences = max_sentences
+
+
+def setup_call_regex(corpus):
+  from .utils import call_regex
+  from .corpus import build_article_information
+
+  sentences = [s for article in build_article_information(corpus.source_content()) for s in article.sentences]
+  def run():
+    for sentence in sentences:
+      call_regex(sentence)
+  return run, corpus.num_tokens
+
+def setup_source_representation(corpus):
+  from .helpers import build_source_sentence_representation
+
+  return lambda: build_source_sentence_representation(corpus.source, corpus.num_articles, corpus.sentences_per_article), corpus.num_tokens
+
+def setup_groundtruth_representation(corpus):
+  from .helpers import build_groundtruth_sentence_representation
+
+  return lambda: build_groundtruth_sentence_representation(corpus.groundtruth), len(corpus.groundtruth["corrections"])
+
+def setup_alignment_representation(corpus):
+  from .helpers import build_alignment_sentence_representation
+
+  return lambda: build_alignment_sentence_representation(corpus.alignments), corpus.num_tokens
+
+def setup_generate_token_information(corpus):
+  from .builtin_sec import generate_token_information
+
+  tokens = [(int(t["id"].split(".")[0][1:]), int(t["id"].split(".")[1][1:]), int(t["id"].split(".")[2][1:]), t["token"], t["space"]) for t in corpus.source["tokens"]]
+  def run():
+    for aidx, sidx, tidx, token, space in tokens:
+      generate_token_information(aidx, sidx, tidx, token, [token, token.upper()], space, True)
+  return run, corpus.num_tokens
+
+def rolled_back(function):
+  """
+  Runs ``function(program, benchmark)`` with a fresh program and benchmark inside a transaction
+  that is rolled back.
+  """
+  from django.contrib.auth.models import User
+  from .models import Program, Benchmark
+
+  from .vocabulary import VOCABULARY
+
+  try:
+    with transaction.atomic():
+      user = User.objects.create(username="perf-%d" % (random.getrandbits(32)))
+      program = Program.objects.create(user=user, program_name="perf")
+      benchmark = Benchmark.objects.create(benchmark_name="perf", lang_code="en_US")
+      try:
+        function(program, benchmark)
+      finally:
+        transaction.set_rollback(True)
+  finally:
+    # The tokens added by the function were rolled back as well
+    VOCABULARY.clear()
+
+def setup_write_results_to_db(corpus):
+  from .helpers import write_results_to_db
+  from .models import ResultVersion
+  from .synthetic import EVALUATION_CATEGORIES
+
+  data = corpus.evaluation()
+  def write(program, benchmark):
+    version = ResultVersion.objects.create(program=program, benchmark=benchmark)
+    write_results_to_db(data, program, benchmark, version)
+  return lambda: rolled_back(write), 1 + len(EVALUATION_CATEGORIES)
+
+def setup_read_and_save_alignment_file(corpus):
+  from .helpers import read_and_save_alignment_file
+  from .models import ResultVersion
+  from .partitions import ensure_partition
+
+  directory = tempfile.mkdtemp(prefix='alignments-', dir=settings.CACHE_DIR) + '/'
+  with open(directory + 'alignments.json', 'w', encoding='utf-8') as fout:
+    fout.write(json.dumps(corpus.alignments, ensure_ascii=False))
+  def save(program, benchmark):
+    ensure_partition(benchmark.pk, program.pk)
+    version = ResultVersion.objects.create(program=program, benchmark=benchmark)
+    read_and_save_alignment_file(program, benchmark, directory, version)
+  return lambda: rolled_back(save), corpus.num_sentences
+
+# Remote engines with a local stub server, the others cannot be measured offline
+PERF_STUBBED_ENGINES = ('languagetool', 'grammarbot')
+
+class PerfSkipped(Exception):
+  pass
+
+def engine_setup(engine):
+  def setup(corpus):
+    if engine.remote and engine.name not in PERF_STUBBED_ENGINES:
+      raise PerfSkipped("no offline stub")
+    content = corpus.source_content()
+    if engine.load is not None:
+      # Loading the resources is not part of the measurement
+      engine.resource("en_US")
+    return lambda: engine.predict(content, "en_US"), corpus.num_tokens
+  return setup
+
+def perf_cases(engine_sentences=200):
+  """
+  Returns all PerfCases, one per hot path and registered engine.
+  """
+  from .engines import ENGINES
+
+  cases = [
+    PerfCase('call_regex', setup_call_regex),
+    PerfCase('build_source_sentence_representation', setup_source_representation),
+    PerfCase('build_groundtruth_sentence_representation', setup_groundtruth_representation, unit='corrections'),
+    PerfCase('build_alignment_sentence_representation', setup_alignment_representation),
+    PerfCase('generate_token_information', setup_generate_token_information),
+    PerfCase('write_results_to_db', setup_write_results_to_db, unit='results'),
+    PerfCase('read_and_save_alignment_file', setup_read_and_save_alignment_file, unit='sentences', repeat=1)
+  ]
+  for name in sorted(ENGINES.keys()):
+    cases.append(PerfCase('engine:' + name, engine_setup(ENGINES[name]), repeat=1, max_sentences=engine_sentences))
+  return cases
+
+
+def measure(case, corpus):
+  """
+  Returns the measurement of ``case`` on ``corpus``.
+  """
+  run, num_items = case.setup(corpus)
+  # Warm caches (vocabulary, compiled patterns) before timing
+  run()
+  seconds = None
+  for _ in range(case.repeat):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    if seconds is None or elapsed < seconds:
+      seconds = elapsed
+
+  tracemalloc.start()
+  try:
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+  return {
+    "items": num_items,
+    "unit": case.unit,
+    "seconds": seconds,
+    "itemsPerSecond": num_items / seconds if seconds > 0 else None,
+    "peakBytes": peak
+  }
+
+def run_suite(sizes, cases=None, only=None, seed=0):
+  """
+  Runs ``cases`` (all by default, or those whose name contains one of ``only``) on corpora of
+  every size in ``sizes`` (number of sentences). Cases that cannot run here (missing
+  dictionaries, unsupported languages, no offline stub) are reported as skipped, cases raising
+  any other error as failed.
+  """
+  from .stub_servers import start_stub_server, LanguageToolStubHandler
+
+  if cases is None:
+    cases = perf_cases()
+  if only:
+    cases = [case for case in cases if any(o in case.name for o in only)]
+
+  stub = start_stub_server(LanguageToolStubHandler)
+  stub_url = "http://%s:%d/v2/" % stub.server_address
+  cache_dir = tempfile.mkdtemp(prefix='perf-cache-')
+  # Offline remote engines, responses are not served from the cache of earlier runs
+  overrides = override_settings(
+    LANGUAGETOOL_URL=stub_url,
+    GRAMMARBOT_URL=stub_url,
+    REMOTE_RATE_LIMITS={},
+    REMOTE_DEFAULT_RATE=None,
+    REMOTE_RETRIES=0,
+    CACHE_DIR=os.path.join(cache_dir, '')
+  )
+
+  results = {}
+  skipped = {}
+  failed = {}
+  overrides.enable()
+  try:
+    for size in sizes:
+      corpus = perf_corpus(size, seed)
+      for case in cases:
+        if case.max_sentences is not None and size > case.max_sentences:
+          continue
+        key = "%s@%d" % (case.name, size)
+        print("Measuring %s ..." % (key))
+        try:
+          results[key] = measure(case, corpus)
+        except PerfSkipped as e:
+          skipped[key] = str(e)
+        except Exception as e:
+          failed[key] = "%s: %s" % (type(e).__name__, e)
+          print("WARNING: failed %s: %s" % (key, failed[key]))
+  finally:
+    overrides.disable()
+    stub.shutdown()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+  return {
+    "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()},
+    "seed": seed,
+    "sizes": list(sizes),
+    "only": list(only or []),
+    "results": results,
+    "skipped": skipped,
+    "failed": failed
+  }
+
+def compare(report, baseline, tolerance):
+  """
+  Returns the regressions of ``report`` against ``baseline``: a description for every case that
+  lost more than ``tolerance`` (a fraction) of its throughput or needs that much more memory,
+  and for every case of the baseline that failed or is missing from the report. Cases outside
+  the sizes and ``--only`` filter of the report are not compared.
+  """
+  regressions = []
+  for key, previous in sorted(baseline.get("results", {}).items()):
+    name, size = key.rsplit("@", 1)
+    if int(size) not in report["sizes"] or (report.get("only") and not any(o in name for o in report["only"])):
+      continue
+    current = report["results"].get(key)
+    if current is None:
+      if key in report.get("failed", {}):
+        regressions.append("%s: failed (%s)" % (key, report["failed"][key]))
+      elif key not in report["skipped"]:
+        regressions.append("%s: not measured" % (key))
+      continue
+    if previous["itemsPerSecond"] and current["itemsPerSecond"] is not None:
+      if current["itemsPerSecond"] < previous["itemsPerSecond"] * (1.0 - tolerance):
+        regressions.append("%s: %.0f %s/s, baseline %.0f %s/s" % (
+          key, current["itemsPerSecond"], current["unit"], previous["itemsPerSecond"], previous["unit"]))
+    if current["peakBytes"] > previous["peakBytes"] * (1.0 + tolerance) + 64 * 1024:
+      regressions.append("%s: peak memory %d bytes, baseline %d bytes" % (key, current["peakBytes"], previous["peakBytes"]))
+  return regressions
+
+def format_report(report):
+  lines = []
+  for key, result in sorted(report["results"].items()):
+    lines.append("%-60s %12.0f %s/s %10.1f ms %10.1f MiB" % (
+      key, result["itemsPerSecond"] or 0, result["unit"], result["seconds"] * 1000, result["peakBytes"] / (1024.0 * 1024.0)))
+  for key, reason in sorted(report["skipped"].items()):
+    lines.append("%-60s skipped (%s)" % (key, reason))
+  for key, reason in sorted(report.get("failed", {}).items()):
+    lines.append("%-60s failed (%s)" % (key, reason))
+  return "\n".join(lines)
+
+def load_report(filepath):
+  with open(filepath, 'r', encoding='utf-8') as fin:
+    return json.loads(fin.read())
+
+def save_report(report, filepath):
+  with open(filepath, 'w', encoding='utf-8') as fout:
+    fout.write(json.dumps(report, indent=2))
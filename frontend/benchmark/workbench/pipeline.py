@@ -0,0 +1,212 @@
+'''
+Constant-memory prediction pipeline of the baseline runs:
+
+  read tokens -> rebuild sentences -> tokenize -> batch -> engine -> write entries
+
+The stages are generators, only the reading and tokenizing (``prefetched``) and the writing
+(BackgroundWriter) run in threads of their own, so they overlap with the engine. The engine
+stays in the calling thread, where its EngineRun and profiling capture are. Every hand-over
+goes through a queue of at most PIPELINE_QUEUE_SIZE items, a stage that is ahead waits for the
+next one (backpressure). The memory needed is bounded by the batch size, not the benchmark.
+'''
+
+import re
+import json
+import queue
+import threading
+
+from .corpus import sentence_records
+from .engine_server import PREDICTIONS_HEADER, PREDICTIONS_FOOTER, prediction_entries
+
+# ujson has no incremental decoding, the items of large arrays are decoded with the json module
+DECODER = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+# Longest item decoded, a malformed one is not buffered up to the end of the document
+MAX_ITEM_CHARS = 1 << 24
+
+ITEM, DONE, ERROR = range(3)
+
+
+def json_array_items(fin, key, chunk_size=1 << 16):
+  """
+  Yields the items of the array ``key`` of the JSON document read from the text file ``fin``
+  one by one, the document is never read as a whole. The first array of that name is used,
+  wherever it is.
+
+  :raises ValueError: If there is no such array or the document is malformed.
+  """
+  start = re.compile(r'"%s"\s*:\s*\[' % (re.escape(key)))
+  buffer = ""
+  while True:
+    match = start.search(buffer)
+    if match is not None:
+      break
+    chunk = fin.read(chunk_size)
+    if not chunk:
+      raise ValueError("no array '%s' found" % (key))
+    # Keep the end, the key may be split between two chunks
+    buffer = buffer[-(len(key) + 64):] + chunk
+
+  buffer = buffer[match.end():]
+  pos = 0
+  eof = False
+  num_items = 0
+  # After the opening bracket or a comma an item is expected, after an item a comma or the end
+  separated = True
+  while True:
+    while pos < len(buffer) and buffer[pos] in WHITESPACE:
+      pos += 1
+    if pos < len(buffer):
+      char = buffer[pos]
+      if char == ']' and (not separated or num_items == 0):
+        return
+      if not separated:
+        if char != ',':
+          raise ValueError("expected ',' or ']' after item %d of array '%s': %s" % (num_items, key, buffer[pos:pos + 80]))
+        pos += 1
+        separated = True
+        continue
+      if char in ',]':
+        raise ValueError("missing item %d of array '%s': %s" % (num_items + 1, key, buffer[pos:pos + 80]))
+      try:
+        item, end = DECODER.raw_decode(buffer, pos)
+      except json.JSONDecodeError:
+        end = None
+        if eof:
+          raise ValueError("malformed item in array '%s': %s" % (key, buffer[pos:pos + 80]))
+      # An item ending with the buffer (a number) may continue in the next chunk
+      if end is not None and (end < len(buffer) or eof):
+        pos = end
+        separated = False
+        num_items += 1
+        yield item
+        continue
+    elif eof:
+      raise ValueError("array '%s' is not closed" % (key))
+    if len(buffer) - pos > MAX_ITEM_CHARS:
+      raise ValueError("item %d of array '%s' is malformed or longer than %d characters" % (num_items + 1, key, MAX_ITEM_CHARS))
+    # The item continues in the next chunk
+    chunk = fin.read(chunk_size)
+    eof = not chunk
+    buffer = buffer[pos:] + chunk
+    pos = 0
+
+
+def batched(items, size):
+  """
+  Yields lists of ``size`` consecutive ``items``, the last one may be shorter.
+  """
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if len(batch) > 0:
+    yield batch
+
+def prefetched(items, maxsize=4):
+  """
+  Iterates over ``items`` in a thread, at most ``maxsize`` items ahead of the consumer. Errors
+  of the producer are raised in the consumer, the producer stops when the consumer does.
+  """
+  handover = queue.Queue(maxsize)
+  stop = threading.Event()
+
+  def put(entry):
+    while not stop.is_set():
+      try:
+        handover.put(entry, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def produce():
+    try:
+      for item in items:
+        if not put((ITEM, item)):
+          return
+      put((DONE, None))
+    except BaseException as e:
+      put((ERROR, e))
+
+  thread = threading.Thread(target=produce, daemon=True)
+  thread.start()
+  try:
+    while True:
+      kind, value = handover.get()
+      if kind == DONE:
+        return
+      if kind == ERROR:
+        raise value
+      yield value
+  finally:
+    stop.set()
+
+
+class BackgroundWriter(object):
+  """
+  Writes the texts passed to ``write`` to ``fout`` in a thread, at most ``maxsize`` of them wait.
+  """
+
+  def __init__(self, fout, maxsize=4):
+    self.fout = fout
+    self.texts = queue.Queue(maxsize)
+    self.error = None
+    self.bytes = 0
+    self.thread = threading.Thread(target=self.consume, daemon=True)
+    self.thread.start()
+
+  def consume(self):
+    while True:
+      text = self.texts.get()
+      if text is None:
+        return
+      # After an error the texts are dropped, so ``write`` never blocks
+      if self.error is None:
+        try:
+          self.fout.write(text)
+          self.bytes += len(text)
+        except BaseException as e:
+          self.error = e
+
+  def write(self, text):
+    if self.error is not None:
+      raise self.error
+    self.texts.put(text)
+
+  def close(self):
+    """
+    Waits until everything is written, raises the error of the writer if there was one.
+    """
+    self.texts.put(None)
+    self.thread.join()
+    if self.error is not None:
+      raise self.error
+
+
+def predict_to_file(predict, input, filepath, batch_size, run=None, maxsize=4):
+  """
+  Writes the prediction content of ``input`` (see corpus.sentence_records) to ``filepath``,
+  predicted by ``predict(records)`` in batches of ``batch_size`` sentences. The speed of the
+  engine is recorded into the EngineRun ``run``.
+  """
+  def predict_all(writer):
+    writer.write(PREDICTIONS_HEADER)
+    for batch in prefetched(batched(sentence_records(input), batch_size), maxsize):
+      if run is not None:
+        run.count(batch)
+      writer.write(prediction_entries(predict(batch)))
+    writer.write(PREDICTIONS_FOOTER)
+
+  with open(filepath, 'w', encoding='utf-8') as fout:
+    writer = BackgroundWriter(fout, maxsize)
+    try:
+      if run is None:
+        predict_all(writer)
+      else:
+        with run:
+          predict_all(writer)
+    finally:
+      writer.close()
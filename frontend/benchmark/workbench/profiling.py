@@ -0,0 +1,235 @@
+'''
+Opt-in profiling of requests and jobs with cProfile and tracemalloc. A capture is taken of
+
+  - the views and jobs named in PROFILING_TARGETS (view function names like 'upload_results',
+    job names like 'process_uploaded_results' or 'evaluate_aspell_builtin', '*' for all)
+  - requests sending the PROFILING_HEADER (e.g. ``X-Profile: 1``), of staff users only
+
+Every capture is written to PROFILING_DIR as ``<id>.prof`` (pstats, open it with snakeviz or
+``python3 -m pstats``), ``<id>.txt`` (the slowest functions and the top allocations) and
+``<id>.json`` (what was captured), the newest PROFILING_KEEP captures are kept. The staff page
+/profiles/ lists them.
+
+Jobs are profiled with the ``profiled`` decorator, the builtin engines are profiled under the name
+of their evaluate function by Engine.predict. Nested captures in the same thread are part of the
+outer one. tracemalloc traces the whole process, the allocations of a capture include those of
+concurrent requests.
+'''
+
+import io
+import os
+import re
+import time
+import random
+import string
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+import ujson as json
+
+from django.conf import settings
+from django.utils import timezone
+
+CAPTURE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[A-Za-z0-9_.-]+-[a-z0-9]{6}$')
+
+# Captures tracing memory, tracemalloc is stopped with the last of them
+TRACING_LOCK = threading.Lock()
+TRACING = {'captures': 0, 'owned': False}
+
+CURRENT = threading.local()
+
+
+def profiling_target(name):
+  targets = settings.PROFILING_TARGETS
+  return '*' in targets or name in targets
+
+def start_tracing():
+  with TRACING_LOCK:
+    if TRACING['captures'] == 0 and not tracemalloc.is_tracing():
+      tracemalloc.start()
+      TRACING['owned'] = True
+    TRACING['captures'] += 1
+    return TRACING['captures'] == 1 and TRACING['owned']
+
+def stop_tracing():
+  with TRACING_LOCK:
+    TRACING['captures'] -= 1
+    if TRACING['captures'] == 0 and TRACING['owned']:
+      tracemalloc.stop()
+      TRACING['owned'] = False
+
+
+class Capture(object):
+  """
+  Profiles the code run while it is entered and writes the capture on exit. ``details``
+  (e.g. the request path) are stored with it.
+  """
+
+  def __init__(self, name, **details):
+    self.name = name
+    self.details = details
+    self.id = None
+    self.profile = None
+    self.snapshot = None
+    self.exclusive = False
+    self.started = None
+    self.start = None
+    self.nested = False
+
+  def __enter__(self):
+    if getattr(CURRENT, 'capture', None) is not None:
+      self.nested = True
+      return self
+    CURRENT.capture = self
+    self.started = timezone.now()
+    self.exclusive = start_tracing()
+    self.snapshot = tracemalloc.take_snapshot()
+    self.profile = cProfile.Profile()
+    try:
+      self.profile.enable()
+    except ValueError as e:
+      # Another profiler is active (cProfile of another thread on Python >= 3.12)
+      print("WARNING: cannot profile %s: %s" % (self.name, e))
+      self.profile = None
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if self.nested:
+      return False
+    seconds = time.perf_counter() - self.start
+    if self.profile is not None:
+      self.profile.disable()
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1] if self.exclusive else None
+    stop_tracing()
+    CURRENT.capture = None
+    try:
+      self.save(seconds, snapshot, peak, 'ok' if exc_type is None else 'error')
+    except Exception as e:
+      # The profiling must not fail the request or job
+      print("WARNING: could not store the profile of %s: %s" % (self.name, e))
+    return False
+
+  def save(self, seconds, snapshot, peak, status):
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    self.id = "%s-%s-%s" % (
+      self.started.strftime('%Y%m%d-%H%M%S'),
+      re.sub(r'[^A-Za-z0-9_.-]+', '_', self.name)[:60],
+      ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(6)))
+    path = os.path.join(settings.PROFILING_DIR, self.id)
+
+    report = io.StringIO()
+    report.write("%s %s, %.3fs%s\n\n" % (self.name, status, seconds, "" if peak is None else ", peak %d bytes traced" % (peak)))
+    if self.profile is not None:
+      self.profile.dump_stats(path + '.prof')
+      stats = pstats.Stats(self.profile, stream=report)
+      stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP_FUNCTIONS)
+
+    filters = [
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+    ]
+    allocations = snapshot.filter_traces(filters).compare_to(self.snapshot.filter_traces(filters), 'lineno')
+    report.write("Top allocations (net size, count)\n")
+    for statistic in allocations[:settings.PROFILING_TOP_ALLOCATIONS]:
+      report.write("%s\n" % (statistic))
+    with open(path + '.txt', 'w', encoding='utf-8') as fout:
+      fout.write(report.getvalue())
+
+    with open(path + '.json', 'w', encoding='utf-8') as fout:
+      fout.write(json.dumps({
+        "id": self.id,
+        "name": self.name,
+        "started": self.started.isoformat(),
+        "seconds": seconds,
+        "status": status,
+        "peakBytes": peak,
+        "allocatedBytes": sum(s.size_diff for s in allocations),
+        "profiled": self.profile is not None,
+        "details": self.details
+      }))
+    print("[profile] %s %s seconds=%.3f written to %s" % (self.name, status, seconds, path))
+    prune_captures(settings.PROFILING_KEEP)
+
+
+def profiled(name=None):
+  """
+  Decorator of jobs, captures a call if the job (``name``, the function name by default) is a
+  profiling target.
+  """
+  def decorate(function):
+    job = name or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      if not profiling_target(job):
+        return function(*args, **kwargs)
+      with Capture(job):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorate
+
+
+class ProfilingMiddleware(object):
+  """
+  Captures the views that are profiling targets and the requests of staff users with the
+  profiling header, the response names the capture in X-Profile-Id. Must come after the
+  AuthenticationMiddleware.
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    return self.get_response(request)
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    name = getattr(view_func, '__name__', 'view')
+    requested = settings.PROFILING_HEADER and ('HTTP_' + settings.PROFILING_HEADER.upper().replace('-', '_')) in request.META
+    if not profiling_target(name) and not (requested and request.user.is_staff):
+      return None
+
+    with Capture(name, method=request.method, path=request.path) as capture:
+      response = view_func(request, *view_args, **view_kwargs)
+    if capture.id is not None:
+      response['X-Profile-Id'] = capture.id
+    return response
+
+
+def list_captures():
+  """
+  Returns the descriptions of the stored captures, the newest first.
+  """
+  if not os.path.isdir(settings.PROFILING_DIR):
+    return []
+  captures = []
+  for filename in os.listdir(settings.PROFILING_DIR):
+    if not filename.endswith('.json'):
+      continue
+    try:
+      with open(os.path.join(settings.PROFILING_DIR, filename), 'r', encoding='utf-8') as fin:
+        captures.append(json.loads(fin.read()))
+    except (OSError, ValueError):
+      continue
+  return sorted(captures, key=lambda c: (c["started"], c["id"]), reverse=True)
+
+def capture_file(capture_id, extension):
+  """
+  Returns the path of a file of a stored capture, None if there is none.
+  """
+  if not CAPTURE_ID.match(capture_id) or extension not in ('prof', 'txt'):
+    return None
+  path = os.path.join(settings.PROFILING_DIR, "%s.%s" % (capture_id, extension))
+  return path if os.path.isfile(path) else None
+
+def prune_captures(keep):
+  captures = list_captures()
+  for capture in captures[keep:]:
+    for extension in ('json', 'prof', 'txt'):
+      try:
+        os.remove(os.path.join(settings.PROFILING_DIR, "%s.%s" % (capture["id"], extension)))
+      except OSError:
+        pass
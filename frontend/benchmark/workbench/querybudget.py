@@ -0,0 +1,127 @@
+'''
+SQL query profiling per request. While QUERY_PROFILING is on (by default in debug mode and
+under ``manage.py test``) QueryBudgetMiddleware records every statement of a request: the
+number of queries, the total SQL time and the slowest statements are sent in response headers
+(X-Query-Count, X-Query-Time-Ms, X-Query-Slowest-Ms) and printed as one log line per request.
+
+Views declare how many queries they may take with ``@query_budget(n)``. A request over its
+budget is logged with a warning, and inside tests decorated with ``@enforce_query_budgets`` it
+fails with QueryBudgetExceeded, so new N+1 patterns are caught by the tests of a view.
+'''
+
+import time
+import heapq
+import functools
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+
+class QueryBudgetExceeded(AssertionError):
+  pass
+
+
+class QueryRecorder(object):
+  """
+  Execute wrapper (see connection.execute_wrapper) counting and timing the statements, keeps
+  the ``keep`` slowest ones.
+  """
+
+  def __init__(self, keep=5):
+    self.keep = keep
+    self.count = 0
+    self.seconds = 0.0
+    self.slowest = []
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+    finally:
+      elapsed = time.perf_counter() - start
+      self.count += 1
+      self.seconds += elapsed
+      entry = (elapsed, self.count, sql)
+      if len(self.slowest) < self.keep:
+        heapq.heappush(self.slowest, entry)
+      elif elapsed > self.slowest[0][0]:
+        heapq.heapreplace(self.slowest, entry)
+
+  def slowest_statements(self):
+    """
+    Returns ``(seconds, sql)`` of the slowest statements, the slowest first.
+    """
+    return [(seconds, sql) for seconds, _, sql in sorted(self.slowest, reverse=True)]
+
+
+def query_budget(max_queries):
+  """
+  Declares that a view takes at most ``max_queries`` SQL queries per request.
+  """
+  def decorate(view):
+    view.query_budget = max_queries
+    return view
+  return decorate
+
+# Set while a test decorated with enforce_query_budgets runs
+ENFORCED = threading.local()
+
+def enforce_query_budgets(test):
+  """
+  Test decorator, the requests made by the test fail with QueryBudgetExceeded if their view
+  takes more queries than it declared.
+  """
+  @functools.wraps(test)
+  def wrapper(*args, **kwargs):
+    previous = getattr(ENFORCED, 'active', False)
+    ENFORCED.active = True
+    try:
+      with override_settings(QUERY_PROFILING=True):
+        return test(*args, **kwargs)
+    finally:
+      ENFORCED.active = previous
+  return wrapper
+
+
+class QueryBudgetMiddleware(object):
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    if not settings.QUERY_PROFILING:
+      return self.get_response(request)
+
+    recorder = QueryRecorder(settings.QUERY_PROFILING_SLOWEST)
+    with ExitStack() as stack:
+      for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
+      response = self.get_response(request)
+
+    slowest = recorder.slowest_statements()
+    response['X-Query-Count'] = str(recorder.count)
+    response['X-Query-Time-Ms'] = "%.1f" % (recorder.seconds * 1000)
+    if slowest:
+      response['X-Query-Slowest-Ms'] = "%.1f" % (slowest[0][0] * 1000)
+
+    budget = getattr(request, 'query_budget', None)
+    print("[queries] %s %s count=%d time=%.1fms%s" % (
+      request.method, request.path, recorder.count, recorder.seconds * 1000, "" if budget is None else " budget=%d" % (budget)))
+    for seconds, sql in slowest:
+      print("[queries]   %.1fms %s" % (seconds * 1000, sql[:300]))
+
+    if budget is not None:
+      response['X-Query-Budget'] = str(budget)
+      if recorder.count > budget:
+        message = "%s %s took %d queries, its budget is %d" % (request.method, request.path, recorder.count, budget)
+        if getattr(ENFORCED, 'active', False):
+          raise QueryBudgetExceeded(message)
+        print("WARNING: %s" % (message))
+    return response
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    request.query_budget = getattr(view_func, 'query_budget', None)
+    return None
@@ -0,0 +1,277 @@
+'''
+Asynchronous HTTP access for the remote engines. Requests run concurrently over one pooled
+client, limited per host by a token bucket, retried with exponential backoff and cached on disk
+by their content (without the credentials).
+'''
+
+import os
+import time
+import asyncio
+import threading
+import hashlib
+import tempfile
+import urllib.parse
+import ujson as json
+
+import aiohttp
+
+from .speed import current_run
+
+
+class RemoteError(Exception):
+  """
+  Raised if a remote request failed, after all retries for temporary errors.
+  """
+  pass
+
+
+# Parameters holding credentials, they are not part of the cache key
+AUTH_PARAMS = frozenset(['token', 'api_key', 'apikey', 'key', 'access_token', 'password'])
+
+
+def without_auth(values):
+  if not isinstance(values, dict):
+    return values
+  return {name: value for name, value in values.items() if name.lower() not in AUTH_PARAMS}
+
+
+class RemoteRequest(object):
+  """
+  One HTTP request, ``headers`` and the AUTH_PARAMS of ``params`` and ``data`` are not part of
+  the cache key (they hold the API keys), responses are shared between keys.
+  """
+
+  def __init__(self, method, url, params=None, data=None, headers=None):
+    self.method = method
+    self.url = url
+    self.params = params
+    self.data = data
+    self.headers = headers
+
+  def cache_key(self):
+    content = json.dumps([self.method, self.url, without_auth(self.params), without_auth(self.data)], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class TokenBucket(object):
+  """
+  Allows ``rate`` requests per second with bursts of up to ``capacity`` requests.
+  """
+
+  def __init__(self, rate, capacity=1):
+    self.rate = rate
+    self.capacity = capacity
+    self.tokens = capacity
+    self.updated = time.monotonic()
+
+  def reserve(self):
+    """
+    Takes one token and returns the seconds to wait until it is available. The tokens may become
+    negative, so concurrent callers are queued one after another.
+    """
+    now = time.monotonic()
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+    self.tokens -= 1
+    if self.tokens >= 0:
+      return 0
+    return -self.tokens / self.rate
+
+  async def acquire(self):
+    delay = self.reserve()
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+
+class ResponseCache(object):
+  """
+  Content-addressed on-disk cache of response bodies.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def path(self, key):
+    return os.path.join(self.directory, key[:2], key + '.json')
+
+  def get(self, key):
+    try:
+      with open(self.path(key), 'r', encoding='utf-8') as fin:
+        return fin.read()
+    except FileNotFoundError:
+      return None
+
+  def put(self, key, body):
+    path = self.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+      fout.write(body)
+    os.replace(tmp_path, path)
+
+
+class RemoteClient(object):
+  """
+  Executes batches of RemoteRequests concurrently.
+
+  :param cache_dir: Directory of the response cache, no caching if None.
+  :param rate_limits: Requests per second per host name, hosts not listed use ``default_rate``.
+  :param concurrency: Maximal number of requests in flight.
+  """
+
+  def __init__(self, cache_dir=None, rate_limits=None, default_rate=None, concurrency=8, retries=3, backoff=1.0, timeout=60):
+    self.cache = ResponseCache(cache_dir) if cache_dir else None
+    self.rate_limits = rate_limits or {}
+    self.default_rate = default_rate
+    self.concurrency = concurrency
+    self.retries = retries
+    self.backoff = backoff
+    self.timeout = timeout
+    self.buckets = {}
+
+  def bucket(self, url):
+    host = urllib.parse.urlsplit(url).hostname
+    if host not in self.buckets:
+      rate = self.rate_limits.get(host, self.default_rate)
+      self.buckets[host] = TokenBucket(rate) if rate else None
+    return self.buckets[host]
+
+  def fetch_all(self, requests, raise_errors=True):
+    """
+    Returns the response bodies of all ``requests`` in the same order. If ``raise_errors`` is
+    False, failed requests yield None instead of raising a RemoteError.
+    """
+    return asyncio.run(self._fetch_all(requests, raise_errors, current_run()))
+
+  async def _fetch_all(self, requests, raise_errors, run):
+    semaphore = asyncio.Semaphore(self.concurrency)
+    connector = aiohttp.TCPConnector(limit=self.concurrency)
+    timeout = aiohttp.ClientTimeout(total=self.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+      return await asyncio.gather(*[self._fetch(session, semaphore, request, raise_errors, run) for request in requests])
+
+  def fetch_each(self, items, make_request, window=256, raise_errors=True):
+    """
+    Yields ``(item, response body)`` for all ``items`` in order. The requests created by
+    ``make_request`` run on one event loop and session in a thread, at most ``window`` of them
+    ahead of the consumer. The items are read as the window allows.
+    """
+    # The EngineRun of the caller, the thread of the loop has none
+    run = current_run()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    results = self._fetch_each(items, make_request, window, raise_errors, run)
+    try:
+      while True:
+        result = asyncio.run_coroutine_threadsafe(next_result(results), loop).result()
+        if result is None:
+          return
+        yield result
+    finally:
+      asyncio.run_coroutine_threadsafe(results.aclose(), loop).result()
+      loop.call_soon_threadsafe(loop.stop)
+      thread.join()
+      loop.close()
+
+  async def _fetch_each(self, items, make_request, window, raise_errors, run):
+    semaphore = asyncio.Semaphore(self.concurrency)
+    connector = aiohttp.TCPConnector(limit=self.concurrency)
+    timeout = aiohttp.ClientTimeout(total=self.timeout)
+    # The started requests in item order, a request is only started with a free slot
+    pending = asyncio.Queue()
+    slots = asyncio.Semaphore(window)
+
+    async def produce(session):
+      try:
+        for item in items:
+          await slots.acquire()
+          pending.put_nowait((item, asyncio.ensure_future(self._fetch(session, semaphore, make_request(item), raise_errors, run))))
+        pending.put_nowait(None)
+      except Exception as e:
+        pending.put_nowait(e)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+      producer = asyncio.ensure_future(produce(session))
+      try:
+        while True:
+          entry = await pending.get()
+          if entry is None:
+            return
+          if isinstance(entry, Exception):
+            raise entry
+          item, request = entry
+          slots.release()
+          yield item, await request
+      finally:
+        # Stops the requests started ahead when the consumer stops early
+        tasks = [producer]
+        while not pending.empty():
+          entry = pending.get_nowait()
+          if isinstance(entry, tuple):
+            tasks.append(entry[1])
+        for task in tasks:
+          task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+  async def _fetch(self, session, semaphore, request, raise_errors, run=None):
+    """
+    Returns the response body of ``request``, the latency of every attempt is recorded into the
+    EngineRun ``run``.
+    """
+    key = request.cache_key()
+    if self.cache is not None:
+      body = self.cache.get(key)
+      if body is not None:
+        return body
+
+    bucket = self.bucket(request.url)
+    async with semaphore:
+      attempt = 0
+      while True:
+        if bucket is not None:
+          await bucket.acquire()
+        retryable = True
+        start = time.perf_counter()
+        try:
+          async with session.request(request.method, request.url, params=request.params, data=request.data, headers=request.headers) as response:
+            body = await response.text()
+            status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+          error = e
+        else:
+          if status == 200:
+            break
+          error = "status %d" % status
+          # Only rate limiting and server errors are worth another try
+          retryable = (status == 429) or (status >= 500)
+        finally:
+          # Every attempt is one round trip, also the failed ones
+          if run is not None:
+            run.latencies['remote'].observe(time.perf_counter() - start)
+
+        if (not retryable) or (attempt == self.retries):
+          if raise_errors:
+            raise RemoteError("%s %s failed: %s" % (request.method, request.url, error))
+          return None
+        await asyncio.sleep(self.backoff * (2 ** attempt))
+        attempt += 1
+
+    if self.cache is not None:
+      self.cache.put(key, body)
+    return body
+
+async def next_result(results):
+  """
+  Returns the next value of the async generator ``results``, None at its end.
+  """
+  try:
+    return await results.__anext__()
+  except StopAsyncIteration:
+    return None
+
+def fetch_each(client, items, make_request, window=256, raise_errors=True):
+  """
+  Yields ``(item, response body)`` for all ``items`` in order, see RemoteClient.fetch_each.
+  """
+  return client.fetch_each(items, make_request, window, raise_errors)
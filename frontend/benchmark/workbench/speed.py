@@ -0,0 +1,234 @@
+'''
+Speed of the builtin engines. A run of an engine through predict_builtin is recorded as an
+EngineRun: its duration, the tokens and sentences it processed and latency histograms of
+
+  check    deciding whether a token is correct
+  suggest  producing the corrections of a token (engines that always correct, like norvig,
+           ngram and hmm, only report this one)
+  remote   one round trip of a remote engine (responses from the cache are not counted)
+
+The engines report their latencies to the run of their thread with ``measured`` and ``observe``,
+without a run they are not measured at all. Work handed to other threads takes the run along
+(see ``current_run``), like the requests of workbench.remote. Runs are stored per program, benchmark and result
+version as EngineSpeed rows, the newest of every program is shown in the speed leaderboard of the
+benchmark page.
+'''
+
+import time
+import threading
+import ujson as json
+
+# Upper bounds (seconds) of the latency histogram buckets, from 1µs to 60s
+LATENCY_BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 2) for m in (1.0, 2.5, 5.0)) + (60.0,)
+LATENCY_KINDS = ('check', 'suggest', 'remote')
+
+CURRENT = threading.local()
+
+
+class LatencyHistogram(object):
+  """
+  Counts of latencies per bucket of LATENCY_BUCKETS, the last count is above all bounds.
+  """
+
+  def __init__(self, counts=None, total=0.0):
+    self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS) + 1)
+    self.total = total
+
+  def observe(self, seconds, count=1):
+    idx = 0
+    while idx < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[idx]:
+      idx += 1
+    self.counts[idx] += count
+    self.total += seconds * count
+
+  def merge(self, other):
+    for idx, count in enumerate(other.counts):
+      self.counts[idx] += count
+    self.total += other.total
+
+  @property
+  def count(self):
+    return sum(self.counts)
+
+  def quantile(self, q):
+    """
+    Returns the upper bound of the bucket of the ``q`` quantile (nearest rank), None if empty.
+    """
+    count = self.count
+    if count == 0:
+      return None
+    rank = max(1, int(-(-q * count // 1)))
+    seen = 0
+    for idx, bucket_count in enumerate(self.counts):
+      seen += bucket_count
+      if seen >= rank:
+        return LATENCY_BUCKETS[idx] if idx < len(LATENCY_BUCKETS) else float('inf')
+    return float('inf')
+
+  def to_dict(self):
+    return {"counts": self.counts, "sum": self.total}
+
+  @classmethod
+  def from_dict(cls, content):
+    histogram = cls(total=content["sum"])
+    # Stored with other buckets, only the total is comparable
+    if len(content["counts"]) == len(histogram.counts):
+      histogram.counts = list(content["counts"])
+    return histogram
+
+
+class EngineRun(object):
+  """
+  The measurements of one prediction run of an engine. While it is entered, the latencies
+  reported in the same thread are added to it.
+  """
+
+  def __init__(self, engine, lang_code):
+    self.engine = engine
+    self.lang_code = lang_code
+    self.latencies = dict((kind, LatencyHistogram()) for kind in LATENCY_KINDS)
+    self.tokens = 0
+    self.sentences = 0
+    self.seconds = 0.0
+    self.start = None
+    self.parent = None
+
+  def __enter__(self):
+    self.parent = getattr(CURRENT, 'run', None)
+    CURRENT.run = self
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.seconds += time.perf_counter() - self.start
+    CURRENT.run = self.parent
+    return False
+
+  def records(self, input):
+    """
+    Returns the SentenceRecords of ``input`` (see corpus.sentence_records), counted while the
+    engine iterates over them.
+    """
+    return CountedRecords(self, input)
+
+  def count(self, records):
+    """
+    Counts the SentenceRecords ``records`` as processed, for engines fed in batches.
+    """
+    self.sentences += len(records)
+    self.tokens += sum(len(record.tokens) for record in records)
+
+  def merge_latencies(self, latencies):
+    for kind, content in latencies.items():
+      self.latencies[kind].merge(LatencyHistogram.from_dict(content))
+
+  def latency_dict(self):
+    return dict((kind, histogram.to_dict()) for kind, histogram in self.latencies.items())
+
+  @property
+  def tokens_per_second(self):
+    return self.tokens / self.seconds if self.seconds > 0 else 0.0
+
+  @property
+  def sentences_per_second(self):
+    return self.sentences / self.seconds if self.seconds > 0 else 0.0
+
+
+class CountedRecords(object):
+  """
+  Iterable over the SentenceRecords of an input, counting the sentences and tokens of the first
+  complete pass for its EngineRun.
+  """
+
+  def __init__(self, run, input):
+    self.run = run
+    self.input = input
+    self.counted = False
+
+  def __iter__(self):
+    from .corpus import sentence_records
+
+    sentences = 0
+    tokens = 0
+    for record in sentence_records(self.input):
+      sentences += 1
+      tokens += len(record.tokens)
+      yield record
+    if not self.counted:
+      self.counted = True
+      self.run.sentences += sentences
+      self.run.tokens += tokens
+
+
+def current_run():
+  return getattr(CURRENT, 'run', None)
+
+def observe(kind, seconds, count=1):
+  """
+  Adds ``count`` latencies of ``seconds`` to the ``kind`` histogram of the current run.
+  """
+  run = getattr(CURRENT, 'run', None)
+  if run is not None:
+    run.latencies[kind].observe(seconds, count)
+
+def measured(kind, function):
+  """
+  Returns ``function``, timing every call as a ``kind`` latency if a run is recorded.
+  """
+  run = getattr(CURRENT, 'run', None)
+  if run is None:
+    return function
+  histogram = run.latencies[kind]
+
+  def timed(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return function(*args, **kwargs)
+    finally:
+      histogram.observe(time.perf_counter() - start)
+  return timed
+
+
+def save_engine_run(run, program, benchmark, version=None):
+  from .models import EngineSpeed
+
+  return EngineSpeed.objects.create(
+    program=program,
+    benchmark=benchmark,
+    version=version,
+    lang_code=run.lang_code,
+    seconds=run.seconds,
+    tokens=run.tokens,
+    sentences=run.sentences,
+    tokens_per_second=run.tokens_per_second,
+    sentences_per_second=run.sentences_per_second,
+    latencies=json.dumps(run.latency_dict())
+  )
+
+def speed_leaderboard(benchmark_id):
+  """
+  Returns the newest EngineSpeed of every program for a benchmark, the fastest first, each with
+  ``check``, ``suggest`` and ``remote`` (p50, p95) latencies in milliseconds and the published
+  ``result`` of the program, if any.
+  """
+  from .models import EngineSpeed
+  from .versions import published_results
+
+  results = dict((r.program_id, r) for r in published_results(benchmark_id))
+  newest = {}
+  for speed in EngineSpeed.objects.filter(benchmark_id=benchmark_id).select_related('program').order_by('-created'):
+    if speed.program_id not in newest:
+      newest[speed.program_id] = speed
+
+  leaderboard = []
+  for speed in sorted(newest.values(), key=lambda s: -s.tokens_per_second):
+    histograms = speed.latency_histograms()
+    for kind in LATENCY_KINDS:
+      histogram = histograms.get(kind)
+      if histogram is None or histogram.count == 0:
+        setattr(speed, kind, None)
+      else:
+        setattr(speed, kind, (histogram.quantile(0.5) * 1000, histogram.quantile(0.95) * 1000))
+    speed.result = results.get(speed.program_id)
+    leaderboard.append(speed)
+  return leaderboard
@@ -0,0 +1,254 @@
+'''
+Lightweight local stand-ins for the remote services used by the builtin engines, so that the
+engines can be tested and load-tested without network access.
+
+Run one of them with e.g. ``python3 -m workbench.stub_servers languagetool --port 8010``, the
+evaluator stand-in with ``python3 -m workbench.stub_servers evaluator --port 1338`` and
+EVALUATOR_URL pointing to it.
+'''
+
+import time
+import difflib
+import argparse
+import threading
+import urllib.parse
+import regex as re
+import ujson as json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Misspellings reported by the LanguageTool stub, together with their replacements
+LT_STUB_CORRECTIONS = {
+  "teh": ["the", "ten"],
+  "hte": ["the"],
+  "recieve": ["receive"],
+  "seperate": ["separate"],
+  "alot": ["a lot"],
+  "definately": ["definitely"]
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+  """
+  Base handler of all stubs, counts the requests it received.
+  """
+
+  def read_form(self):
+    """
+    Returns the parameters of a GET request's query string or a POST request's form body.
+    """
+    if self.command == 'GET':
+      return urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+    length = int(self.headers.get('Content-Length', 0))
+    return urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+
+  def send_json(self, content, status=200):
+    body = json.dumps(content).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+class LanguageToolStubHandler(StubHandler):
+  """
+  Implements the ``check`` endpoint of the LanguageTool HTTP API, every word found in
+  LT_STUB_CORRECTIONS is reported as a match. GrammarBot serves the same API via GET.
+  """
+
+  def do_POST(self):
+    if not urllib.parse.urlsplit(self.path).path.rstrip('/').endswith('/check'):
+      self.send_json({"error": "unknown endpoint"}, 404)
+      return
+    self.server.num_requests += 1
+
+    form = self.read_form()
+    text = form.get('text', [''])[0]
+
+    matches = []
+    for match in re.finditer(r'\w+', text):
+      if match.group().lower() in LT_STUB_CORRECTIONS:
+        matches.append({
+          "message": "Possible spelling mistake found.",
+          "offset": match.start(),
+          "length": len(match.group()),
+          "replacements": [{"value": v} for v in LT_STUB_CORRECTIONS[match.group().lower()]],
+          "rule": {"id": "MORFOLOGIK_RULE_EN_US", "issueType": "misspelling"}
+        })
+
+    self.send_json({
+      "software": {"name": "LanguageTool stub"},
+      "language": {"code": form.get('language', [''])[0]},
+      "matches": matches
+    })
+
+  do_GET = do_POST
+
+
+def load_entries(filepath, key):
+  """
+  Returns the entries ``key`` of a benchmark file grouped by sentence, ``{(aidx, sidx): [(ids,
+  entry), ...]}`` where ``ids`` are the word indices of the entry's ID (two for a range).
+  """
+  with open(filepath, 'r', encoding='utf-8') as fin:
+    content = json.loads(fin.read())
+  sentences = {}
+  for entry in content[key]:
+    nums = [int(n) for n in re.findall(r'\d+', entry["id"] if "id" in entry else entry["affected-id"])]
+    sentences.setdefault((nums[0], nums[1]), []).append((nums[2::3], entry))
+  return sentences
+
+def align_tokens(source, predicted):
+  """
+  Returns the indices of the source tokens every predicted token is made of. A merged token
+  (a corrected split or hyphenation) is made of the source tokens that spell it, an inserted
+  token belongs to the source token before it and a kept repeated word to its first occurrence.
+  """
+  sids = [None] * len(predicted)
+  matcher = difflib.SequenceMatcher(None, source, predicted, autojunk=False)
+  for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    if tag == 'equal' or (tag == 'replace' and i2 - i1 == j2 - j1):
+      for offset in range(j2 - j1):
+        sids[j1 + offset] = [i1 + offset]
+    elif tag == 'replace':
+      i = i1
+      for j in range(j1, j2):
+        text = predicted[j].replace("-", "")
+        k = i + 1
+        while k < i2 and text.startswith("".join(source[i:k + 1]).replace("-", "")):
+          k += 1
+        if j == j2 - 1:
+          k = max(k, i2)
+        sids[j] = list(range(i, k)) if i < i2 else [i2 - 1]
+        i = min(k, i2)
+    elif tag == 'insert':
+      for j in range(j1, j2):
+        sids[j] = [max(i1 - 1, 0)]
+
+  used = set(sid for ids in sids for sid in ids)
+  for j, ids in enumerate(sids):
+    if len(ids) == 1 and ids[0] > 0 and source[ids[0] - 1] == source[ids[0]] and (ids[0] - 1) not in used:
+      used.discard(ids[0])
+      used.add(ids[0] - 1)
+      sids[j] = [ids[0] - 1]
+  return sids
+
+def evaluate_directory(path):
+  """
+  Evaluates the ``prediction.json`` in ``path`` against its ``source.json`` and
+  ``groundtruth.json`` like the evaluator does, on a simpler token alignment. Writes
+  ``alignments.json`` to ``path`` and returns the evaluation and the number of source tokens.
+  """
+  from .utils import call_regex
+  from .synthetic import EvaluationCounts
+
+  source = load_entries(path + 'source.json', 'tokens')
+  groundtruth = load_entries(path + 'groundtruth.json', 'corrections')
+  prediction = load_entries(path + 'prediction.json', 'predictions')
+
+  counts = EvaluationCounts()
+  num_tokens = 0
+  with open(path + 'alignments.json', 'w', encoding='utf-8') as fout:
+    fout.write("{ \"alignments\": [\n")
+    separator = ""
+    for key in sorted(source.keys()):
+      source_tokens = [entry["token"] for ids, entry in sorted(source[key], key=lambda e: e[0])]
+      units = [(list(range(ids[0], ids[-1] + 1)), entry["correct"], entry["type"]) for ids, entry in groundtruth.get(key, [])]
+      predicted = [entry["token"] for ids, entry in sorted(prediction.get(key, []), key=lambda e: e[0])]
+      sids = align_tokens(source_tokens, predicted)
+      num_tokens += len(source_tokens)
+
+      unit_of = {}
+      for uidx, (ids, correct, error_type) in enumerate(units):
+        for sid in ids:
+          unit_of[sid] = uidx
+      predicted_of = [[] for _ in units]
+      entries = []
+      for pidx, token in enumerate(predicted):
+        gids = sorted(set(unit_of[sid] for sid in sids[pidx] if sid in unit_of))
+        for uidx in gids:
+          predicted_of[uidx].append(token)
+        corrected = [source_tokens[sid] for sid in sids[pidx] if sid < len(source_tokens)] != [token]
+        entries.append({"id": "a%d.s%d.w%d" % (key[0], key[1], pidx), "token": token, "corrected": corrected, "gids": gids, "sids": sids[pidx]})
+
+      has_errors = False
+      all_correct = True
+      for uidx, (ids, correct, error_type) in enumerate(units):
+        has_errors = has_errors or error_type != "NONE"
+        changed = predicted_of[uidx] != [source_tokens[sid] for sid in ids if sid < len(source_tokens)]
+        fixed = predicted_of[uidx] == (call_regex(correct)[0] if correct != "" else [])
+        all_correct = counts.count(error_type, changed, fixed) and all_correct
+      counts.count_sentence(len(units), has_errors, all_correct)
+
+      if len(entries) > 0:
+        fout.write(separator + ",\n".join("  " + json.dumps(entry, ensure_ascii=False) for entry in entries))
+        separator = ",\n"
+    fout.write("\n]}")
+
+  return counts.evaluation(), num_tokens
+
+
+class EvaluatorStubHandler(StubHandler):
+  """
+  Implements ``/api/v1/evaluate`` of the evaluator, see evaluate_directory. Like the evaluator
+  it answers with the evaluation encoded as json string. Every answer is delayed by
+  ``server.latency`` seconds plus ``server.latency_per_token`` seconds per source token.
+  """
+
+  def do_POST(self):
+    if urllib.parse.urlsplit(self.path).path.rstrip('/') != '/api/v1/evaluate':
+      self.send_json({"statusMessage": "unknown endpoint"}, 404)
+      return
+    self.server.num_requests += 1
+
+    length = int(self.headers.get('Content-Length', 0))
+    try:
+      request = json.loads(self.rfile.read(length).decode('utf-8'))
+      path = request["path"]
+      evaluation, num_tokens = evaluate_directory(path if path.endswith('/') else path + '/')
+    except (OSError, ValueError, KeyError) as e:
+      self.send_json({"statusMessage": "%s: %s" % (type(e).__name__, e)}, 500)
+      return
+
+    time.sleep(self.server.latency + self.server.latency_per_token * num_tokens)
+    self.send_json(json.dumps(evaluation))
+
+
+STUB_HANDLERS = {
+  'languagetool': LanguageToolStubHandler,
+  'grammarbot': LanguageToolStubHandler,
+  'evaluator': EvaluatorStubHandler
+}
+
+def start_stub_server(handler_class, host='127.0.0.1', port=0, latency=0.0, latency_per_token=0.0):
+  """
+  Starts a stub server in a background thread and returns it, the bound address is found in
+  ``server.server_address``. Stop it with ``server.shutdown()``.
+  """
+  server = ThreadingHTTPServer((host, port), handler_class)
+  server.num_requests = 0
+  server.latency = latency
+  server.latency_per_token = latency_per_token
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  return server
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Runs a local stub of a remote service.')
+  parser.add_argument('service', choices=sorted(STUB_HANDLERS.keys()))
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8010)
+  parser.add_argument('--latency', type=float, default=0.0, help='Seconds every answer of the evaluator is delayed')
+  parser.add_argument('--latency-per-token', type=float, default=0.0, help='Additional delay of the evaluator per source token')
+  args = parser.parse_args()
+
+  server = ThreadingHTTPServer((args.host, args.port), STUB_HANDLERS[args.service])
+  server.num_requests = 0
+  server.latency = args.latency
+  server.latency_per_token = args.latency_per_token
+  print("Serving %s stub on %s:%d" % (args.service, args.host, args.port))
+  server.serve_forever()
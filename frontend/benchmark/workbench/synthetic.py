@@ -0,0 +1,544 @@
+'''
+Synthetic benchmarks for scale and load testing without the Wikipedia dump and the generator.
+A SyntheticBenchmark produces the files of a benchmark in the formats written by the generator
+and the evaluator and read by the helpers:
+
+* ``source.json`` and ``groundtruth.json`` (with the ``information`` block), ``raw.txt``
+* ``prediction.json`` of a simulated program that corrects a share of the errors
+* ``alignments.json`` and ``evaluation.json``, the evaluator's answer for that prediction
+
+Everything is derived from the seed, the same parameters always produce the same files, no
+matter how many workers write them. Create one with ``python3 manage.py generate_benchmark``.
+'''
+
+import os
+import random
+import shutil
+import multiprocessing
+import ujson as json
+
+# Clean text is drawn from these words, the pairs of REAL_WORD_CONFUSIONS and the compounds of
+# HYPHENATED_COMPOUNDS are mixed in where such errors are placed
+SYNTHETIC_WORDS = [
+  "the", "of", "and", "in", "was", "for", "on", "with", "as", "by", "his", "her", "that", "from",
+  "first", "city", "after", "during", "which", "later", "season", "school", "known", "between",
+  "river", "served", "family", "national", "became", "station", "church", "album", "released",
+  "village", "county", "population", "district", "several", "building", "company", "league",
+  "government", "members", "president", "century", "following", "career", "history", "under",
+  "university", "published", "region", "record", "including", "played", "island", "northern",
+  "southern", "eastern", "western", "bridge", "railway", "football", "general", "original",
+  "founded", "located", "service", "director", "support", "species", "tournament", "military"
+]
+REAL_WORD_CONFUSIONS = [
+  ("their", "there"), ("then", "than"), ("affect", "effect"), ("lose", "loose"), ("accept", "except"),
+  ("quiet", "quite"), ("whether", "weather"), ("principal", "principle"), ("passed", "past")
+]
+HYPHENATED_COMPOUNDS = ["well-known", "long-term", "so-called", "full-time", "world-class", "short-lived"]
+SENTENCE_PUNCTUATION = [",", ";"]
+WRONG_FINAL_PUNCTUATION = [",", ";", ":"]
+
+# Error types the generator can place, the other types of the evaluation stay empty
+SYNTHETIC_ERROR_TYPES = ["NON_WORD", "REAL_WORD", "CAPITALISATION", "HYPHENATION", "SPLIT", "REPEAT", "PUNCTUATION"]
+EVALUATION_CATEGORIES = ["NONE", "NON_WORD", "REAL_WORD", "SPLIT", "HYPHENATION", "COMPOUND_HYPHEN", "CONCATENATION", "CAPITALISATION", "ARCHAIC", "REPEAT", "PUNCTUATION", "MENTION_MISMATCH", "TENSE"]
+
+PUNCTUATION_TOKENS = set([".", ",", ";", ":", "!", "?"])
+
+
+class SyntheticSentence(object):
+  """
+  One generated sentence. ``units`` are the groundtruth entries ``(source ids, correct, type)``,
+  ``predictions`` the tokens of the simulated program ``(token, corrected, unit index, source ids)``.
+  """
+
+  def __init__(self, aidx, sidx, raw, source, units, unit_ids, positions, predictions):
+    self.aidx = aidx
+    self.sidx = sidx
+    self.raw = raw
+    # (token, space) of every source token
+    self.source = source
+    self.units = units
+    # Indices of the source tokens of every unit
+    self.unit_ids = unit_ids
+    # Character position of every unit in the raw sentence
+    self.positions = positions
+    self.predictions = predictions
+
+
+def token_spaces(tokens):
+  """
+  Returns whether each of ``tokens`` is followed by a space, only punctuation is not.
+  """
+  return [token not in PUNCTUATION_TOKENS for token in tokens[1:]] + [False]
+
+def join_tokens(tokens):
+  """
+  Returns the sentence text of ``tokens`` and the character position of every token.
+  """
+  spaces = token_spaces(tokens)
+  positions = []
+  position = 0
+  for token, space in zip(tokens, spaces):
+    positions.append(position)
+    position += len(token) + space
+  return "".join([token + " " if space else token for token, space in zip(tokens, spaces)]), positions
+
+
+class SyntheticBenchmark(object):
+  """
+  Generator of a benchmark with ``num_articles`` articles.
+
+  :param sentences_per_article: ``(min, max)`` number of sentences of an article.
+  :param tokens_per_sentence: ``(min, max)`` number of words of a sentence.
+  :param error_counts: Number of errors per type in the whole benchmark (see
+    SYNTHETIC_ERROR_TYPES). Errors are spread randomly over the sentences, those a sentence has
+    no word left for are dropped.
+  :param correction_rate: Share of the errors the simulated program corrects.
+  :param false_positive_rate: Share of the correct words the simulated program changes.
+  """
+
+  def __init__(self, num_articles, sentences_per_article=(5, 15), tokens_per_sentence=(8, 24), error_counts=None,
+               correction_rate=0.6, false_positive_rate=0.01, seed=0, words=None):
+    self.num_articles = num_articles
+    self.tokens_per_sentence = tokens_per_sentence
+    self.correction_rate = correction_rate
+    self.false_positive_rate = false_positive_rate
+    self.seed = seed
+    self.words = words or SYNTHETIC_WORDS
+    self.word_set = set(self.words)
+
+    rnd = random.Random(seed)
+    self.num_sentences = [rnd.randint(sentences_per_article[0], sentences_per_article[1]) for _ in range(num_articles)]
+    total_sentences = sum(self.num_sentences)
+    if error_counts is None:
+      # About one error in twenty words
+      mean_words = (tokens_per_sentence[0] + tokens_per_sentence[1]) / 2.0
+      per_type = int(total_sentences * mean_words / 20.0 / len(SYNTHETIC_ERROR_TYPES))
+      error_counts = dict((error_type, per_type) for error_type in SYNTHETIC_ERROR_TYPES)
+    for error_type in error_counts:
+      if error_type not in SYNTHETIC_ERROR_TYPES:
+        raise ValueError("unsupported error type %s, supported are %s" % (error_type, ", ".join(SYNTHETIC_ERROR_TYPES)))
+    self.error_counts = error_counts
+
+    # The errors of every sentence by its index in the benchmark
+    self.errors = {}
+    for error_type in sorted(error_counts.keys()):
+      for _ in range(error_counts[error_type]):
+        self.errors.setdefault(rnd.randrange(total_sentences), []).append(error_type)
+
+  def information(self):
+    return {"numArticles": self.num_articles, "sentences": self.num_sentences}
+
+  def sentences(self, start=0, stop=None):
+    """
+    Generates the SyntheticSentences of the articles ``start`` to ``stop`` in order. Every
+    article has its own random generator, so any range of articles can be generated alone.
+    """
+    stop = self.num_articles if stop is None else stop
+    idx = sum(self.num_sentences[:start])
+    for aidx in range(start, stop):
+      rnd = random.Random("%d/%d" % (self.seed, aidx))
+      for sidx in range(self.num_sentences[aidx]):
+        yield self.generate_sentence(rnd, aidx, sidx, self.errors.get(idx, []))
+        idx += 1
+
+  def generate_sentence(self, rnd, aidx, sidx, errors):
+    num_words = rnd.randint(self.tokens_per_sentence[0], self.tokens_per_sentence[1])
+    clean = rnd.choices(self.words, k=num_words)
+
+    # Words the errors are applied to, the first word is only changed by CAPITALISATION
+    targets = {}
+    # PUNCTUATION replaces the final period, see below
+    word_errors = [error_type for error_type in errors if error_type != "PUNCTUATION"]
+    free = rnd.sample(range(1, num_words), min(len(word_errors), num_words - 1))
+    for error_type in word_errors:
+      if error_type == "CAPITALISATION" and 0 not in targets:
+        targets[0] = error_type
+      elif len(free) > 0:
+        targets[free.pop()] = error_type
+    for widx, error_type in targets.items():
+      if error_type == "REAL_WORD":
+        clean[widx] = rnd.choice(rnd.choice(REAL_WORD_CONFUSIONS))
+      elif error_type == "HYPHENATION":
+        clean[widx] = rnd.choice(HYPHENATED_COMPOUNDS)
+    clean[0] = clean[0].capitalize()
+    if num_words > 6 and rnd.random() < 0.5:
+      comma = rnd.randint(2, num_words - 2)
+      clean.insert(comma + 1, rnd.choice(SENTENCE_PUNCTUATION))
+      targets = dict(((w + 1 if w > comma else w), t) for w, t in targets.items())
+    clean.append(".")
+    if "PUNCTUATION" in errors:
+      targets[len(clean) - 1] = "PUNCTUATION"
+
+    # The groundtruth entries, every source token belongs to exactly one of them
+    units = []
+    unit_words = []
+    for widx, word in enumerate(clean):
+      error_type = targets.get(widx) if targets else None
+      if error_type is None:
+        units.append(([word], word, "NONE"))
+      elif error_type == "NON_WORD":
+        units.append(([self.misspell(rnd, word)], word, error_type))
+      elif error_type == "REAL_WORD":
+        pair = [p for p in REAL_WORD_CONFUSIONS if word in p][0]
+        units.append(([pair[1] if word == pair[0] else pair[0]], word, error_type))
+      elif error_type == "CAPITALISATION":
+        units.append(([word.lower() if word[0].isupper() else word.capitalize()], word, error_type))
+      elif error_type == "HYPHENATION":
+        units.append((word.split("-"), word, error_type))
+      elif error_type == "SPLIT":
+        cut = rnd.randint(1, len(word) - 1) if len(word) > 1 else 1
+        units.append(([word[:cut], word[cut:]] if len(word) > 1 else [word], word, error_type if len(word) > 1 else "NONE"))
+      elif error_type == "REPEAT":
+        units.append(([word], word, "NONE"))
+        unit_words.append(widx)
+        units.append(([word], "", error_type))
+      elif error_type == "PUNCTUATION":
+        units.append(([rnd.choice(WRONG_FINAL_PUNCTUATION)], word, error_type))
+      unit_words.append(widx)
+
+    raw, word_positions = join_tokens(clean)
+    if len(units) == len(clean):
+      positions = word_positions
+    else:
+      # A repeated word has no text of its own, it is found after the word it repeats
+      positions = [word_positions[widx] + (len(clean[widx]) if units[uidx][1] == "" else 0) for uidx, widx in enumerate(unit_words)]
+
+    source_tokens = []
+    unit_ids = []
+    for (tokens, correct, error_type) in units:
+      if len(tokens) == 1:
+        unit_ids.append([len(source_tokens)])
+        source_tokens.append(tokens[0])
+      else:
+        unit_ids.append(list(range(len(source_tokens), len(source_tokens) + len(tokens))))
+        source_tokens.extend(tokens)
+    source = list(zip(source_tokens, token_spaces(source_tokens)))
+
+    predictions = []
+    random = rnd.random
+    for uidx, (tokens, correct, error_type) in enumerate(units):
+      if error_type == "NONE":
+        if random() < self.false_positive_rate and correct not in PUNCTUATION_TOKENS:
+          predictions.append((self.misspell(rnd, correct), True, uidx, unit_ids[uidx]))
+        else:
+          predictions.append((correct, False, uidx, unit_ids[uidx]))
+      elif random() < self.correction_rate:
+        if correct != "":
+          predictions.append((correct, True, uidx, unit_ids[uidx]))
+      else:
+        for offset, token in enumerate(tokens):
+          predictions.append((token, False, uidx, [unit_ids[uidx][offset]]))
+
+    return SyntheticSentence(aidx, sidx, raw, source, units, unit_ids, positions, predictions)
+
+  def misspell(self, rnd, word):
+    """
+    Returns a variation of ``word`` that is not in the vocabulary.
+    """
+    for _ in range(10):
+      if len(word) < 2:
+        candidate = word + word
+      else:
+        pos = rnd.randrange(len(word) - 1)
+        operation = rnd.randrange(3)
+        if operation == 0:
+          candidate = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+        elif operation == 1:
+          candidate = word[:pos] + word[pos + 1:]
+        else:
+          candidate = word[:pos] + word[pos] + word[pos:]
+      if candidate != word and candidate.lower() not in self.word_set:
+        return candidate
+    return word + "x"
+
+  def write(self, directory, workers=1):
+    """
+    Writes all files of the benchmark to ``directory`` and returns the evaluation. The articles
+    are split into one part per worker process, the parts are written in parallel and joined
+    afterwards. The memory needed does not grow with the benchmark.
+    """
+    os.makedirs(directory, exist_ok=True)
+    step = max(1, (self.num_articles + workers - 1) // workers)
+    parts = [(idx, start, min(start + step, self.num_articles)) for idx, start in enumerate(range(0, self.num_articles, step))]
+    if workers > 1:
+      with multiprocessing.Pool(workers) as pool:
+        part_counts = pool.starmap(write_part, [(self, directory) + part for part in parts])
+    else:
+      part_counts = [write_part(self, directory, *part) for part in parts]
+
+    information = json.dumps(self.information())
+    for name, (header, footer) in file_layouts(information).items():
+      with open(os.path.join(directory, name), 'w', encoding='utf-8') as fout:
+        fout.write(header)
+        separator = ""
+        for idx, _, _ in parts:
+          part_filepath = os.path.join(directory, "%s.part%d" % (name, idx))
+          with open(part_filepath, 'r', encoding='utf-8') as fin:
+            first = fin.read(1)
+            if len(first) > 0:
+              fout.write(separator + first)
+              shutil.copyfileobj(fin, fout)
+              separator = "" if name == "raw.txt" else ",\n"
+          os.remove(part_filepath)
+        fout.write(footer)
+
+    counts = EvaluationCounts()
+    for c in part_counts:
+      counts.merge(c)
+    evaluation = counts.evaluation()
+    with open(os.path.join(directory, "evaluation.json"), 'w', encoding='utf-8') as fout:
+      fout.write(json.dumps(evaluation, indent=1))
+    return evaluation
+
+  def build(self):
+    """
+    Returns the SyntheticCorpus of the benchmark, everything is kept in memory.
+    """
+    return SyntheticCorpus(self)
+
+
+# Entries of the benchmark files, formatting them directly is much faster than dumping dicts
+SOURCE_ENTRY = '{"id": "%s%d", "token": %s, "pos": %d, "length": %d, "space": %s}'
+GROUNDTRUTH_ENTRY = '{"affected-id": "%s", "correct": %s, "pos": %d, "length": %d, "type": "%s"}'
+PREDICTION_ENTRY = '{"id": "%s", "token": %s, "suggestions": [%s], "space": %s}'
+ALIGNMENT_ENTRY = '{"id": "%s%d", "token": %s, "corrected": %s, "gids": [%d], "sids": [%s]}'
+JSON_BOOLEANS = ("false", "true")
+
+def file_layouts(information):
+  """
+  Returns the header and footer of every benchmark file.
+  """
+  return {
+    "source.json": ("{\n \"tokens\": [\n", "\n ],\n \"information\": " + information + "\n}"),
+    "groundtruth.json": ("{\n \"corrections\": [\n", "\n ],\n \"information\": " + information + "\n}"),
+    "prediction.json": ("{ \"predictions\": [\n", "\n  ]\n}"),
+    "alignments.json": ("{\n \"alignments\": [\n", "\n ]\n}"),
+    "raw.txt": ("", "")
+  }
+
+def write_part(benchmark, directory, idx, start, stop):
+  """
+  Writes the entries of the articles ``start`` to ``stop`` into part files, returns their
+  EvaluationCounts.
+  """
+  counts = EvaluationCounts()
+  files = {}
+  for name in file_layouts("").keys():
+    files[name] = open(os.path.join(directory, "%s.part%d" % (name, idx)), 'w', encoding='utf-8')
+  try:
+    separators = dict((name, "") for name in files)
+    for sentence in benchmark.sentences(start, stop):
+      counts.add(sentence)
+      files["raw.txt"].write(sentence.raw + "\n")
+      for name, line in sentence_entries(sentence).items():
+        if len(line) > 0:
+          files[name].write(separators[name] + "  " + line)
+          separators[name] = ",\n"
+  finally:
+    for f in files.values():
+      f.close()
+  return counts
+
+QUOTED = {}
+
+def quote(token):
+  """
+  Returns ``token`` as json string, the texts of the vocabulary are cached.
+  """
+  quoted = QUOTED.get(token)
+  if quoted is None:
+    quoted = json.dumps(token, ensure_ascii=False)
+    if len(QUOTED) < 100000:
+      QUOTED[token] = quoted
+  return quoted
+
+def sentence_entries(sentence):
+  """
+  Returns the json entries of ``sentence`` for every file of the benchmark, as one line of
+  comma separated entries per file.
+  """
+  prefix = "a%d.s%d.w" % (sentence.aidx, sentence.sidx)
+  source = []
+  position = 0
+  for tidx, (token, space) in enumerate(sentence.source):
+    source.append(SOURCE_ENTRY % (prefix, tidx, quote(token), position, len(token), JSON_BOOLEANS[space]))
+    position += len(token) + space
+
+  groundtruth = []
+  for (tokens, correct, error_type), ids, pos in zip(sentence.units, sentence.unit_ids, sentence.positions):
+    affected = prefix + str(ids[0]) if len(ids) == 1 else "%s%d-%s%d" % (prefix, ids[0], prefix, ids[-1])
+    groundtruth.append(GROUNDTRUTH_ENTRY % (affected, quote(correct), pos, len(correct), error_type))
+
+  prediction = []
+  alignments = []
+  predictions = sentence.predictions
+  for pidx, (token, corrected, uidx, sids) in enumerate(predictions):
+    space = (pidx + 1 < len(predictions)) and (predictions[pidx + 1][0] not in PUNCTUATION_TOKENS)
+    quoted = quote(token)
+    # A prediction covers the source words up to the next one, a removed repeat is merged into
+    # the word before it
+    last = predictions[pidx + 1][3][0] - 1 if pidx + 1 < len(predictions) else len(sentence.source) - 1
+    covered = prefix + str(sids[0]) if last == sids[0] else "%s%d-%s%d" % (prefix, sids[0], prefix, last)
+    prediction.append(PREDICTION_ENTRY % (covered, quoted, quoted if corrected else "", JSON_BOOLEANS[space]))
+    alignments.append(ALIGNMENT_ENTRY % (prefix, pidx, quoted, JSON_BOOLEANS[corrected], uidx, sids[0] if len(sids) == 1 else ", ".join(map(str, sids))))
+
+  return {
+    "source.json": ", ".join(source),
+    "groundtruth.json": ", ".join(groundtruth),
+    "prediction.json": ", ".join(prediction),
+    "alignments.json": ", ".join(alignments)
+  }
+
+
+class EvaluationCounts(object):
+  """
+  Counts the detections and corrections of a program per error category and turns them into an
+  evaluation in the format of the evaluator's response.
+  """
+
+  def __init__(self):
+    self.categories = dict((name, {"total": 0, "found": 0, "corrected": 0, "fp": 0}) for name in EVALUATION_CATEGORIES)
+    self.num_sentences = 0
+    self.num_error_free = 0
+    self.num_corrected_sentences = 0
+    self.num_words = 0
+
+  def merge(self, other):
+    for name, category in other.categories.items():
+      for key, value in category.items():
+        self.categories[name][key] += value
+    self.num_sentences += other.num_sentences
+    self.num_error_free += other.num_error_free
+    self.num_corrected_sentences += other.num_corrected_sentences
+    self.num_words += other.num_words
+
+  def count(self, error_type, changed, fixed):
+    """
+    Counts one groundtruth entry: whether the program changed its tokens and whether they are
+    correct afterwards. Returns whether the entry is correct.
+    """
+    category = self.categories[error_type]
+    category["total"] += 1
+    if error_type == "NONE":
+      if changed:
+        category["fp"] += 1
+        return False
+      category["corrected"] += 1
+      return True
+    if changed:
+      category["found"] += 1
+    if fixed:
+      category["corrected"] += 1
+    return fixed
+
+  def count_sentence(self, num_words, has_errors, all_correct):
+    self.num_sentences += 1
+    self.num_words += num_words
+    if not has_errors:
+      self.num_error_free += 1
+    if all_correct:
+      self.num_corrected_sentences += 1
+
+  def add(self, sentence):
+    changed = set(p[2] for p in sentence.predictions if p[1])
+    predicted = set(p[2] for p in sentence.predictions)
+    all_correct = True
+    for uidx, (tokens, correct, error_type) in enumerate(sentence.units):
+      # Corrected REPEATs have no prediction token left
+      fixed = (uidx in changed) or (correct == "" and uidx not in predicted)
+      all_correct = self.count(error_type, fixed if error_type != "NONE" else uidx in changed, fixed) and all_correct
+    self.count_sentence(len(sentence.units), any(unit[2] != "NONE" for unit in sentence.units), all_correct)
+
+  def evaluation(self):
+    evaluation = {}
+    detected = corrected = num_errors = 0
+    equal_score = 0.0
+    num_types = 0
+    for name in EVALUATION_CATEGORIES:
+      c = self.categories[name]
+      if name == "NONE":
+        detection = {"tp": 0, "fp": c["fp"], "fn": 0, "tn": c["corrected"]}
+        correction = dict(detection)
+      else:
+        detection = {"tp": c["found"], "fp": 0, "fn": c["total"] - c["found"], "tn": 0}
+        correction = {"tp": c["corrected"], "fp": 0, "fn": c["total"] - c["corrected"], "tn": 0}
+        detected += c["found"]
+        corrected += c["corrected"]
+        num_errors += c["total"]
+      if c["total"] > 0:
+        equal_score += c["corrected"] / float(c["total"])
+        num_types += 1
+      evaluation[name] = dict(
+        scores(detection["tp"], detection["fp"], detection["fn"], "detection"),
+        **scores(correction["tp"], correction["fp"], correction["fn"], "correction"),
+        total=c["total"],
+        found=c["found"],
+        corrected=c["corrected"],
+        detection=detection,
+        correction=correction
+      )
+    none = self.categories["NONE"]
+    detection_accuracy = (none["corrected"] + detected) / float(max(self.num_words, 1))
+    correction_accuracy = (none["corrected"] + corrected) / float(max(self.num_words, 1))
+    evaluation.update(scores(detected, none["fp"], num_errors - detected, "detection"))
+    evaluation.update(scores(corrected, none["fp"], num_errors - corrected, "correction"))
+    evaluation.update({
+      "equalScore": equal_score / max(num_types, 1),
+      "penalizedScore": (equal_score / max(num_types, 1)) * (none["corrected"] / float(max(none["total"], 1))),
+      "wordAccuracy": correction_accuracy,
+      "sequenceAccuracy": self.num_corrected_sentences / float(max(self.num_sentences, 1)),
+      "numSentences": self.num_sentences,
+      "numErrorFreeSentences": self.num_error_free,
+      "numCorrectedSentences": self.num_corrected_sentences,
+      "detectionAccuracy": detection_accuracy,
+      "detectionErrorRate": 1.0 - detection_accuracy,
+      "correctionAccuracy": correction_accuracy,
+      "correctionErrorRate": 1.0 - correction_accuracy,
+      "numWords": self.num_words,
+      "numErrors": num_errors,
+      "detectedErrors": detected,
+      "correctedErrors": corrected,
+      "suggestionAdequacy": corrected / float(max(detected, 1))
+    })
+    return {"evaluation": evaluation}
+
+def scores(tp, fp, fn, prefix):
+  precision = tp / float(tp + fp) if tp + fp > 0 else 0.0
+  recall = tp / float(tp + fn) if tp + fn > 0 else 0.0
+  fscore = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+  return {prefix + "Precision": precision, prefix + "Recall": recall, prefix + "FScore": fscore}
+
+
+class SyntheticCorpus(object):
+  """
+  A SyntheticBenchmark held in memory as parsed json: ``source``, ``groundtruth``,
+  ``prediction``, ``alignments`` and the ``raw`` text.
+  """
+
+  def __init__(self, benchmark):
+    counts = EvaluationCounts()
+    files = {"source.json": [], "groundtruth.json": [], "prediction.json": [], "alignments.json": []}
+    raw = []
+    for sentence in benchmark.sentences():
+      counts.add(sentence)
+      raw.append(sentence.raw + "\n")
+      for name, line in sentence_entries(sentence).items():
+        if len(line) > 0:
+          files[name].extend(json.loads("[" + line + "]"))
+
+    self.num_articles = benchmark.num_articles
+    self.sentences_per_article = benchmark.num_sentences
+    self.num_sentences = sum(benchmark.num_sentences)
+    self.num_tokens = len(files["source.json"])
+    self.source = {"tokens": files["source.json"], "information": benchmark.information()}
+    self.groundtruth = {"corrections": files["groundtruth.json"], "information": benchmark.information()}
+    self.prediction = {"predictions": files["prediction.json"]}
+    self.alignments = {"alignments": files["alignments.json"]}
+    self.raw = "".join(raw)
+    self.counts = counts
+
+  def source_content(self):
+    return json.dumps(self.source, ensure_ascii=False)
+
+  def evaluation(self):
+    return self.counts.evaluation()
@@ -7,33 +7,67 @@ from .utils import call_regex
 import ujson as json
 import regex as re
 from .builtin_sec import *
+from .engines import get_engine
+from .engine_server import EngineClient, EngineServerError
+from .profiling import profiled
+from .checkpoint import Checkpoint, predict_checkpointed
+from .pipeline import predict_to_file
+from django.conf import settings
 
 @task
+@profiled()
 def process_uploaded_results(self, list_of_work):
   pass
 
 
-def predict_builtin(program_name, raw_input, lang_code):
-  if program_name.lower() == 'aspell':
-    return evaluate_aspell_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'xspell':
-    return evaluate_xspell_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'hunspell':
-    return evaluate_hunspell_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'pyenchant':
-    return evaluate_pyenchant_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'mashape':
-    return evaluate_mashape_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'grammarbot':
-    return evaluate_grammarbot_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'languagetool':
-    return evaluate_languagetool_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'norvig':
-    return evaluate_norvig_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'ngram':
-    return evaluate_ngram_builtin(raw_input, lang_code)
-  elif program_name.lower() == 'hmm':
-    return evaluate_hmm_builtin(raw_input, lang_code)
-  else:
+def predict_builtin(program_name, raw_input, lang_code, run=None, checkpoint_dir=None, resume=True):
+  """
+  Returns the prediction content of the engine ``program_name`` for ``raw_input``. If an
+  EngineRun ``run`` is given, the speed of the engine is recorded into it. With a
+  ``checkpoint_dir`` the run is checkpointed there every CHECKPOINT_ARTICLES articles and, with
+  ``resume``, continues from its last checkpoint (see workbench.checkpoint).
+  """
+  engine = get_engine(program_name)
+  if engine is None:
     print("UNKNOWN PROGRAM: %s" % (program_name))
     return None
+  if checkpoint_dir is not None:
+    checkpoint = Checkpoint(checkpoint_dir, engine.name, lang_code, raw_input)
+    predict_checkpointed(lambda records: predict_engine(engine, records, lang_code), raw_input, checkpoint,
+                         settings.CHECKPOINT_ARTICLES, resume, run)
+    return checkpoint.content()
+  if run is None:
+    return predict_engine(engine, raw_input, lang_code)
+  with run:
+    return predict_engine(engine, run.records(raw_input), lang_code)
+
+def predict_builtin_to_file(program_name, raw_input, lang_code, filepath, run=None, checkpoint_dir=None, resume=True):
+  """
+  Writes the prediction content of the engine ``program_name`` for ``raw_input`` to
+  ``filepath`` through the pipeline of workbench.pipeline, in batches of
+  PIPELINE_BATCH_SENTENCES sentences, or checkpointed like predict_builtin. Returns whether the
+  engine exists.
+  """
+  engine = get_engine(program_name)
+  if engine is None:
+    print("UNKNOWN PROGRAM: %s" % (program_name))
+    return False
+  predict = lambda records: predict_engine(engine, records, lang_code)
+  if checkpoint_dir is not None:
+    checkpoint = Checkpoint(checkpoint_dir, engine.name, lang_code, raw_input)
+    predict_checkpointed(predict, raw_input, checkpoint, settings.CHECKPOINT_ARTICLES, resume, run)
+    checkpoint.write_to(filepath)
+  else:
+    predict_to_file(predict, raw_input, filepath, settings.PIPELINE_BATCH_SENTENCES, run, settings.PIPELINE_QUEUE_SIZE)
+  return True
+
+def predict_engine(engine, raw_input, lang_code):
+  # Engines with local resources are served warm by the engine server, if it is running
+  if engine.load is not None:
+    client = EngineClient(settings.ENGINE_SERVER_SOCKET)
+    if client.available():
+      try:
+        return client.predict(engine.name, raw_input, lang_code, settings.ENGINE_SERVER_BATCH_SENTENCES)
+      except (OSError, EngineServerError) as e:
+        print("WARNING: engine server failed (%s), predicting in process" % (e))
+  return engine.predict(raw_input, lang_code)
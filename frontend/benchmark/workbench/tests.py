@@ -1,3 +1,555 @@
-from django.test import TestCase
+import io
+import os
+import math
+import gzip
+import shutil
+import string
+import tarfile
+import tempfile
+import collections
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import ujson as json
+
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.contrib.auth.models import User
+
+from . import hmm, ngram, views
+from .builtin_sec import evaluate_languagetool_builtin, evaluate_ngram_builtin, remote_client
+from .checkpoint import Checkpoint, predict_checkpointed
+from .models import Program, Benchmark, Result, ErrorCategory, EngineSpeed, ResultVersion, PublishedResult, InternalSentenceInformation, PredictedSentenceInformation
+from .legacy import parse_connections
+from .partitions import ensure_partition
+from .perf import compare
+from .querybudget import QueryBudgetExceeded, enforce_query_budgets
+from .remote import RemoteRequest
+from .speed import EngineRun
+from .stub_servers import start_stub_server, LanguageToolStubHandler
+from .uploads import UploadError, receive_prediction
+from .vocabulary import VOCABULARY
+
+
+class QueryBudgetTests(TestCase):
+  """
+  The views with a query budget stay within it, however many programs there are.
+  """
+
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user('budget', password='budget')
+    cls.benchmark = Benchmark.objects.create(benchmark_name='budget', lang_code='en_US')
+    for aidx in range(2):
+      for sidx in range(3):
+        InternalSentenceInformation.objects.create(
+          benchmark=cls.benchmark,
+          display='The cat sat .',
+          aidx=aidx,
+          sidx=sidx,
+          **InternalSentenceInformation.encode(['Teh', 'cat', 'sat', '.'], ['The', 'cat', 'sat', '.'], ['NON_WORD', 'NONE', 'NONE', 'NONE'], [(0, [0]), (1, [1]), (2, [2]), (3, [3])]))
+
+  def setUp(self):
+    # The worst case, the token texts are not cached yet
+    VOCABULARY.clear()
+
+  def add_programs(self, count):
+    for _ in range(count):
+      number = Program.objects.count()
+      program = Program.objects.create(user=self.user, program_name='program %d' % (number))
+      version = ResultVersion.objects.create(program=program, benchmark=self.benchmark)
+      PublishedResult.objects.create(program=program, benchmark=self.benchmark, version=version)
+      result = Result.objects.create(program=program, benchmark=self.benchmark, version=version)
+      for name in ('NONE', 'NON_WORD'):
+        ErrorCategory.objects.create(result=result, program=program, benchmark=self.benchmark, version=version, name=name)
+      EngineSpeed.objects.create(program=program, benchmark=self.benchmark, version=version, lang_code='en_US', tokens_per_second=number)
+      ensure_partition(self.benchmark.pk, program.pk)
+      for aidx in range(2):
+        for sidx in range(3):
+          PredictedSentenceInformation.objects.create(
+            program=program,
+            benchmark=self.benchmark,
+            aid=aidx,
+            sid=sidx,
+            valid_from=version.pk,
+            **PredictedSentenceInformation.encode(['The', 'cat', 'sat', 'p%d' % (number)], [True, False, False, False], [(0, [0])], [(0, [0])]))
+
+  def query_counts(self, url):
+    """
+    Returns the queries of a request of ``url`` with 1 and with 5 programs.
+    """
+    counts = []
+    for count in (1, 4):
+      self.add_programs(count)
+      VOCABULARY.clear()
+      response = self.client.get(url)
+      self.assertEqual(response.status_code, 200)
+      counts.append(int(response['X-Query-Count']))
+    return counts
+
+  @enforce_query_budgets
+  def test_benchmark(self):
+    counts = self.query_counts('/bench/%d/' % (self.benchmark.pk))
+    self.assertEqual(counts[0], counts[1])
+
+  @enforce_query_budgets
+  def test_sentences_and_prediction_for_idx(self):
+    counts = self.query_counts('/ajax/get_sentences_and_prediction_for_idx/?benchmark=%d&value=1&aidx=1' % (self.benchmark.pk))
+    self.assertEqual(counts[0], counts[1])
+
+  @enforce_query_budgets
+  def test_sentences_and_prediction_for_program(self):
+    self.add_programs(2)
+    program = Program.objects.order_by('pk').last()
+    response = self.client.get('/ajax/get_sentences_and_prediction_for_program/?benchmark=%d&program=%d' % (self.benchmark.pk, program.pk))
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('p1', response.json()['predictions'])
+
+  @enforce_query_budgets
+  def test_over_budget(self):
+    self.add_programs(1)
+    program = Program.objects.get()
+    view = views.get_sentences_and_prediction_for_program
+    budget = view.query_budget
+    view.query_budget = 1
+    try:
+      with self.assertRaises(QueryBudgetExceeded):
+        self.client.get('/ajax/get_sentences_and_prediction_for_program/?benchmark=%d&program=%d' % (self.benchmark.pk, program.pk))
+    finally:
+      view.query_budget = budget
+
+
+# Dictionary of the engine tests, with words sharing many ngrams
+WORDS = [
+  'the', 'then', 'than', 'them', 'they', 'there', 'these', 'other', 'mother', 'brother',
+  'receive', 'received', 'receiver', 'deceive', 'relieve', 'believe', 'achieve', 'recipe',
+  'separate', 'desperate', 'separated', 'operate', 'cooperate', 'sepulchre',
+  'definite', 'definitely', 'infinite', 'infinitely', 'finite', 'definition',
+  'mail', 'nail', 'sail', 'tail', 'email', 'mailbox', 'a', 'an', 'lot', 'alloy'
+]
+
+
+class NgramTests(SimpleTestCase):
+  """
+  The length buckets and the top-k selection of the ngram engine rank like counting the shared
+  ngrams of every dictionary word.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    super(NgramTests, cls).setUpClass()
+    cls.directory = tempfile.mkdtemp()
+    wordfile = os.path.join(cls.directory, 'words')
+    with open(wordfile, 'w') as fout:
+      fout.write("\n".join(WORDS + ['The', 'MAIL']))
+    with mock.patch.object(ngram, 'WORDFILE', wordfile):
+      cls.autocorrect = ngram.Autocorrect(3, 1)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.directory)
+    super(NgramTests, cls).tearDownClass()
+
+  def ranked(self, target, results):
+    ac = self.autocorrect
+    counts = collections.Counter()
+    for word in ac.words:
+      if abs(len(word) - len(target)) <= ac.len_variance:
+        counts[word] = len(ac.ngrams(word) & ac.ngrams(target))
+    ranked = sorted((pair for pair in counts.items() if pair[1] > 0), key=lambda pair: (-pair[1], pair[0]))
+    return [word for word, _ in ranked[:results]]
+
+  def test_suggested_words(self):
+    targets = WORDS + ['recieve', 'seperate', 'definately', 'teh', 'hte', 'thre', 'mial', 'xyz', '', 'brotherhood']
+    for target in targets:
+      for results in (0, 1, 2, 5, 100):
+        self.assertEqual(self.autocorrect.suggested_words(target, results), self.ranked(target, results), (target, results))
+
+  def test_evaluate(self):
+    self.assertEqual(ngram.evaluate(self.autocorrect, 'mail'), 'mail')
+    self.assertEqual(ngram.evaluate(self.autocorrect, 'recieve'), self.ranked('recieve', 5))
+    self.assertEqual(ngram.evaluate(self.autocorrect, 'xyz'), 'xyz')
+
+
+class ViterbiTests(SimpleTestCase):
+  """
+  The vectorized decoders find the same paths as the Viterbi recursion cell by cell.
+  """
+
+  def setUp(self):
+    rnd = np.random.RandomState(0)
+    # One state and symbol per letter
+    num_states = len(string.ascii_letters)
+    emission = rnd.random_sample((num_states, num_states)) + 0.01
+    transition = rnd.random_sample((num_states, num_states)) + 0.01
+    self.emission = (emission / emission.sum(axis=1)[:, np.newaxis]).tolist()
+    self.transition = (transition / transition.sum(axis=1)[:, np.newaxis]).tolist()
+    self.viterbi = hmm.Viterbi(self.emission, self.transition, [])
+
+  def decoded(self, word):
+    symbols = self.viterbi.symbols
+    delta = [math.log(self.emission[j][symbols.index(word[0])]) + math.log(1.0 / len(symbols)) for j in range(len(symbols))]
+    backTrack = []
+    for symChar in word[1:]:
+      pointers = []
+      values = []
+      for j in range(len(symbols)):
+        best = None
+        for i in range(len(symbols)):
+          value = delta[i] + math.log(self.transition[i][j])
+          if best is None or value > best:
+            best = value
+            pointer = i
+        pointers.append(pointer)
+        values.append(best + math.log(self.emission[j][symbols.index(symChar)]))
+      backTrack.append(pointers)
+      delta = values
+    state = delta.index(max(delta))
+    path = [state]
+    for pointers in reversed(backTrack):
+      state = pointers[state]
+      path.append(state)
+    return ''.join(symbols[state] for state in reversed(path))
+
+  def test_process(self):
+    words = ['a', 'teh', 'recieve', 'Seperate', 'definately', 'xQz', 'mail']
+    expected = [self.decoded(word) for word in words]
+    self.assertEqual(self.viterbi.process(words), expected)
+    self.assertEqual(self.viterbi.process(['']), [''])
+
+  def test_process_batch(self):
+    words = ['teh', 'hte', 'teh', 'recieve', 'abc', 'Mail', 'a', '', 'don\'t', 'mial'] * 3
+    expected = [self.decoded(word) if word.isalpha() else word for word in words]
+    self.assertEqual(self.viterbi.processBatch(words), expected)
+    # Batches smaller than the words of a length
+    self.assertEqual(self.viterbi.processBatch(words, batchSize=2), expected)
+
+
+class HMMTrainingTests(SimpleTestCase):
+  """
+  The training counts and probabilities of a small corpus, computed by hand.
+  """
+
+  def setUp(self):
+    self.words = ["ab", "ba", "aab", "café", "x1"]
+    self.index = string.ascii_letters.index
+
+  def test_counts(self):
+    model = hmm.SpellingCorrection(seed=0, corruptionRate=0.0)
+    # "x1" is no word, the "é" of "café" no symbol: neither counted nor a transition to "f"
+    self.assertEqual(model.corruptText(self.words, True), ["ab", "ba", "aab", "café"])
+    emissions = np.zeros((52, 52), dtype=int)
+    for symbol, count in (("a", 5), ("b", 3), ("c", 1), ("f", 1)):
+      emissions[self.index(symbol), self.index(symbol)] = count
+    np.testing.assert_array_equal(model.Eis, emissions)
+    transitions = np.zeros((52, 52), dtype=int)
+    for (i, j), count in ((("a", "b"), 2), (("b", "a"), 1), (("a", "a"), 1), (("c", "a"), 1), (("a", "f"), 1)):
+      transitions[self.index(i), self.index(j)] = count
+    np.testing.assert_array_equal(model.Aij, transitions)
+
+    # Every row has a zero, add-one smoothing applies to all of them
+    model.probabilityAij()
+    model.probabilityEmission()
+    a, b, d = self.index("a"), self.index("b"), self.index("d")
+    self.assertAlmostEqual(model.probAij[a, b], 3.0 / 56)
+    self.assertAlmostEqual(model.probAij[a, a], 2.0 / 56)
+    self.assertAlmostEqual(model.probAij[a, d], 1.0 / 56)
+    self.assertAlmostEqual(model.probAij[d, a], 1.0 / 52)
+    self.assertAlmostEqual(model.probEis[a, a], 6.0 / 57)
+    self.assertAlmostEqual(model.probEis[b, a], 1.0 / 55)
+    np.testing.assert_allclose(model.probAij.sum(axis=1), 1.0)
+    np.testing.assert_allclose(model.probEis.sum(axis=1), 1.0)
+
+  def test_corruption(self):
+    model = hmm.SpellingCorrection(seed=0, corruptionRate=1.0)
+    corrupted = model.corruptText(self.words, True)
+    # Every symbol is replaced by a surrounding character, others are kept
+    for word, corruptedWord in zip(self.words, corrupted):
+      self.assertEqual(len(corruptedWord), len(word))
+      for symbol, corruptedSymbol in zip(word, corruptedWord):
+        self.assertIn(corruptedSymbol, hmm.SURROUNDING_CHARS.get(symbol, [symbol]))
+    self.assertEqual(model.Eis.sum(), 10)
+    self.assertEqual(np.trace(model.Eis), 0)
+
+
+def benchmark_source(num_articles, num_sentences, words=("recieve", "teh", "mail", "alot", ".")):
+  """
+  Returns the content of a benchmark source file, every sentence is its number followed by
+  ``words``.
+  """
+  tokens = []
+  for aidx in range(num_articles):
+    for sidx in range(num_sentences):
+      for widx, word in enumerate((str(aidx * num_sentences + sidx),) + tuple(words)):
+        tokens.append({"id": "a%d.s%d.w%d" % (aidx, sidx, widx), "token": word, "space": widx < len(words) - 1})
+  return json.dumps({"tokens": tokens})
+
+
+class LanguageToolTests(SimpleTestCase):
+  """
+  Round trips of the LanguageTool engine through the stub server.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    super(LanguageToolTests, cls).setUpClass()
+    cls.server = start_stub_server(LanguageToolStubHandler)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    super(LanguageToolTests, cls).tearDownClass()
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.overrides = override_settings(
+      LANGUAGETOOL_URL="http://%s:%d/v2/" % self.server.server_address,
+      REMOTE_RATE_LIMITS={},
+      REMOTE_DEFAULT_RATE=None,
+      REMOTE_RETRIES=0,
+      CACHE_DIR=os.path.join(self.directory, '')
+    )
+    self.overrides.enable()
+    self.server.num_requests = 0
+
+  def tearDown(self):
+    self.overrides.disable()
+    shutil.rmtree(self.directory)
+
+  def test_batched_requests(self):
+    source = benchmark_source(3, 20)
+    with self.settings(LANGUAGETOOL_BATCH_CHARS=0):
+      single = evaluate_languagetool_builtin(source, 'en_US')
+    self.assertEqual(self.server.num_requests, 60)
+    with self.settings(LANGUAGETOOL_BATCH_CHARS=500):
+      batched = evaluate_languagetool_builtin(source, 'en_US')
+    self.assertLess(self.server.num_requests, 60 + 10)
+    self.assertEqual(batched, single)
+
+    predictions = json.loads(batched)["predictions"]
+    self.assertEqual(len(predictions), 60 * 7)
+    sentence = [p for p in predictions if p["id"].startswith("a2.s19.")]
+    self.assertEqual([p["token"] for p in sentence], ["59", "receive", "the", "mail", "a", "lot", "."])
+    self.assertEqual(sentence[2]["suggestions"], ["ten"])
+
+  def test_cached_responses(self):
+    source = benchmark_source(2, 50)
+    with self.settings(LANGUAGETOOL_BATCH_CHARS=0):
+      first = evaluate_languagetool_builtin(source, 'en_US')
+      self.assertEqual(self.server.num_requests, 100)
+      # In order although more requests than the window of 32 are sent
+      numbers = [p["token"] for p in json.loads(first)["predictions"] if p["id"].endswith(".w0")]
+      self.assertEqual(numbers, [str(n) for n in range(100)])
+      self.assertEqual(evaluate_languagetool_builtin(source, 'en_US'), first)
+    self.assertEqual(self.server.num_requests, 100)
+
+  def test_fetch_each(self):
+    url = self.overrides.options["LANGUAGETOOL_URL"] + "check"
+    make_request = lambda i: RemoteRequest('POST', url, data={"text": "teh %d" % (i), "language": "en", "apiKey": "secret"})
+    results = list(remote_client().fetch_each(range(50), make_request, window=4))
+    self.assertEqual([item for item, _ in results], list(range(50)))
+    self.assertTrue(all(json.loads(body)["matches"][0]["offset"] == 0 for _, body in results))
+
+    # The credentials are not part of the cache key
+    other = RemoteRequest('POST', url, data={"text": "teh 0", "language": "en", "apiKey": "other"})
+    self.assertEqual(other.cache_key(), make_request(0).cache_key())
+    self.assertEqual(list(remote_client().fetch_each([0], lambda i: other)), [results[0]])
+    self.assertEqual(self.server.num_requests, 50)
+
+  def test_remote_latencies(self):
+    with EngineRun('languagetool', 'en_US') as run:
+      with self.settings(LANGUAGETOOL_BATCH_CHARS=0):
+        evaluate_languagetool_builtin(benchmark_source(1, 5), 'en_US')
+    # Every round trip, the requests run in a thread of their own
+    self.assertEqual(sum(run.latency_dict()['remote']['counts']), 5)
+    self.assertEqual(self.server.num_requests, 5)
+
+
+class CheckpointTests(SimpleTestCase):
+  """
+  A checkpointed run that crashed and was resumed predicts the same as an uninterrupted one.
+  """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    wordfile = os.path.join(self.directory, 'words')
+    with open(wordfile, 'w') as fout:
+      fout.write("\n".join(WORDS))
+    with mock.patch.object(ngram, 'WORDFILE', wordfile):
+      self.autocorrect = ngram.Autocorrect(3, 1)
+    self.source = benchmark_source(7, 3)
+    self.predicted = []
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def predict(self, records):
+    self.predicted.extend((r.aidx, r.sidx) for r in records)
+    return evaluate_ngram_builtin(records, 'en_US', self.autocorrect)
+
+  def checkpoint(self):
+    return Checkpoint(os.path.join(self.directory, 'run'), 'ngram', 'en_US', self.source)
+
+  def test_resume(self):
+    expected = evaluate_ngram_builtin(self.source, 'en_US', self.autocorrect)
+
+    def crashing(records):
+      if records[0].aidx == 4:
+        raise RuntimeError("worker lost")
+      return self.predict(records)
+    with self.assertRaises(RuntimeError):
+      predict_checkpointed(crashing, self.source, self.checkpoint(), 2)
+    # Output of a chunk that was written but not recorded
+    with open(self.checkpoint().part_filepath, 'ab') as fout:
+      fout.write(b'  {"id": "a4.s0.w0", ')
+
+    self.predicted = []
+    checkpoint = self.checkpoint()
+    predict_checkpointed(self.predict, self.source, checkpoint, 2)
+    self.assertEqual(checkpoint.content(), expected)
+    self.assertEqual(self.predicted[0], (4, 0))
+    self.assertEqual(len(self.predicted), 3 * 3)
+
+    filepath = os.path.join(self.directory, 'prediction.json')
+    checkpoint.write_to(filepath)
+    with open(filepath, 'r', encoding='utf-8') as fin:
+      self.assertEqual(fin.read(), expected)
+
+  def test_other_run(self):
+    predict_checkpointed(self.predict, self.source, self.checkpoint(), 3)
+    # Another benchmark starts over
+    self.source = benchmark_source(2, 3)
+    self.predicted = []
+    checkpoint = self.checkpoint()
+    predict_checkpointed(self.predict, self.source, checkpoint, 3)
+    self.assertEqual(len(self.predicted), 2 * 3)
+    self.assertEqual(checkpoint.content(), evaluate_ngram_builtin(self.source, 'en_US', self.autocorrect))
+    # Without resume as well
+    self.predicted = []
+    predict_checkpointed(self.predict, self.source, self.checkpoint(), 3, resume=False)
+    self.assertEqual(len(self.predicted), 2 * 3)
+
+
+class UploadValidationTests(SimpleTestCase):
+  """
+  Uploaded predictions are decoded and checked against the sentences of the benchmark.
+  """
+
+  # Tokens of every sentence, per article
+  TOKEN_COUNTS = [[3, 3], [3, 4, 3]]
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filepath = os.path.join(self.directory, 'prediction.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def predictions(self):
+    predictions = []
+    for aidx, counts in enumerate(self.TOKEN_COUNTS):
+      for sidx, count in enumerate(counts):
+        for widx in range(count):
+          predictions.append({"id": "a%d.s%d.w%d" % (aidx, sidx, widx), "token": "w", "suggestions": [], "space": True})
+    return predictions
+
+  def receive(self, predictions=None, data=None):
+    if data is None:
+      data = json.dumps({"predictions": predictions}).encode('utf-8')
+    return receive_prediction(io.BytesIO(data), self.TOKEN_COUNTS, self.filepath, 1 << 20)
+
+  def assertRejected(self, predictions, message):
+    with self.assertRaisesRegex(UploadError, message):
+      self.receive(predictions)
+    self.assertFalse(os.path.exists(self.filepath))
+
+  def test_accepted(self):
+    data = json.dumps({"predictions": self.predictions(), "program": "test"}).encode('utf-8')
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+      info = tarfile.TarInfo('out/prediction.json')
+      info.size = len(data)
+      tar.addfile(info, io.BytesIO(data))
+    for upload in (data, gzip.compress(data), gzip.compress(archive.getvalue())):
+      validator, size = self.receive(data=upload)
+      self.assertEqual((validator.sentences, validator.tokens, size), (5, 16, len(data)))
+      with open(self.filepath, 'rb') as fin:
+        self.assertEqual(fin.read(), data)
+
+  def test_any_order_and_ranges(self):
+    predictions = self.predictions()
+    predictions.reverse()
+    validator, _ = self.receive(predictions)
+    self.assertEqual(validator.tokens, 16)
+
+    predictions = self.predictions()
+    predictions[0]["id"] = "a0.s0.w0-a0.s0.w1"
+    del predictions[1]
+    validator, _ = self.receive(predictions)
+    self.assertEqual((validator.sentences, validator.tokens), (5, 15))
+
+  def test_rejected(self):
+    def changed(change):
+      predictions = self.predictions()
+      change(predictions)
+      return predictions
+    self.assertRejected(changed(lambda p: p[4].pop("suggestions")), "a0.s1.w1: suggestions must be a list")
+    self.assertRejected(changed(lambda p: p[4].update(space="true")), "a0.s1.w1: space must be true or false")
+    self.assertRejected(changed(lambda p: p[4].update(id="s1.w1")), "no valid id")
+    self.assertRejected(changed(lambda p: p[4].pop("token")), "a0.s1.w1 has no token")
+    self.assertRejected(changed(lambda p: p.append(dict(p[4]))), "sentence a0.s1 are predicted twice")
+    self.assertRejected(changed(lambda p: p[3].update(id="a0.s1.w0-a0.s1.w1")), "sentence a0.s1 are predicted twice")
+    self.assertRejected(changed(lambda p: p[3].update(id="a0.s1.w0-a0.s2.w1")), "in the same sentence")
+    self.assertRejected(changed(lambda p: p[3].update(id="a0.s1.w2-a0.s1.w1")), "in the same sentence")
+    self.assertRejected(changed(lambda p: p.append(dict(p[0], id="a2.s0.w0"))), "no sentence a2.s0")
+    self.assertRejected(changed(lambda p: p.pop(4)), "no prediction for word w1 of sentence a0.s1")
+    self.assertRejected(changed(lambda p: p.__delitem__(slice(6, 9))), "no predictions for sentence a1.s0")
+    # The last word of a sentence with more words than the others
+    self.assertRejected(changed(lambda p: p.pop(12)), "no prediction for word w3 of sentence a1.s1")
+    self.assertRejected(changed(lambda p: p.append(dict(p[0], id="a0.s0.w3"))), "sentence a0.s0 has only 3 words")
+    self.assertRejected(changed(lambda p: p[2].update(id="a0.s0.w2-a0.s0.w400000000")), "sentence a0.s0 has only 3 words")
+
+  def test_unreadable(self):
+    data = json.dumps({"predictions": self.predictions()}).encode('utf-8')
+    for upload in (gzip.compress(data)[:40], data[:len(data) // 2], b'hello', b'{"tokens": []}'):
+      with self.assertRaises(UploadError):
+        self.receive(data=upload)
+      self.assertFalse(os.path.exists(self.filepath))
+    with self.assertRaisesRegex(UploadError, "larger than"):
+      receive_prediction(io.BytesIO(gzip.compress(data)), self.TOKEN_COUNTS, self.filepath, 100)
+
+
+class LegacyTokensTests(SimpleTestCase):
+  """
+  The connections of the rows stored before the packed layout are read in both textual forms.
+  """
+
+  def test_parse_connections(self):
+    self.assertEqual(parse_connections("0->0|1->1|2->2,3|3->"), [(0, [0]), (1, [1]), (2, [2, 3]), (3, [])])
+    self.assertEqual(parse_connections("0->[0]|1->[1, 2]|2->[]"), [(0, [0]), (1, [1, 2]), (2, [])])
+    self.assertEqual(parse_connections(""), [])
+    self.assertEqual(parse_connections(None), [])
+
+class PerfCompareTests(SimpleTestCase):
+  """
+  Cases of the baseline that fail or are not measured any more are regressions.
+  """
+
+  def report(self, results, skipped=None, failed=None, sizes=(100,), only=()):
+    result = lambda items: {"itemsPerSecond": items, "unit": "tokens", "seconds": 1.0, "peakBytes": 0}
+    return {
+      "sizes": list(sizes),
+      "only": list(only),
+      "results": dict((key, result(items)) for key, items in results.items()),
+      "skipped": skipped or {},
+      "failed": failed or {}
+    }
+
+  def test_compare(self):
+    baseline = self.report({"ngram@100": 1000, "hmm@100": 1000, "norvig@100": 1000, "norvig@1000": 1000}, sizes=(100, 1000))
+    self.assertEqual(compare(self.report({"ngram@100": 950, "hmm@100": 1000, "norvig@100": 1000}), baseline, 0.1), [])
+    self.assertEqual(compare(self.report({"ngram@100": 800, "hmm@100": 1000, "norvig@100": 1000}), baseline, 0.1),
+      ["ngram@100: 800 tokens/s, baseline 1000 tokens/s"])
+    self.assertEqual(compare(self.report({"ngram@100": 1000}, skipped={"hmm@100": "no dictionary"}, failed={"norvig@100": "OSError: gone"}), baseline, 0.1),
+      ["norvig@100: failed (OSError: gone)"])
+    self.assertEqual(compare(self.report({"ngram@100": 1000, "norvig@100": 1000}), baseline, 0.1), ["hmm@100: not measured"])
+    self.assertEqual(compare(self.report({"ngram@100": 1000}, only=("ngram",)), baseline, 0.1), [])
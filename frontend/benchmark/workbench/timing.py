@@ -0,0 +1,198 @@
+'''
+Per-stage timing of the evaluation jobs (an upload, the population of the baselines). A job is
+split into spans, one per stage (copying the files, the evaluator round trip, writing the
+results, ...), each with its duration and the bytes and rows it processed:
+
+  with JobTimer('upload_results', benchmark, program):
+    with span('stage_files') as s:
+      ...
+      s.add(bytes=size)
+
+Every finished span is printed as one line, aggregated into the histograms and counters served
+by the /metrics endpoint (Prometheus text format) and stored with its job as a JobTiming row.
+The aggregates live in the process, they start over with every restart of the server.
+'''
+
+import time
+import threading
+import ujson as json
+
+from django.utils import timezone
+
+# Upper bounds (seconds) of the histogram buckets of the stage and job durations
+TIMING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+METRICS_LOCK = threading.Lock()
+# (job, stage) -> [bucket counts..., +Inf count], sum
+STAGE_SECONDS = {}
+STAGE_BYTES = {}
+STAGE_ROWS = {}
+# job -> histogram of the total durations, (job, status) -> number of jobs
+JOB_SECONDS = {}
+JOB_COUNTS = {}
+
+CURRENT = threading.local()
+
+
+def observe(histograms, key, seconds):
+  histogram = histograms.get(key)
+  if histogram is None:
+    histogram = histograms[key] = [[0] * (len(TIMING_BUCKETS) + 1), 0.0]
+  for idx, bound in enumerate(TIMING_BUCKETS):
+    if seconds <= bound:
+      histogram[0][idx] += 1
+  histogram[0][-1] += 1
+  histogram[1] += seconds
+
+
+class Span(object):
+  """
+  A timed stage of a job, ``add`` counts the bytes and rows it processed.
+  """
+
+  def __init__(self, stage):
+    self.stage = stage
+    self.bytes = 0
+    self.rows = 0
+    self.seconds = None
+
+  def add(self, bytes=0, rows=0):
+    self.bytes += bytes
+    self.rows += rows
+
+  def record(self):
+    return {"stage": self.stage, "seconds": self.seconds, "bytes": self.bytes, "rows": self.rows}
+
+
+class JobTimer(object):
+  """
+  Times a job, the spans opened while it runs (in the same thread) belong to it. On exit the job
+  is counted as 'ok' or 'error' and stored as a JobTiming.
+  """
+
+  def __init__(self, name, benchmark=None, program=None):
+    self.name = name
+    self.benchmark = benchmark
+    self.program = program
+    self.spans = []
+    self.started = None
+    self.start = None
+    self.parent = None
+
+  def __enter__(self):
+    self.parent = getattr(CURRENT, 'job', None)
+    CURRENT.job = self
+    self.started = timezone.now()
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    seconds = time.perf_counter() - self.start
+    CURRENT.job = self.parent
+    status = 'ok' if exc_type is None else 'error'
+    with METRICS_LOCK:
+      observe(JOB_SECONDS, self.name, seconds)
+      JOB_COUNTS[(self.name, status)] = JOB_COUNTS.get((self.name, status), 0) + 1
+    print("[timing] job=%s status=%s seconds=%.3f" % (self.name, status, seconds))
+    self.save(seconds, status)
+    return False
+
+  def finished(self, span):
+    self.spans.append(span)
+    key = (self.name, span.stage)
+    with METRICS_LOCK:
+      observe(STAGE_SECONDS, key, span.seconds)
+      STAGE_BYTES[key] = STAGE_BYTES.get(key, 0) + span.bytes
+      STAGE_ROWS[key] = STAGE_ROWS.get(key, 0) + span.rows
+    print("[timing] job=%s stage=%s seconds=%.3f bytes=%d rows=%d" % (self.name, span.stage, span.seconds, span.bytes, span.rows))
+
+  def save(self, seconds, status):
+    from .models import JobTiming
+
+    try:
+      JobTiming.objects.create(
+        name=self.name,
+        benchmark=self.benchmark,
+        program=self.program,
+        started=self.started,
+        seconds=seconds,
+        status=status,
+        stages=json.dumps([s.record() for s in self.spans])
+      )
+    except Exception as e:
+      # The timing must not fail the job, e.g. when its transaction was broken
+      print("WARNING: could not store the timing of %s: %s" % (self.name, e))
+
+
+class span(object):
+  """
+  Times the stage ``stage`` of the current job, without a job nothing is recorded.
+  """
+
+  def __init__(self, stage):
+    self.span = Span(stage)
+    self.start = None
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self.span
+
+  def __exit__(self, exc_type, exc, tb):
+    self.span.seconds = time.perf_counter() - self.start
+    job = getattr(CURRENT, 'job', None)
+    if job is not None:
+      if exc_type is not None:
+        self.span.stage += ':error'
+      job.finished(self.span)
+    return False
+
+
+def label_values(**labels):
+  return ",".join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels.items())
+
+def histogram_lines(name, histogram, **labels):
+  counts, total = histogram
+  lines = []
+  for bound, count in zip(TIMING_BUCKETS, counts):
+    lines.append('%s_bucket{%s} %d' % (name, label_values(le=repr(bound), **labels), count))
+  lines.append('%s_bucket{%s} %d' % (name, label_values(le='+Inf', **labels), counts[-1]))
+  lines.append('%s_sum{%s} %r' % (name, label_values(**labels), total))
+  lines.append('%s_count{%s} %d' % (name, label_values(**labels), counts[-1]))
+  return lines
+
+def render_metrics():
+  """
+  Returns the aggregated timings in the Prometheus text format.
+  """
+  with METRICS_LOCK:
+    lines = [
+      '# HELP workbench_stage_seconds Duration of the stages of the evaluation jobs.',
+      '# TYPE workbench_stage_seconds histogram'
+    ]
+    for (job, stage), histogram in sorted(STAGE_SECONDS.items()):
+      lines.extend(histogram_lines('workbench_stage_seconds', histogram, job=job, stage=stage))
+    lines.extend([
+      '# HELP workbench_stage_bytes_total Bytes processed by the stages of the evaluation jobs.',
+      '# TYPE workbench_stage_bytes_total counter'
+    ])
+    for (job, stage), value in sorted(STAGE_BYTES.items()):
+      lines.append('workbench_stage_bytes_total{%s} %d' % (label_values(job=job, stage=stage), value))
+    lines.extend([
+      '# HELP workbench_stage_rows_total Database rows written by the stages of the evaluation jobs.',
+      '# TYPE workbench_stage_rows_total counter'
+    ])
+    for (job, stage), value in sorted(STAGE_ROWS.items()):
+      lines.append('workbench_stage_rows_total{%s} %d' % (label_values(job=job, stage=stage), value))
+    lines.extend([
+      '# HELP workbench_job_seconds Total duration of the evaluation jobs.',
+      '# TYPE workbench_job_seconds histogram'
+    ])
+    for job, histogram in sorted(JOB_SECONDS.items()):
+      lines.extend(histogram_lines('workbench_job_seconds', histogram, job=job))
+    lines.extend([
+      '# HELP workbench_jobs_total Finished evaluation jobs by status.',
+      '# TYPE workbench_jobs_total counter'
+    ])
+    for (job, status), value in sorted(JOB_COUNTS.items()):
+      lines.append('workbench_jobs_total{%s} %d' % (label_values(job=job, status=status), value))
+  return "\n".join(lines) + "\n"
@@ -0,0 +1,360 @@
+'''
+Streaming ingestion of uploaded predictions. PredictionUploadHandler receives the upload chunk
+by chunk while the request body is read, no copy of it is spooled. The upload is decoded on the
+fly (plain JSON, gzip, zstd, or a tar archive of either, detected by the magic bytes) and its
+``predictions`` are validated entry by entry against the token counts of the benchmark, while
+the decoded document is written to the file staged for the evaluator. A bad upload is stopped at
+its first bad entry, before the rest of it is read or anything is sent to the evaluator.
+
+The predictions may come in any order. Every sentence of the benchmark needs predictions and
+the word IDs of a sentence, including those of ranges like ``a0.s1.w2-a0.s1.w3`` for one token
+replacing several words, have to cover all of its words without gaps or overlaps (see the result
+format page).
+'''
+
+import io
+import os
+import gzip
+import time
+import queue
+import tarfile
+import threading
+import regex as re
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, StopFutureHandlers
+
+from .pipeline import json_array_items
+from .timing import Span
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+TAR_MAGIC_OFFSET = 257
+
+PREDICTION_ID = re.compile(r'^a(\d+)\.s(\d+)\.w(\d+)(?:-a(\d+)\.s(\d+)\.w(\d+))?$')
+
+# Chunks of an upload waiting for the validator, and the seconds it waits for the next one
+UPLOAD_QUEUE_CHUNKS = 16
+UPLOAD_CHUNK_TIMEOUT = 300
+
+
+class UploadError(ValueError):
+  """
+  Raised for an upload that cannot be decoded or does not match the benchmark, the message is
+  shown to the user.
+  """
+  pass
+
+
+class PrefixedStream(io.RawIOBase):
+  """
+  Binary stream of the bytes ``head`` followed by the rest of ``stream``, puts back the bytes
+  read to detect the format.
+  """
+
+  def __init__(self, head, stream):
+    self.head = head
+    self.stream = stream
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    if len(self.head) > 0:
+      size = min(len(buffer), len(self.head))
+      buffer[:size] = self.head[:size]
+      self.head = self.head[size:]
+      return size
+    data = self.stream.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+
+class CountingStream(io.RawIOBase):
+  """
+  Binary stream passing ``stream`` through, counting its bytes and copying them to ``fout``.
+  """
+
+  def __init__(self, stream, fout, max_bytes):
+    self.stream = stream
+    self.fout = fout
+    self.max_bytes = max_bytes
+    self.bytes = 0
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    data = self.stream.read(len(buffer))
+    self.bytes += len(data)
+    if self.bytes > self.max_bytes:
+      raise UploadError("The decompressed prediction is larger than %d bytes" % (self.max_bytes))
+    self.fout.write(data)
+    buffer[:len(data)] = data
+    return len(data)
+
+
+def read_head(stream, size):
+  head = b""
+  while len(head) < size:
+    data = stream.read(size - len(head))
+    if not data:
+      break
+    head += data
+  return head
+
+def zstd_errors():
+  try:
+    import zstandard
+    return (zstandard.ZstdError,)
+  except ImportError:
+    return ()
+
+def decoded_stream(fileobj):
+  """
+  Returns the binary stream of the prediction document in the upload ``fileobj`` and the
+  layers it was decoded from, e.g. ['gzip', 'tar'].
+  """
+  layers = []
+  head = read_head(fileobj, len(ZSTD_MAGIC))
+  stream = PrefixedStream(head, fileobj)
+  if head.startswith(GZIP_MAGIC):
+    layers.append('gzip')
+    stream = gzip.GzipFile(fileobj=stream, mode='rb')
+  elif head.startswith(ZSTD_MAGIC):
+    try:
+      import zstandard
+    except ImportError:
+      raise UploadError("zstd compressed uploads are not supported by this server")
+    layers.append('zstd')
+    stream = zstandard.ZstdDecompressor().stream_reader(stream)
+
+  head = read_head(stream, 512)
+  stream = PrefixedStream(head, stream)
+  if head[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + 5] == b'ustar':
+    layers.append('tar')
+    archive = tarfile.open(fileobj=stream, mode='r|')
+    for member in archive:
+      if member.isfile() and member.name.endswith('.json'):
+        return archive.extractfile(member), layers
+    raise UploadError("The archive contains no .json file")
+  return stream, layers
+
+
+class PredictionValidator(object):
+  """
+  Checks the prediction entries one by one against ``token_counts``, the number of tokens of
+  every sentence of the benchmark as one list per article (see TokenizedBenchmark.token_counts).
+  The words predicted so far are kept as one bit mask per sentence.
+  """
+
+  def __init__(self, token_counts):
+    self.sentence_counts = [len(counts) for counts in token_counts]
+    self.token_counts = [count for counts in token_counts for count in counts]
+    # Index of the first sentence of every article in ``words``
+    self.offsets = []
+    num_sentences = 0
+    for count in self.sentence_counts:
+      self.offsets.append(num_sentences)
+      num_sentences += count
+    self.words = [0] * num_sentences
+    self.tokens = 0
+    self.sentences = 0
+
+  def add(self, entry):
+    position = "Prediction #%d" % (self.tokens + 1)
+    if not isinstance(entry, dict):
+      raise UploadError("%s is not an object" % (position))
+    match = PREDICTION_ID.match(entry["id"]) if isinstance(entry.get("id"), str) else None
+    if match is None:
+      raise UploadError("%s has no valid id (a{ARTICLE}.s{SENTENCE}.w{WORD}): %r" % (position, entry.get("id")))
+    position = "Prediction %s" % (entry["id"])
+    if not isinstance(entry.get("token"), str):
+      raise UploadError("%s has no token" % (position))
+    suggestions = entry.get("suggestions")
+    if not isinstance(suggestions, list) or not all(isinstance(s, str) for s in suggestions):
+      raise UploadError("%s: suggestions must be a list of strings" % (position))
+    if not isinstance(entry.get("space"), bool):
+      raise UploadError("%s: space must be true or false" % (position))
+
+    aidx, sidx, first = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    last = first
+    if match.group(4) is not None:
+      if (int(match.group(4)), int(match.group(5))) != (aidx, sidx) or int(match.group(6)) < first:
+        raise UploadError("%s: a range of words has to end after its start in the same sentence" % (position))
+      last = int(match.group(6))
+    if aidx >= len(self.sentence_counts) or sidx >= self.sentence_counts[aidx]:
+      raise UploadError("%s: the benchmark has no sentence a%d.s%d" % (position, aidx, sidx))
+
+    index = self.offsets[aidx] + sidx
+    if last >= self.token_counts[index]:
+      raise UploadError("%s: sentence a%d.s%d has only %d words" % (position, aidx, sidx, self.token_counts[index]))
+    words = ((1 << (last - first + 1)) - 1) << first
+    if self.words[index] & words:
+      raise UploadError("%s: words of sentence a%d.s%d are predicted twice" % (position, aidx, sidx))
+    if self.words[index] == 0:
+      self.sentences += 1
+    self.words[index] |= words
+    self.tokens += 1
+
+  def finish(self):
+    for aidx, count in enumerate(self.sentence_counts):
+      for sidx in range(count):
+        index = self.offsets[aidx] + sidx
+        words = self.words[index]
+        if words == 0:
+          raise UploadError("There are no predictions for sentence a%d.s%d" % (aidx, sidx))
+        if words != (1 << self.token_counts[index]) - 1:
+          # The lowest word missing is the lowest bit not set
+          missing = (~words & (words + 1)).bit_length() - 1
+          raise UploadError("There is no prediction for word w%d of sentence a%d.s%d" % (missing, aidx, sidx))
+
+
+def receive_prediction(fileobj, token_counts, filepath, max_bytes):
+  """
+  Decodes and validates the uploaded prediction ``fileobj`` against ``token_counts`` (see
+  PredictionValidator) and writes the decoded document to ``filepath``. Returns the validator
+  with the counts of the prediction and the number of bytes written.
+
+  :raises UploadError: At the first problem of the upload, ``filepath`` is removed then.
+  """
+  validator = PredictionValidator(token_counts)
+  try:
+    with open(filepath, 'wb') as fout:
+      stream, layers = decoded_stream(fileobj)
+      counted = CountingStream(stream, fout, max_bytes)
+      text = io.TextIOWrapper(io.BufferedReader(counted), encoding='utf-8')
+      for entry in json_array_items(text, "predictions"):
+        validator.add(entry)
+      validator.finish()
+      # The rest of the document is copied as well
+      while text.read(1 << 16):
+        pass
+    print("Received prediction (%s) of %d bytes, %d sentences and %d tokens" % (
+      "+".join(layers) or "plain", counted.bytes, validator.sentences, validator.tokens))
+    return validator, counted.bytes
+  except Exception as e:
+    if os.path.exists(filepath):
+      os.remove(filepath)
+    if isinstance(e, UploadError):
+      raise
+    if isinstance(e, (ValueError, OSError, EOFError, tarfile.TarError) + zstd_errors()):
+      # Malformed JSON, broken compression, bad UTF-8 (UnicodeDecodeError is a ValueError)
+      raise UploadError("The prediction file cannot be read: %s" % (e))
+    raise
+
+
+class ChunkStream(io.RawIOBase):
+  """
+  Binary stream of the chunks put into ``chunks`` by another thread, None ends it.
+  """
+
+  def __init__(self, maxsize):
+    self.chunks = queue.Queue(maxsize)
+    self.rest = b""
+    self.eof = False
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    while len(self.rest) == 0 and not self.eof:
+      try:
+        chunk = self.chunks.get(timeout=UPLOAD_CHUNK_TIMEOUT)
+      except queue.Empty:
+        raise UploadError("The upload stalled")
+      if chunk is None:
+        self.eof = True
+      else:
+        self.rest = chunk
+    size = min(len(buffer), len(self.rest))
+    buffer[:size] = self.rest[:size]
+    self.rest = self.rest[size:]
+    return size
+
+
+class PredictionUploadHandler(FileUploadHandler):
+  """
+  Upload handler of the prediction file field ``field_name``, runs receive_prediction in a thread
+  on the chunks as they arrive. The upload is stopped at its first problem, which is kept in
+  ``error``, otherwise ``validator`` and ``bytes`` hold the result and ``span`` the time it took.
+  Install it before the request body is read (the CSRF check of the view reads it).
+  """
+
+  def __init__(self, request, token_counts, filepath, max_bytes, field_name='file'):
+    super(PredictionUploadHandler, self).__init__(request)
+    self.token_counts = token_counts
+    self.filepath = filepath
+    self.max_bytes = max_bytes
+    self.field_name = field_name
+    self.active = False
+    self.stream = None
+    self.thread = None
+    self.start = None
+    self.validator = None
+    self.bytes = 0
+    self.error = None
+    self.span = Span('receive')
+
+  def new_file(self, field_name, *args, **kwargs):
+    super(PredictionUploadHandler, self).new_file(field_name, *args, **kwargs)
+    self.active = field_name == self.field_name and self.thread is None
+    if not self.active:
+      return
+    self.start = time.perf_counter()
+    self.stream = ChunkStream(UPLOAD_QUEUE_CHUNKS)
+    self.thread = threading.Thread(target=self.receive, daemon=True)
+    self.thread.start()
+    # The other handlers would spool the upload
+    raise StopFutureHandlers()
+
+  def receive(self):
+    try:
+      self.validator, self.bytes = receive_prediction(self.stream, self.token_counts, self.filepath, self.max_bytes)
+    except Exception as e:
+      self.error = e
+
+  def feed(self, chunk):
+    while self.error is None:
+      try:
+        self.stream.chunks.put(chunk, timeout=0.1)
+        return
+      except queue.Full:
+        pass
+    self.thread.join()
+    self.measure()
+    raise StopUpload(connection_reset=False)
+
+  def measure(self):
+    self.active = False
+    if self.span.seconds is not None:
+      return
+    self.span.seconds = time.perf_counter() - self.start
+    self.span.add(bytes=self.bytes, rows=self.validator.tokens if self.validator is not None else 0)
+
+  def receive_data_chunk(self, raw_data, start):
+    if not self.active:
+      return raw_data
+    self.feed(raw_data)
+    return None
+
+  def file_complete(self, file_size):
+    if not self.active:
+      return None
+    self.feed(None)
+    self.thread.join()
+    self.measure()
+    if self.error is not None:
+      # Returning None would ask the other handlers for the file
+      raise StopUpload(connection_reset=False)
+    return UploadedFile(open(self.filepath, 'rb'), self.file_name, self.content_type, file_size, self.charset, self.content_type_extra)
+
+  def upload_interrupted(self):
+    # The request body ended in the middle of the file, the validation fails on the partial upload
+    if self.active:
+      try:
+        self.feed(None)
+      except StopUpload:
+        pass
+      self.thread.join()
+      self.measure()
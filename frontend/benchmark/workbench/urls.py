@@ -34,6 +34,13 @@ urlpatterns = [
 
   path('bench/download_data/<int:benchmark_id>', views.download_data, name='download_data'),
 
+  # Prometheus scrape target of the stage timings
+  path('metrics', views.metrics, name='metrics'),
+
+  # Stored profiles of requests and jobs (staff only)
+  path('profiles/', views.profiles, name='profiles'),
+  path('profiles/<str:capture_id>.<str:extension>', views.profile_file, name='profile_file'),
+
   #
   # AJAX Requests
   #
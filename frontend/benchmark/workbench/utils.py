@@ -1,27 +1,72 @@
-
 import regex as re
+from bisect import bisect_left, bisect_right
 
-def call_regex(src):
+#TOKEN_PATTERN = re.compile(r"(?:[\w]+(?:[-]+[\w]+)+)|(?:[\w]+(?:[']+[\w])+)|\b[_]|(?:[_]*[\w]+(?=_\b))|\w+|[^\w\s]", re.UNICODE)
+TOKEN_PATTERN = re.compile(r"(?:\d+[,.]\d+)|(?:[\w'\u0080-\u9999]+(?:[-]+[\w'\u0080-\u9999]+)+)|(?:[\w\u0080-\u9999]+(?:[']+[\w\u0080-\u9999]+)+)|\b[_]|(?:[_]*[\w\u0080-\u9999]+(?=_\b))|(?:[\w\u00A1-\u9999]+)|[^\w\s\u00A0\p{Z}]", re.UNICODE)
+
+def tokenize(src):
   '''
-  One place for the regex.
+  One place for the regex. Returns the (token, start, end, space) span of every token of
+  ``src``, start and end are the character offsets within ``src``.
   '''
-  #return re.findall(r"(?:[\w]+(?:[-]+[\w]+)+)|(?:[\w]+(?:[']+[\w])+)|\b[_]|(?:[_]*[\w]+(?=_\b))|\w+|[^\w\s]", src, re.UNICODE)
-  tokens = re.findall(r"(?:\d+[,.]\d+)|(?:[\w'\u0080-\u9999]+(?:[-]+[\w'\u0080-\u9999]+)+)|(?:[\w\u0080-\u9999]+(?:[']+[\w\u0080-\u9999]+)+)|\b[_]|(?:[_]*[\w\u0080-\u9999]+(?=_\b))|(?:[\w\u00A1-\u9999]+)|[^\w\s\u00A0\p{Z}]", src, re.UNICODE)
-
-  spaces = []
+  spans = []
+  # The space flags are computed on the concatenated tokens, characters skipped by the
+  # regex are not accounted for
   char_counter = 0
-  for t in tokens:
-    char_counter += len(t)
+  for match in TOKEN_PATTERN.finditer(src):
+    token = match.group()
+    char_counter += len(token)
     if char_counter >= len(src):
-      spaces.append(False)
+      space = False
+    elif src[char_counter] == ' ':
+      space = True
+      char_counter += 1
     else:
-      if src[char_counter] == ' ':
-        spaces.append(True)
-        char_counter += 1
-      else:
-        spaces.append(False)
+      space = False
+    spans.append((token, match.start(), match.end(), space))
+
+  return spans
+
+def call_regex(src):
+  '''
+  Returns the tokens of ``src`` and whether each of them is followed by a space.
+  '''
+  spans = tokenize(src)
 
-  return tokens, spaces
+  return [span[0] for span in spans], [span[3] for span in spans]
+
+
+class TokenOffsetIndex(object):
+  '''
+  Maps character offsets within a sentence to the indices of its tokens.
+  '''
+
+  def __init__(self, spans):
+    self.starts = [span[1] for span in spans]
+    self.ends = [span[2] for span in spans]
+
+  def token_at(self, offset):
+    '''
+    Returns the index of the token containing ``offset``, or of the closest token before it.
+    '''
+    if len(self.starts) == 0:
+      return -1
+    return max(bisect_right(self.starts, offset) - 1, 0)
+
+  def token_range(self, offset, length):
+    '''
+    Returns the indices of all tokens overlapping the ``length`` characters starting at ``offset``,
+    none if they are outside of the sentence.
+    '''
+    if len(self.starts) == 0:
+      return []
+    if offset >= self.ends[-1] or offset + max(length, 1) <= self.starts[0]:
+      return []
+    first = bisect_right(self.ends, offset)
+    last = bisect_left(self.starts, offset + length) - 1
+    if last < first:
+      return [first]
+    return list(range(first, last + 1))
 
 
 if __name__ == '__main__':
@@ -51,3 +96,14 @@ if __name__ == '__main__':
   assert(spaces[7] == True)
   assert(spaces[8] == False)
   assert(spaces[9] == False)
+
+  index = TokenOffsetIndex(tokenize(test))
+
+  assert(index.token_at(0) == 0)
+  assert(index.token_at(5) == 1)
+  assert(index.token_at(9) == 3)
+  assert(index.token_range(11, 6) == [4])
+  assert(index.token_range(11, 12) == [4, 5, 6])
+  assert(index.token_range(29, 9) == [8, 9])
+  assert(index.token_range(38, 2) == [])
+  assert(index.token_range(-3, 2) == [])
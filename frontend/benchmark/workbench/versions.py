@@ -0,0 +1,151 @@
+'''
+Versioned publishing of results and predictions. Every upload is written under a new
+ResultVersion and published by pointing the PublishedResult of its program and benchmark to it,
+all in one transaction: readers see either the complete old or the complete new version and
+never wait for an ingest. Uploads of the same program and benchmark are serialized by locking
+their PublishedResult row, uploads of other pairs go on in parallel.
+
+Results and error categories belong to exactly one version. Prediction rows are valid for a
+range of versions, so unchanged sentences are shared between versions (see
+read_and_save_alignment_file). Superseded versions are garbage-collected by
+manage.py collect_result_versions once no reader can still be working with them.
+'''
+
+import os
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Result, ErrorCategory, PredictedSentenceInformation, ResultVersion, PublishedResult
+from .partitions import ensure_partition, compact_predictions
+from .timing import span
+
+
+def published_version_id(program, benchmark):
+  """
+  Returns the ID of the published version of a program for a benchmark, 0 if there is none.
+  """
+  version_id = PublishedResult.objects.filter(program=program, benchmark=benchmark).values_list('version_id', flat=True).first()
+  return version_id or 0
+
+def published_version_ids(benchmark):
+  """
+  Returns the ID of the published version of every program for a benchmark.
+  """
+  return dict(PublishedResult.objects.filter(benchmark=benchmark).values_list('program_id', 'version_id'))
+
+def published_results(benchmark):
+  # Results without version were written before versioning and are replaced by the first upload
+  return Result.objects.filter(Q(version__publications__benchmark=benchmark) | Q(version__isnull=True), benchmark=benchmark).select_related('program')
+
+def published_error_categories(benchmark, program):
+  return ErrorCategory.objects.filter(Q(version__publications__benchmark=benchmark) | Q(version__isnull=True), benchmark=benchmark, program=program)
+
+def published_error_categories_by_program(benchmark):
+  """
+  Returns the published error categories of all programs for a benchmark in one query, as
+  ``{program ID: {category name: ErrorCategory}}``.
+  """
+  categories = {}
+  published = ErrorCategory.objects.filter(Q(version__publications__benchmark=benchmark) | Q(version__isnull=True), benchmark=benchmark)
+  for category in published.order_by('pk'):
+    categories.setdefault(category.program_id, {}).setdefault(category.name, category)
+  return categories
+
+def visible_predictions(program, benchmark):
+  """
+  Returns the predictions of the published version of a program for a benchmark.
+  """
+  version_id = published_version_id(program, benchmark)
+  return PredictedSentenceInformation.objects.filter(
+    Q(valid_to__isnull=True) | Q(valid_to__gt=version_id),
+    program=program,
+    benchmark=benchmark,
+    valid_from__lte=version_id
+  )
+
+def visible_predictions_of_programs(programs, benchmark):
+  """
+  Returns the predictions of the published versions of all ``programs`` for a benchmark, in one
+  query instead of one per program.
+  """
+  version_ids = published_version_ids(benchmark)
+  condition = Q(pk__in=[])
+  for program in programs:
+    version_id = version_ids.get(program.pk, 0)
+    condition |= Q(program=program, valid_from__lte=version_id) & (Q(valid_to__isnull=True) | Q(valid_to__gt=version_id))
+  return PredictedSentenceInformation.objects.filter(condition, benchmark=benchmark)
+
+def publish_results(program, benchmark, data, dir_with_alignment_file=None):
+  """
+  Writes the evaluation ``data`` and, if given, the alignments in ``dir_with_alignment_file`` as
+  a new version of the results of ``program`` for ``benchmark`` and publishes it. Without
+  alignments the predictions of the previous version are kept.
+  """
+  from .helpers import write_results_to_db, read_and_save_alignment_file
+
+  if dir_with_alignment_file is not None:
+    ensure_partition(benchmark.pk, program.pk)
+  ensure_publication(program, benchmark)
+
+  with transaction.atomic():
+    # Serializes the uploads of the pair, the version is created after the lock so the versions
+    # of a pair are numbered in the order they are published
+    publication = PublishedResult.objects.select_for_update().get(program=program, benchmark=benchmark)
+    version = ResultVersion.objects.create(program=program, benchmark=benchmark)
+
+    with span('write_results') as s:
+      s.add(rows=write_results_to_db(data, program, benchmark, version))
+    if dir_with_alignment_file is not None:
+      with span('save_alignments') as s:
+        s.add(bytes=os.path.getsize(dir_with_alignment_file + 'alignments.json'))
+        s.add(rows=read_and_save_alignment_file(program, benchmark, dir_with_alignment_file, version))
+
+    # The pointer flip, becomes visible to the readers on commit
+    ResultVersion.objects.filter(pk=publication.version_id).update(superseded=timezone.now())
+    publication.version = version
+    publication.save(update_fields=['version'])
+
+  return version
+
+def ensure_publication(program, benchmark):
+  """
+  Publishes an empty version of ``program`` for ``benchmark`` if nothing is published yet, so
+  the first upload has a PublishedResult row to lock. Readers see the same as without one.
+  """
+  if PublishedResult.objects.filter(program=program, benchmark=benchmark).exists():
+    return
+  try:
+    with transaction.atomic():
+      version = ResultVersion.objects.create(program=program, benchmark=benchmark)
+      PublishedResult.objects.create(program=program, benchmark=benchmark, version=version)
+  except IntegrityError:
+    # Published by a concurrent upload of the pair
+    pass
+
+
+def collect_garbage():
+  """
+  Removes the versions superseded for longer than RESULT_VERSION_GRACE seconds, together with
+  their results and the prediction rows no remaining version can see. Neither readers nor
+  uploads wait for it.
+  """
+  cutoff = timezone.now() - timezone.timedelta(seconds=settings.RESULT_VERSION_GRACE)
+  pairs = ResultVersion.objects.filter(superseded__lt=cutoff).values_list('program_id', 'benchmark_id').distinct()
+  for program_id, benchmark_id in list(pairs):
+    published_id = PublishedResult.objects.filter(program_id=program_id, benchmark_id=benchmark_id).values_list('version_id', flat=True).first()
+    if published_id is None:
+      continue
+    # The oldest version that may still be read, everything older is collectable. Versions
+    # published later are newer, so it stays valid while an upload of the pair goes on
+    keep_from = ResultVersion.objects.filter(
+      Q(superseded__isnull=True) | Q(superseded__gte=cutoff),
+      program_id=program_id,
+      benchmark_id=benchmark_id
+    ).order_by('pk').values_list('pk', flat=True).first() or published_id
+
+    num_rows = compact_predictions(benchmark_id, program_id, keep_from)
+    num_versions = ResultVersion.objects.filter(program_id=program_id, benchmark_id=benchmark_id, pk__lt=keep_from).delete()[1].get(ResultVersion._meta.label, 0)
+    print("Collected %d result versions and %d prediction rows of program %d for benchmark %d" % (num_versions, num_rows, program_id, benchmark_id))
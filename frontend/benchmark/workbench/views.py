@@ -3,10 +3,23 @@ from django.shortcuts import render, redirect
 from django.http import HttpResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from .forms import AddProgramForm, UploadResultsForm
 
+from django.conf import settings
+
 from .models import Program, Benchmark, Result, ErrorCategory, InternalSentenceInformation, PredictedSentenceInformation
 from .helpers import *
+from .corpus import load_tokenized_benchmark
+from .engines import warmup_report
+from .vocabulary import VOCABULARY
+from .versions import publish_results, published_results, published_error_categories_by_program
+from .timing import JobTimer, span, render_metrics
+from .speed import EngineRun, save_engine_run, speed_leaderboard
+from .querybudget import query_budget
+from .profiling import list_captures, capture_file
+from .uploads import receive_prediction, PredictionUploadHandler, UploadError
 
 from .tasks import *
 
@@ -108,6 +121,7 @@ def benchmarks(request):
 
   return render(request, 'workbench/benchmarks.html', context)
 
+@query_budget(12)
 def benchmark(request, benchmark_id):
   """
   Returns the results view of one specific benchmark, given by @p benchmark_id.
@@ -118,7 +132,7 @@ def benchmark(request, benchmark_id):
   benchmark = get_object_or_404(Benchmark, pk=benchmark_id)
 
   programs = Program.objects.order_by('program_name')
-  results = Result.objects.filter(benchmark=benchmark_id)
+  results = published_results(benchmark_id)
   sentences = receive_sentences_for_benchmark(benchmark_id)
 
   # DEPRECATED: categories = ErrorCategory.objects.filter(benchmark=benchmark_id)
@@ -134,6 +148,7 @@ def benchmark(request, benchmark_id):
     'results': results,
     'sentences': sentences,
     'js_program_names': js_program_names,
+    'speed': speed_leaderboard(benchmark_id),
     'user': request.user
   }
 
@@ -151,26 +166,25 @@ def benchmark(request, benchmark_id):
   TENSE_TABLE = {}
   MENTION_MISMATCH_TABLE = {}
 
+  categories = published_error_categories_by_program(benchmark_id)
   for program in programs:
-    sub_categories = ErrorCategory.objects.filter(benchmark=benchmark_id, program=program.id)
-
-    if sub_categories.count() > 0:
-
-      #print("sub_categories[NONE]: %s" % (sub_categories.filter(name="NONE")[:1].get()))
-
-      NONE_TABLE[program.program_name] = sub_categories.filter(name="NONE")[:1].get()
-      NON_WORD_TABLE[program.program_name] = sub_categories.filter(name="NON_WORD")[:1].get()
-      REAL_WORD_TABLE[program.program_name] = sub_categories.filter(name="REAL_WORD")[:1].get()
-      SPLIT_TABLE[program.program_name] = sub_categories.filter(name="SPLIT")[:1].get()
-      HYPHENATION_TABLE[program.program_name] = sub_categories.filter(name="HYPHENATION")[:1].get()
-      COMPOUND_HYPHEN_TABLE[program.program_name] = sub_categories.filter(name="COMPOUND_HYPHEN")[:1].get()
-      CONCATENATION_TABLE[program.program_name] = sub_categories.filter(name="CONCATENATION")[:1].get()
-      CAPITALISATION_TABLE[program.program_name] = sub_categories.filter(name="CAPITALISATION")[:1].get()
-      REPEAT_TABLE[program.program_name] = sub_categories.filter(name="REPEAT")[:1].get()
-      ARCHAIC_TABLE[program.program_name] = sub_categories.filter(name="ARCHAIC")[:1].get()
-      PUNCTUATION_TABLE[program.program_name] = sub_categories.filter(name="PUNCTUATION")[:1].get()
-      MENTION_MISMATCH_TABLE[program.program_name] = sub_categories.filter(name="MENTION_MISMATCH")[:1].get()
-      TENSE_TABLE[program.program_name] = sub_categories.filter(name="TENSE")[:1].get()
+    sub_categories = categories.get(program.id)
+
+    if sub_categories:
+
+      NONE_TABLE[program.program_name] = sub_categories.get("NONE")
+      NON_WORD_TABLE[program.program_name] = sub_categories.get("NON_WORD")
+      REAL_WORD_TABLE[program.program_name] = sub_categories.get("REAL_WORD")
+      SPLIT_TABLE[program.program_name] = sub_categories.get("SPLIT")
+      HYPHENATION_TABLE[program.program_name] = sub_categories.get("HYPHENATION")
+      COMPOUND_HYPHEN_TABLE[program.program_name] = sub_categories.get("COMPOUND_HYPHEN")
+      CONCATENATION_TABLE[program.program_name] = sub_categories.get("CONCATENATION")
+      CAPITALISATION_TABLE[program.program_name] = sub_categories.get("CAPITALISATION")
+      REPEAT_TABLE[program.program_name] = sub_categories.get("REPEAT")
+      ARCHAIC_TABLE[program.program_name] = sub_categories.get("ARCHAIC")
+      PUNCTUATION_TABLE[program.program_name] = sub_categories.get("PUNCTUATION")
+      MENTION_MISMATCH_TABLE[program.program_name] = sub_categories.get("MENTION_MISMATCH")
+      TENSE_TABLE[program.program_name] = sub_categories.get("TENSE")
 
   context["NONE"] = NONE_TABLE
   context["NON_WORD"] = NON_WORD_TABLE
@@ -230,62 +244,109 @@ def results(request, benchmark_id):
 
 
 
+@csrf_exempt
 @login_required(login_url='/user/login/')
 def upload_results(request, benchmark_id):
   """
-  Uploads the calculated files for a specific benchmark, given by its unique ID.
+  Uploads the calculated files for a specific benchmark, given by its unique ID. The prediction
+  file is decoded and validated against the benchmark while it is uploaded, see
+  workbench.uploads. The CSRF check is done by receive_results, after the upload handler is
+  installed.
 
   :param request: The request.
   :param benchmark_id: The unique benchmark ID.
   """
+  receiver = None
+  if request.method == 'POST':
+    benchmark_db = get_object_or_404(Benchmark, pk=benchmark_id)
+    source = load_tokenized_benchmark(benchmark_db.download_file, os.path.join(settings.CACHE_DIR, 'corpus'))
+    prediction_filepath = '/tmp/' + ''.join(random.choice(string.ascii_lowercase) for i in range(32)) + '.json'
+    receiver = PredictionUploadHandler(request, source.token_counts(), prediction_filepath, settings.UPLOAD_MAX_BYTES)
+    request.upload_handlers.insert(0, receiver)
+  return receive_results(request, benchmark_id, receiver)
+
+@csrf_protect
+def receive_results(request, benchmark_id, receiver=None):
   if request.method == 'POST':
     form = UploadResultsForm(request.POST, request.FILES, user=request.user)
 
-    if form.is_valid():
-      # Upload and save the file in a temporarily used directory
-      prediction_filepath = handle_uploaded_file(request.FILES['file'])
-      # Extract all, the groundtruth, source and prediction file
+    if receiver.error is not None:
+      # Recorded as a failed job that ended in the receive stage
+      receiver.span.stage += ':error'
+      try:
+        with JobTimer('upload_results', Benchmark.objects.filter(pk=benchmark_id).first(), Program.objects.filter(pk=request.POST.get('program'), user=request.user).first()) as timer:
+          timer.finished(receiver.span)
+          raise receiver.error
+      except UploadError as e:
+        print("Rejected upload for benchmark %s: %s" % (benchmark_id, e))
+        form.add_error('file', str(e))
+        return render(request, 'workbench/upload_results.html', {'form': form}, status=400)
 
+    if form.is_valid():
       benchmark_db = get_object_or_404(Benchmark, pk=request.POST.get('benchmark'))
       source_filepath = benchmark_db.download_file
       groundtruth_filepath = benchmark_db.groundtruth_file
       raw_filepath = benchmark_db.raw_file
       lang_code = benchmark_db.lang_code
       program = get_object_or_404(Program, pk=request.POST.get('program'))
+      prediction_filepath = receiver.filepath
+      num_bytes = receiver.bytes
 
-      #
-      extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
-
-      os.mkdir(extraction_path)
-
-      print("Extract to: %s" % (extraction_path))
-
-      shutil.copyfile(source_filepath, extraction_path + 'source.json')
-      shutil.copyfile(groundtruth_filepath, extraction_path + 'groundtruth.json')
-      shutil.copyfile(raw_filepath, extraction_path + 'raw.txt')
-      shutil.copyfile(prediction_filepath, extraction_path + 'prediction.json')
-
-      post_data = {
-        "langCode": lang_code,
-        "path": extraction_path
-      }
-      response = requests.post('http://evaluator:1338/api/v1/evaluate', json=post_data)
-
-      print("response.text: %s" % (response.text))
       try:
-        data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
-      except ValueError as e:
-        data = json.loads(response.text)
-
-      #print("data: %s" % (data))
-      write_results_to_db(data, program, benchmark_db)
-
-      # Write all information to the db
-      print("Start alignment parsing ...")
-      read_and_save_alignment_file(program, benchmark_db, extraction_path)
-
-      # Remove the directory under /tmp
-      delete_directory(extraction_path)
+        with JobTimer('upload_results', benchmark_db, program) as timer:
+          # Decoded and validated while it was uploaded, bad files are rejected there
+          timer.finished(receiver.span)
+          if benchmark_db.pk != int(benchmark_id):
+            # Uploaded from the page of another benchmark, validated against that one
+            with span('revalidate'):
+              source = load_tokenized_benchmark(source_filepath, os.path.join(settings.CACHE_DIR, 'corpus'))
+              with open(receiver.filepath, 'rb') as fin:
+                prediction_filepath = receiver.filepath[:-len('.json')] + '-' + str(benchmark_db.pk) + '.json'
+                receive_prediction(fin, source.token_counts(), prediction_filepath, settings.UPLOAD_MAX_BYTES)
+              os.remove(receiver.filepath)
+
+          #
+          extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
+
+          print("Extract to: %s" % (extraction_path))
+
+          # Extract all, the groundtruth, source and prediction file
+          with span('stage_files') as s:
+            os.mkdir(extraction_path)
+            s.add(bytes=stage_files(extraction_path, [
+              (source_filepath, 'source.json'),
+              (groundtruth_filepath, 'groundtruth.json'),
+              (raw_filepath, 'raw.txt')
+            ]))
+            shutil.move(prediction_filepath, extraction_path + 'prediction.json')
+            s.add(bytes=num_bytes)
+
+          with span('evaluate') as s:
+            response = request_evaluation(lang_code, extraction_path)
+            s.add(bytes=len(response.content))
+
+          print("response.text: %s" % (response.text))
+          with span('decode'):
+            try:
+              data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
+            except ValueError as e:
+              data = json.loads(response.text)
+
+          #print("data: %s" % (data))
+          # Write all information to the db
+          print("Start alignment parsing ...")
+          publish_results(program, benchmark_db, data, extraction_path)
+
+          # Remove the directory under /tmp
+          with span('cleanup'):
+            delete_directory(extraction_path)
+      except UploadError as e:
+        print("Rejected upload for benchmark %s: %s" % (benchmark_db.benchmark_name, e))
+        form.add_error('file', str(e))
+        return render(request, 'workbench/upload_results.html', {'form': form}, status=400)
+
+    elif os.path.exists(receiver.filepath):
+      os.remove(receiver.filepath)
 
     #return render(request, 'workbench/benchmark.html', context)
     return benchmark(request, benchmark_id)
@@ -295,12 +356,46 @@ def upload_results(request, benchmark_id):
       # TODO(naetherm): Handle file content
 
   else:
-    form = UploadResultsForm(user=request.user)
+    form = UploadResultsForm(user=request.user, initial={'benchmark': benchmark_id})
   context = {
     'form': form
   }
   return render(request, 'workbench/upload_results.html', context)
 
+def metrics(request):
+  """
+  The stage timings of the evaluation jobs in the Prometheus text format.
+  """
+  return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def profiles(request):
+  """
+  The stored profiles of requests and jobs, see workbench.profiling.
+  """
+  context = {
+    'captures': list_captures(),
+    'targets': settings.PROFILING_TARGETS,
+    'header': settings.PROFILING_HEADER
+  }
+  return render(request, 'workbench/profiles.html', context)
+
+@staff_member_required
+def profile_file(request, capture_id, extension):
+  """
+  Download of the pstats file (prof) or the report (txt) of a stored profile.
+  """
+  path = capture_file(capture_id, extension)
+  if path is None:
+    raise Http404("Profile does not exist")
+  if extension == 'txt':
+    with open(path, 'r', encoding='utf-8') as fin:
+      return HttpResponse(fin.read(), content_type='text/plain; charset=utf-8')
+  with open(path, 'rb') as fin:
+    response = HttpResponse(fin.read(), content_type='application/octet-stream')
+  response['Content-Disposition'] = 'attachment; filename="%s.prof"' % (capture_id)
+  return response
+
 def result_format(request):
   """
   """
@@ -340,24 +435,29 @@ def initialize_internal_tables(request):
 
     #numArticles = len(source_results)
 
+    # Add all tokens of the benchmark to the vocabulary at once
+    VOCABULARY.intern([t for source in source_results for tokens in source.tokens for t in tokens])
+    VOCABULARY.intern([t for grt in grt_results for tokens in grt.tokens + grt.types for t in tokens])
+
+    sentences = []
     for aidx, source in enumerate(source_results):
       for sidx in range(len(source.sentences)):
         # Get the sentence
 
-        elems_ = []
-        for idx, elem in enumerate(grt_results[aidx].connections[sidx]):
-          elems_.append("{}->{}".format(idx, ",".join(str(e) for e in elem)))
-
-        InternalSentenceInformation.objects.create(
+        fields = InternalSentenceInformation.encode(
+          source.tokens[sidx],
+          grt_results[aidx].tokens[sidx],
+          grt_results[aidx].types[sidx],
+          list(enumerate(grt_results[aidx].connections[sidx]))
+        )
+        sentences.append(InternalSentenceInformation(
           benchmark=benchmark,
           display=source.sentences[sidx],
           aidx=aidx,
           sidx=sidx,
-          src_tokens=source.tokens[sidx],
-          grt_tokens=grt_results[aidx].tokens[sidx],
-          types= grt_results[aidx].types[sidx],
-          connections="|".join(e for e in elems_)
-        )
+          **fields
+        ))
+    InternalSentenceInformation.objects.bulk_create(sentences, batch_size=1000)
 
 
   context = {
@@ -379,6 +479,8 @@ def benchmark_populate_baseline(request, benchmark_id):
   from os import listdir
   benchmark = get_object_or_404(Benchmark, pk=benchmark_id)
   programs = Program.objects.filter(is_baseline=True).order_by('program_name')
+  # Interrupted runs continue from their checkpoints unless started over with ?resume=0
+  resume = request.GET.get('resume', '1') != '0'
 
   groundtruth_filepath = benchmark.groundtruth_file
   raw_filepath = benchmark.raw_file
@@ -386,6 +488,12 @@ def benchmark_populate_baseline(request, benchmark_id):
 
   ski_programs = ["LanguageTool", "Aspell", "HunSpell", "MaShape", "GrammarBot"]
 
+  # Rebuilt and tokenized once, shared by all programs
+  with JobTimer('populate_baseline', benchmark):
+    with span('load_source') as s:
+      source = load_tokenized_benchmark(benchmark.download_file, os.path.join(settings.CACHE_DIR, 'corpus'))
+      s.add(bytes=os.path.getsize(benchmark.download_file))
+
   for program in programs:
     #if program.program_name == "GrammarBot" or program.program_name == "LanguageTool":
     #  continue
@@ -398,66 +506,64 @@ def benchmark_populate_baseline(request, benchmark_id):
 
     print("\n"*20)
     print("Populate for program: %s" % (program.program_name))
-    extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
-    os.mkdir(extraction_path)
-    print("extraction_path: %s" %(extraction_path))
-    print(listdir(extraction_path))
-
-
-    input_filepath = benchmark.download_file
-    shutil.copyfile(input_filepath, extraction_path + 'source.json')
-    shutil.copyfile(groundtruth_filepath, extraction_path + 'groundtruth.json')
-    shutil.copyfile(raw_filepath, extraction_path + 'raw.txt')
-
-    print("Start prediction phase ...")
-    # Cleanup
-    #for idx, l in enumerate(links):
-    #  links[idx] = l.replace('\n', '')
-
-    if os.path.exists(extraction_path + 'groundtruth.json'):
-      source_content = ""
-
-      with open(extraction_path + 'source.json', 'r') as fin:
-        source_content = fin.read()
-
-      prediction_content = predict_builtin(program.program_name, source_content, lang_code)
+    with JobTimer('populate_baseline', benchmark, program):
+      extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
+      print("extraction_path: %s" %(extraction_path))
 
-      if not os.path.exists(os.path.dirname(extraction_path + 'prediction.json')):
-        os.makedirs(os.path.dirname(extraction_path + 'prediction.json'))
-      with open(extraction_path + 'prediction.json', 'w', encoding='utf-8') as fout:
-        fout.write(prediction_content)
+      with span('stage_files') as s:
+        os.mkdir(extraction_path)
+        s.add(bytes=stage_files(extraction_path, [
+          (benchmark.download_file, 'source.json'),
+          (groundtruth_filepath, 'groundtruth.json'),
+          (raw_filepath, 'raw.txt')
+        ]))
 
-    print(">> done!")
+      print("Start prediction phase ...")
+      # Cleanup
+      #for idx, l in enumerate(links):
+      #  links[idx] = l.replace('\n', '')
 
-    post_data = {"langCode": lang_code, "path": extraction_path}
-    print("Sent to responser : %s" %(post_data))
-    response = requests.post('http://evaluator:1338/api/v1/evaluate', json=post_data)
+      run = None
+      checkpoint_dir = baseline_checkpoint_dir(benchmark, program)
+      if os.path.exists(extraction_path + 'groundtruth.json'):
+        run = EngineRun(program.program_name, lang_code)
+        with span('predict') as s:
+          if not os.path.exists(os.path.dirname(extraction_path + 'prediction.json')):
+            os.makedirs(os.path.dirname(extraction_path + 'prediction.json'))
+          predict_builtin_to_file(program.program_name, source, lang_code, extraction_path + 'prediction.json', run, checkpoint_dir, resume)
+          s.add(bytes=os.path.getsize(extraction_path + 'prediction.json'))
 
-    text_answer = response.text
-    #print("text_answer: %s" % (text_answer))
-    json_answer = response.json()
-    #print("json_answer: %s" % (json_answer))
-    #try:
-    try:
-      data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
+      print(">> done!")
 
-      #print("data: %s" % (data))
-      write_results_to_db(data, program, benchmark)
+      print("Sent to responser : %s" %(extraction_path))
+      with span('evaluate') as s:
+        response = request_evaluation(lang_code, extraction_path)
+        s.add(bytes=len(response.content))
 
-      # Write all information to the db
-      print("Start alignment parsing ...")
-      read_and_save_alignment_file(program, benchmark, extraction_path)
-    except:
-      print("Ran into problems for Program {}".format(program.program_name))
-      print("\tCorresponding prediction can be found under: {}".format(extraction_path))
+      #try:
+      version = None
+      try:
+        with span('decode'):
+          data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
+
+        #print("data: %s" % (data))
+        # Write all information to the db
+        print("Start alignment parsing ...")
+        version = publish_results(program, benchmark, data, extraction_path)
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+      except:
+        print("Ran into problems for Program {}".format(program.program_name))
+        print("\tCorresponding prediction can be found under: {}".format(extraction_path))
+      if run is not None:
+        save_engine_run(run, program, benchmark, version)
 
-    # Remove the directory under /tmp
-    #delete_directory(extraction_path)
+      # Remove the directory under /tmp
+      #delete_directory(extraction_path)
 
 
-  results = Result.objects.filter(benchmark=benchmark_id)
+  results = published_results(benchmark_id)
   programs = Program.objects.filter()
-  results = Result.objects.filter(benchmark=benchmark_id)
+  results = published_results(benchmark_id)
   sentences = receive_sentences_for_benchmark(benchmark_id)
 
   # Filter everything here
@@ -467,6 +573,7 @@ def benchmark_populate_baseline(request, benchmark_id):
     'programs': programs,
     'results': results,
     'sentences': sentences,
+    'speed': speed_leaderboard(benchmark_id),
     'user': request.user
   }
 
@@ -484,26 +591,25 @@ def benchmark_populate_baseline(request, benchmark_id):
   MENTION_MISMATCH_TABLE = {}
   TENSE_TABLE = {}
 
+  categories = published_error_categories_by_program(benchmark_id)
   for program in programs:
-    sub_categories = ErrorCategory.objects.filter(benchmark=benchmark_id, program=program.id)
-
-    if sub_categories.count() > 0:
-
-      #print("sub_categories[NONE]: %s" % (sub_categories.filter(name="NONE")[:1].get()))
-
-      NONE_TABLE[program.program_name] = sub_categories.filter(name="NONE")[:1].get()
-      NON_WORD_TABLE[program.program_name] = sub_categories.filter(name="NON_WORD")[:1].get()
-      REAL_WORD_TABLE[program.program_name] = sub_categories.filter(name="REAL_WORD")[:1].get()
-      SPLIT_TABLE[program.program_name] = sub_categories.filter(name="SPLIT")[:1].get()
-      HYPHENATION_TABLE[program.program_name] = sub_categories.filter(name="HYPHENATION")[:1].get()
-      COMPOUND_HYPHEN_TABLE[program.program_name] = sub_categories.filter(name="COMPOUND_HYPHEN")[:1].get()
-      CONCATENATION_TABLE[program.program_name] = sub_categories.filter(name="CONCATENATION")[:1].get()
-      CAPITALISATION_TABLE[program.program_name] = sub_categories.filter(name="CAPITALISATION")[:1].get()
-      REPEAT_TABLE[program.program_name] = sub_categories.filter(name="REPEAT")[:1].get()
-      ARCHAIC_TABLE[program.program_name] = sub_categories.filter(name="ARCHAIC")[:1].get()
-      PUNCTUATION_TABLE[program.program_name] = sub_categories.filter(name="PUNCTUATION")[:1].get()
-      MENTION_MISMATCH_TABLE[program.program_name] = sub_categories.filter(name="MENTION_MISMATCH")[:1].get()
-      TENSE_TABLE[program.program_name] = sub_categories.filter(name="TENSE")[:1].get()
+    sub_categories = categories.get(program.id)
+
+    if sub_categories:
+
+      NONE_TABLE[program.program_name] = sub_categories.get("NONE")
+      NON_WORD_TABLE[program.program_name] = sub_categories.get("NON_WORD")
+      REAL_WORD_TABLE[program.program_name] = sub_categories.get("REAL_WORD")
+      SPLIT_TABLE[program.program_name] = sub_categories.get("SPLIT")
+      HYPHENATION_TABLE[program.program_name] = sub_categories.get("HYPHENATION")
+      COMPOUND_HYPHEN_TABLE[program.program_name] = sub_categories.get("COMPOUND_HYPHEN")
+      CONCATENATION_TABLE[program.program_name] = sub_categories.get("CONCATENATION")
+      CAPITALISATION_TABLE[program.program_name] = sub_categories.get("CAPITALISATION")
+      REPEAT_TABLE[program.program_name] = sub_categories.get("REPEAT")
+      ARCHAIC_TABLE[program.program_name] = sub_categories.get("ARCHAIC")
+      PUNCTUATION_TABLE[program.program_name] = sub_categories.get("PUNCTUATION")
+      MENTION_MISMATCH_TABLE[program.program_name] = sub_categories.get("MENTION_MISMATCH")
+      TENSE_TABLE[program.program_name] = sub_categories.get("TENSE")
 
   context["NONE"] = NONE_TABLE
   context["NON_WORD"] = NON_WORD_TABLE
@@ -527,6 +633,7 @@ def populate_baselines(request):
   from os import listdir
   benchmarks = Benchmark.objects.order_by('benchmark_name')
   programs = Program.objects.filter(is_baseline=True).order_by('program_name')
+  resume = request.GET.get('resume', '1') != '0'
 
   for benchmark in benchmarks:
     print("Populate for benchmark: %s" % (benchmark.benchmark_name))
@@ -535,6 +642,12 @@ def populate_baselines(request):
     raw_filepath = benchmark.raw_file
     lang_code = benchmark.lang_code
 
+    # Rebuilt and tokenized once, shared by all programs
+    with JobTimer('populate_baselines', benchmark):
+      with span('load_source') as s:
+        source = load_tokenized_benchmark(benchmark.download_file, os.path.join(settings.CACHE_DIR, 'corpus'))
+        s.add(bytes=os.path.getsize(benchmark.download_file))
+
     for program in programs:
       if program.program_name == "GrammarBot" or program.program_name == "LanguageTool":
         continue
@@ -544,53 +657,58 @@ def populate_baselines(request):
       ##
 
       print("Populate for program: %s" % (program.program_name))
-      extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
-      os.mkdir(extraction_path)
-      print("extraction_path: %s" %(extraction_path))
-      print(listdir(extraction_path))
-
-
-      input_filepath = benchmark.download_file
-      shutil.copyfile(input_filepath, extraction_path + 'source.json')
-      shutil.copyfile(groundtruth_filepath, extraction_path + 'groundtruth.json')
-      shutil.copyfile(raw_filepath, extraction_path + 'raw.txt')
-
-      print("Start prediction phase ...")
-
-      if os.path.exists(extraction_path + 'groundtruth.json'):
-        #print("Evaluating '%s'" % (l))
-        source_content = ""
-
-        with open(extraction_path + 'source.json', 'r') as fin:
-          source_content = fin.read()
-
-        prediction_content = predict_builtin(program.program_name, source_content, lang_code)
-
-        if not os.path.exists(os.path.dirname(extraction_path + 'prediction.json')):
-          os.makedirs(os.path.dirname(extraction_path + 'prediction.json'))
-        with open(extraction_path + 'prediction.json', 'w', encoding='utf-8') as fout:
-          fout.write(prediction_content)
-        #print(">> done")
-
-      print(">> done!")
-
-      post_data = {"langCode": lang_code, "path": extraction_path}
-      print("Sent to responser : %s" %(post_data))
-      response = requests.post('http://evaluator:1338/api/v1/evaluate', json=post_data)
-
-      text_answer = response.text
-      print("text_answer: %s" % (text_answer))
-      #json_answer = response.json()
-      #print("json_answer: %s" % (json_answer))
-      #try:
-      data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
-
-      #print("data: %s" % (data))
-      write_results_to_db(data, program, benchmark)
-
-      # Remove the directory under /tmp
-      delete_directory(extraction_path)
-
+      with JobTimer('populate_baselines', benchmark, program):
+        extraction_path = '/data/' + ''.join(random.choice(string.ascii_lowercase) for i in range(16)) + '/'
+        print("extraction_path: %s" %(extraction_path))
+
+        with span('stage_files') as s:
+          os.mkdir(extraction_path)
+          s.add(bytes=stage_files(extraction_path, [
+            (benchmark.download_file, 'source.json'),
+            (groundtruth_filepath, 'groundtruth.json'),
+            (raw_filepath, 'raw.txt')
+          ]))
+
+        print("Start prediction phase ...")
+
+        run = None
+        checkpoint_dir = baseline_checkpoint_dir(benchmark, program)
+        if os.path.exists(extraction_path + 'groundtruth.json'):
+          #print("Evaluating '%s'" % (l))
+          run = EngineRun(program.program_name, lang_code)
+          with span('predict') as s:
+            if not os.path.exists(os.path.dirname(extraction_path + 'prediction.json')):
+              os.makedirs(os.path.dirname(extraction_path + 'prediction.json'))
+            predict_builtin_to_file(program.program_name, source, lang_code, extraction_path + 'prediction.json', run, checkpoint_dir, resume)
+            s.add(bytes=os.path.getsize(extraction_path + 'prediction.json'))
+          #print(">> done")
+
+        print(">> done!")
+
+        print("Sent to responser : %s" %(extraction_path))
+        with span('evaluate') as s:
+          response = request_evaluation(lang_code, extraction_path)
+          s.add(bytes=len(response.content))
+
+        print("text_answer: %s" % (response.text))
+        #json_answer = response.json()
+        #print("json_answer: %s" % (json_answer))
+        #try:
+        with span('decode'):
+          data = json.loads(response.text.replace("\\\"", "\"")[1:-1])
+
+        #print("data: %s" % (data))
+        version = publish_results(program, benchmark, data)
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        if run is not None:
+          save_engine_run(run, program, benchmark, version)
+
+        # Remove the directory under /tmp
+        with span('cleanup'):
+          delete_directory(extraction_path)
+
+  for name, lang_code, seconds in warmup_report():
+    print("Warm-up of %s (%s): %.2fs" % (name, lang_code, seconds))
 
   context = {
     'user': request.user,
@@ -617,6 +735,7 @@ def get_predictions_for_benchmark_and_program(request, benchmark_id, program_id)
 
   return JsonResponse(prediction_wrapper, safe=True)
 
+@query_budget(6)
 def get_predictions_for_benchmark(request, benchmark_id):
   """
   Returns the prediction information for a specific benchmark.
@@ -626,18 +745,23 @@ def get_predictions_for_benchmark(request, benchmark_id):
 
   programs = Program.objects.order_by('program_name')
 
+  # The predictions of all programs at once
+  predictions = receive_all_predictions_of_programs(benchmark_id, programs)
+
   prediction_wrapper = {}
+  program_names = {}
   for program in programs:
-    p_predictions = receive_predictions_for_benchmark(benchmark_id, program)
     prediction_wrapper[program.program_name] = []
-    for prediction in p_predictions:
-      prediction_wrapper[program.program_name].append({'tokens': prediction.tokens, 'corrected': prediction.corrected, 'src': prediction.src_connections, 'grt': prediction.tgt_connections})
+    program_names[program.pk] = program.program_name
+  for prediction in predictions:
+    prediction_wrapper[program_names[prediction.program_id]].append({'tokens': prediction.tokens, 'corrected': prediction.corrected, 'src': prediction.src_connections, 'grt': prediction.tgt_connections})
 
 
   return JsonResponse(prediction_wrapper, safe=True)
 
 
 
+@query_budget(8)
 def get_sentences_and_prediction_for_idx(request):
   print("Received AJAX call with the following parameter of 'value': {}".format(request.GET.get('value', -1)))
   print("Fetch data for the benchmark with the ID: {}".format(request.GET.get('benchmark')))
@@ -650,16 +774,18 @@ def get_sentences_and_prediction_for_idx(request):
   # Receive all program names from the database
   programs = Program.objects.order_by('program_name')
   # Receive the results for all programs of the given benchmark ID
-  results = Result.objects.filter(benchmark=benchmark_id)
+  results = published_results(benchmark_id)
 
   sentence = receive_sentences_for_benchmark_new(benchmark, sidx_to_fetch, aidx_to_fetch)
 
   prediction_dummy = {}
+  program_names = {}
   for program in programs:
-    p_predictions = receive_predictions_for_benchmark_new(benchmark_id, program, sidx_to_fetch, aidx_to_fetch)
     prediction_dummy[program.program_name] = []
-    for prediction in p_predictions:
-      prediction_dummy[program.program_name].append({'tokens': prediction.tokens, 'corrected': prediction.corrected, 'src': prediction.src_connections, 'grt': prediction.tgt_connections})
+    program_names[program.pk] = program.program_name
+  # The predictions of all programs at once
+  for prediction in receive_predictions_of_programs_new(benchmark_id, programs, sidx_to_fetch, aidx_to_fetch):
+    prediction_dummy[program_names[prediction.program_id]].append({'tokens': prediction.tokens, 'corrected': prediction.corrected, 'src': prediction.src_connections, 'grt': prediction.tgt_connections})
 
   sentences_json = json.dumps((sentence[0].src_tokens, sentence[0].grt_tokens, sentence[0].types, sentence[0].connections))
   predictions_json = json.dumps(prediction_dummy)
@@ -673,6 +799,7 @@ def get_sentences_and_prediction_for_idx(request):
 
   return JsonResponse(data)
 
+@query_budget(6)
 def get_sentences_and_prediction_for_program(request):
   # The benchmark id
   benchmark_id = request.GET.get('benchmark')
@@ -0,0 +1,187 @@
+'''
+Compact storage of the sentence and prediction tokens: every token text is stored once in the
+Token table, the sentences reference them by ID in packed integer arrays.
+'''
+
+import weakref
+import threading
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+
+# Byte order and width of all packed integer arrays
+PACKED_DTYPE = np.dtype('<i4')
+
+
+def pack_ints(values):
+  return np.asarray(values, dtype=PACKED_DTYPE).tobytes()
+
+def unpack_ints(data):
+  return np.frombuffer(bytes(data), dtype=PACKED_DTYPE).tolist()
+
+def pack_bools(values):
+  """
+  Packs a sequence of booleans into a bitmap, its length has to be known when unpacking.
+  """
+  return np.packbits(np.asarray(values, dtype=bool)).tobytes()
+
+def unpack_bools(data, length):
+  return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))[:length].astype(bool).tolist()
+
+def pack_connections(connections):
+  """
+  Packs the connections ``[(idx, [targets]), ...]`` of a sentence as one integer array
+  ``idx, number of targets, targets..., idx, ...``.
+  """
+  values = []
+  for idx, targets in connections:
+    values.append(int(idx))
+    values.append(len(targets))
+    values.extend(int(t) for t in targets)
+  return pack_ints(values)
+
+def unpack_connections(data):
+  values = unpack_ints(data)
+  connections = []
+  pos = 0
+  while pos < len(values):
+    num_targets = values[pos + 1]
+    connections.append((values[pos], values[pos + 2:pos + 2 + num_targets]))
+    pos += 2 + num_targets
+  return connections
+
+
+class PendingTokens(object):
+  """
+  Tokens added by a transaction that is not committed yet, see Vocabulary.
+  """
+
+  def __init__(self, pairs):
+    self.ids_by_text = {text: pk for pk, text in pairs}
+    self.texts_by_id = {pk: text for pk, text in pairs}
+
+
+class Vocabulary(object):
+  """
+  Maps token texts to the IDs of the Token table and back. The table only grows, so the
+  committed tokens are cached for the lifetime of the process, up to VOCABULARY_CACHE_SIZE of
+  them. The tokens a transaction adds are only seen by its thread until it commits: a rollback
+  removes them from the table, so they must not be cached.
+  """
+
+  def __init__(self):
+    self.ids_by_text = {}
+    self.texts_by_id = {}
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  def remember(self, pairs):
+    pairs = list(pairs)
+    with self.lock:
+      # Starts over when full, the tokens still in use are loaded again with a few queries
+      if len(self.texts_by_id) + len(pairs) > settings.VOCABULARY_CACHE_SIZE:
+        self.ids_by_text = {}
+        self.texts_by_id = {}
+      for pk, text in pairs:
+        self.ids_by_text[text] = pk
+        self.texts_by_id[pk] = text
+
+  def remember_on_commit(self, pairs):
+    """
+    Caches the tokens added by the current transaction once it is committed. Django drops the
+    commit callbacks of a transaction (or savepoint) that is rolled back, with them the last
+    reference to its PendingTokens, which ends their weak reference in ``pending``.
+    """
+    tokens = PendingTokens(pairs)
+    self.local.pending = getattr(self.local, 'pending', []) + [weakref.ref(tokens)]
+    transaction.on_commit(lambda: self.remember(tokens.texts_by_id.items()))
+
+  def pending(self):
+    """
+    Returns the PendingTokens of the open transactions of this thread.
+    """
+    refs = getattr(self.local, 'pending', None)
+    if not refs:
+      return []
+    pending = [tokens for tokens in (ref() for ref in refs) if tokens is not None]
+    self.local.pending = [weakref.ref(tokens) for tokens in pending]
+    return pending
+
+  def clear(self):
+    with self.lock:
+      self.ids_by_text = {}
+      self.texts_by_id = {}
+
+  def intern(self, texts):
+    """
+    Returns the IDs of ``texts``, adds the texts that are not in the vocabulary yet.
+    """
+    from .models import Token
+
+    # remember replaces a full cache by a new one, this one stays complete
+    ids_by_text = self.ids_by_text
+    ids = {}
+    missing = []
+    for text in set(texts):
+      if text not in ids_by_text:
+        missing.append(text)
+    if len(missing) > 0:
+      for tokens in self.pending():
+        ids.update((t, tokens.ids_by_text[t]) for t in missing if t in tokens.ids_by_text)
+      missing = [t for t in missing if t not in ids]
+    for start in range(0, len(missing), 1000):
+      chunk = missing[start:start + 1000]
+      existing = list(Token.objects.filter(text__in=chunk).values_list('pk', 'text'))
+      self.remember(existing)
+      ids.update((text, pk) for pk, text in existing)
+      new = [t for t in chunk if t not in ids]
+      if len(new) > 0:
+        # Concurrent ingests may add the same tokens, the unique constraint resolves that
+        Token.objects.bulk_create([Token(text=t) for t in new], ignore_conflicts=True, batch_size=1000)
+        added = list(Token.objects.filter(text__in=new).values_list('pk', 'text'))
+        self.remember_on_commit(added)
+        ids.update((text, pk) for pk, text in added)
+    return [ids_by_text[t] if t in ids_by_text else ids[t] for t in texts]
+
+  def load(self, ids, texts_by_id=None):
+    """
+    Fetches the texts of all ``ids`` that are not cached yet (not in ``texts_by_id``, the
+    cache by default) with as few queries as possible, returns them by ID.
+    """
+    from .models import Token
+
+    if texts_by_id is None:
+      texts_by_id = self.texts_by_id
+    missing = list(set(i for i in ids if i not in texts_by_id))
+    texts = {}
+    if len(missing) > 0:
+      for tokens in self.pending():
+        texts.update((i, tokens.texts_by_id[i]) for i in missing if i in tokens.texts_by_id)
+      missing = [i for i in missing if i not in texts]
+    for start in range(0, len(missing), 1000):
+      # Only committed tokens or pending ones of this thread can be read
+      pairs = list(Token.objects.filter(pk__in=missing[start:start + 1000]).values_list('pk', 'text'))
+      self.remember(pairs)
+      texts.update(pairs)
+    return texts
+
+  def texts(self, ids):
+    # remember replaces a full cache by a new one, this one stays complete
+    texts_by_id = self.texts_by_id
+    loaded = self.load(ids, texts_by_id)
+    return [texts_by_id[i] if i in texts_by_id else loaded[i] for i in ids]
+
+
+VOCABULARY = Vocabulary()
+
+def preload_vocabulary(rows):
+  """
+  Loads the token texts of all ``rows`` (InternalSentenceInformation or
+  PredictedSentenceInformation) at once, so decoding them needs no further queries.
+  """
+  ids = []
+  for row in rows:
+    ids.extend(row.vocabulary_ids())
+  VOCABULARY.load(ids)
+  return rows
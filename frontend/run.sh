@@ -9,4 +9,7 @@ echo "from django.contrib.auth.models import User; User.objects.create_superuser
 python3 manage.py loaddata fixtures/startup.json
 #export LD_PRELOAD="/usr/lib/x86_64-linux-gnu/libtcmalloc_minimal.so.4"
 
+python3 manage.py engine_server &
+python3 manage.py collect_result_versions --loop &
+
 python3 manage.py runserver 0.0.0.0:8000